@@ -0,0 +1,22 @@
+"""
+Entry point สำหรับ production: gunicorn app:server (ตั้งค่าใน gunicorn.conf.py)
+
+เมื่อ gunicorn ใช้ preload_app ไฟล์นี้ถูก import ใน process หลักครั้งเดียวก่อน fork:
+- ปิด GC ระหว่างโหลด เพื่อไม่ให้เกิดช่องว่างของ object ที่ถูกเก็บกวาดกระจายอยู่ในหน้าหน่วยความจำ
+- โหลดข้อมูล index cube และแผนที่ทั้งหมด (warm_shared_caches)
+- gc.freeze() ย้าย object ทั้งหมดไปไว้ใน generation ถาวร GC ของ worker จึงไม่เขียนทับหน้าเหล่านี้
+worker ทุกตัวจึงใช้หน้าหน่วยความจำของข้อมูลร่วมกันแบบ copy-on-write
+"""
+import gc
+
+gc.disable()
+
+import drowning_case
+from drowning_case import app, server
+
+drowning_case.warm_shared_caches()
+
+gc.collect()
+gc.freeze()
+gc.enable()
+print(f"พร้อมให้บริการ: freeze {gc.get_freeze_count():,} objects (ข้อมูลเวอร์ชัน {drowning_case.DATA_VERSION})")
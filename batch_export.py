@@ -0,0 +1,252 @@
+"""
+Export แผนที่ของแดชบอร์ดเป็นชุดจาก command line (เช่น ทุกจังหวัด × ทุกปี)
+
+ตัวอย่าง:
+    python batch_export.py --province all --year all --maps heatmap,companion --out exports
+    python batch_export.py --tab death_cert --province all --maps heatmap,choropleth --format svg
+    python batch_export.py --filters-file jobs.json
+
+- สร้าง figure ของแต่ละชุดตัวกรองใน process pool (fork จาก process หลักที่โหลดข้อมูลไว้แล้ว)
+- render ทุกไฟล์ใน process หลักด้วย renderer ชุดเดียว (kaleido สำหรับ Plotly, Chrome จาก pool สำหรับ Folium)
+- เขียน manifest.json ที่มีรายการไฟล์ ตัวกรอง และ sha256 ของแต่ละไฟล์
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import plotly.io as pio
+
+TABS = {'drowning': 'drowning-tab', 'death_cert': 'death-cert-tab'}
+FILTER_KEYS = ('province', 'zone', 'month', 'year', 'age')
+FILTER_COLUMNS = {'province': 'จังหวัด', 'zone': 'เขต', 'month': 'เดือน', 'year': 'ปี'}
+PLOTLY_MAPS = ('heatmap', 'companion')
+MAP_SIZES = {'heatmap': (1400, 800), 'companion': (1400, 700)}  # ขนาดเดียวกับปุ่ม Export ในแดชบอร์ด
+
+dc = None
+
+def load_dashboard(quiet=True):
+    """import drowning_case แล้วโหลดข้อมูล/index/cube (ครั้งเดียวต่อ process ไม่ว่า STARTUP_MODE จะเป็นแบบใด)"""
+    global dc
+    if dc is None:
+        output = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(output):
+            import drowning_case
+            drowning_case.ensure_data_loaded()
+        dc = drowning_case
+    return dc
+
+def parse_value(key, value):
+    value = value.strip()
+    # ปีและเดือนในข้อมูลเป็นตัวเลข ('3' จะไม่ตรงกับเดือน 3)
+    if key in ('year', 'month') and value.lstrip('-').isdigit():
+        return int(value)
+    return value
+
+def available_values(tab, key):
+    """ค่าทั้งหมดของตัวกรองในข้อมูลของ Tab นั้น (ใช้กับ --<ตัวกรอง> all)"""
+    if key == 'age':
+        return list(dc.AGE_GROUPS)
+    frame = dc.df_death_cert if tab == 'death_cert' else dc.df
+    column = FILTER_COLUMNS[key]
+    if column not in frame.columns:
+        return [None]
+    values = frame[column].dropna().unique().tolist()
+    if key == 'zone':
+        return dc.sort_zones_numerically([str(v) for v in values])
+    values = [int(v) if key == 'year' else v for v in values]
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=str)
+
+def expand_jobs(args):
+    """รายการชุดตัวกรอง จาก --filters-file หรือ cartesian product ของตัวกรองที่ระบุ"""
+    if args.filters_file:
+        with open(args.filters_file, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        return [{'tab': entry.get('tab', args.tab),
+                 **{key: parse_value(key, entry[key]) if isinstance(entry.get(key), str) else entry.get(key)
+                    for key in FILTER_KEYS}}
+                for entry in entries]
+    
+    choices = []
+    for key in FILTER_KEYS:
+        raw = getattr(args, key)
+        if raw is None:
+            choices.append([None])
+        elif raw == 'all':
+            choices.append(available_values(args.tab, key))
+        else:
+            choices.append([parse_value(key, value) for value in raw.split(',')])
+    return [{'tab': args.tab, **dict(zip(FILTER_KEYS, combo))} for combo in itertools.product(*choices)]
+
+def unknown_filter_values(jobs):
+    """ค่าตัวกรองที่ไม่มีในข้อมูลของ Tab นั้น [(tab, ตัวกรอง, ค่า), ...] (กรองแล้วได้ผลว่างเสมอ จึงถือเป็นข้อผิดพลาด)"""
+    known = {}
+    unknown = []
+    for job in jobs:
+        for key in FILTER_KEYS:
+            value = job.get(key)
+            if value is None or value == 'ALL':
+                continue
+            if (job['tab'], key) not in known:
+                known[(job['tab'], key)] = set(available_values(job['tab'], key))
+            values = known[(job['tab'], key)]
+            # ข้อมูลไม่มีคอลัมน์นี้ (ตัวกรองไม่มีผล) หรือมีค่านี้
+            if None in values or value in values:
+                continue
+            if (job['tab'], key, value) not in unknown:
+                unknown.append((job['tab'], key, value))
+    return unknown
+
+def build_job_figures(job, maps, map_type, render):
+    """สร้าง figure (JSON) ของชุดตัวกรองหนึ่งชุด - รันใน process pool"""
+    load_dashboard()
+    tab = TABS[job['tab']]
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = dc.build_filter_state(tab, job['province'], None, None, job['zone'],
+                                      job['province'], None, job['zone'],
+                                      job['month'], job['year'], job['age'])
+        selection = dc.get_selection(state['tab'], state['criteria'])
+        figures = {}
+        if selection.has_data:
+            if 'heatmap' in maps:
+                figures['heatmap'] = dc.create_shapefile_heatmap(selection.cells, map_type,
+                                                                 data_type=job['tab'], render=render)
+            if 'companion' in maps and job['tab'] == 'drowning':
+                figures['companion'] = dc.build_companion_outputs(selection.frame, 'all')[1]
+    return job, {name: fig.to_json() for name, fig in figures.items()}
+
+def output_name(map_name, job, fmt):
+    parts = [f"{key}-{job[key]}" for key in FILTER_KEYS if job.get(key) not in (None, 'ALL')]
+    slug = '_'.join(parts) or 'all'
+    for char in '/\\:*?"<>| ':
+        slug = slug.replace(char, '-')
+    return f"{map_name}_{job['tab']}_{slug}.{fmt}"
+
+def write_output(out_dir, filename, data, entry, manifest):
+    with open(os.path.join(out_dir, filename), 'wb') as f:
+        f.write(data)
+    manifest['files'].append({
+        'file': filename,
+        **entry,
+        'bytes': len(data),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    })
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export แผนที่ของแดชบอร์ดการจมน้ำเป็นชุด")
+    parser.add_argument('--tab', choices=sorted(TABS), default='drowning', help="ชุดข้อมูล (ค่าเริ่มต้น: drowning)")
+    for key in FILTER_KEYS:
+        parser.add_argument(f'--{key}', help="ค่าคั่นด้วย , หรือ all = ทุกค่าในข้อมูล (ไม่ระบุ = ทั้งหมดรวมกัน)")
+    parser.add_argument('--filters-file', help="ไฟล์ JSON รายการชุดตัวกรอง เช่น [{\"province\": \"ขอนแก่น\", \"year\": 2566}]")
+    parser.add_argument('--maps', default='heatmap', help="heatmap, companion, choropleth คั่นด้วย , (ค่าเริ่มต้น: heatmap)")
+    parser.add_argument('--map-type', default='deceased_rate',
+                        choices=['deceased_rate', 'injured_rate', 'not_injured_rate'])
+    parser.add_argument('--render', default='points', help="รูปแบบ Heatmap: points, raster หรือ hex")
+    parser.add_argument('--format', default='png', choices=['png', 'svg'], help="แผนที่ Folium (choropleth) เป็น PNG เสมอ")
+    parser.add_argument('--scale', type=float, default=2)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument('--out', default='exports')
+    parser.add_argument('--verbose', action='store_true', help="แสดง log ตอนโหลดข้อมูล")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    maps = [name.strip() for name in args.maps.split(',') if name.strip()]
+    start = time.perf_counter()
+    
+    load_dashboard(quiet=not args.verbose)
+    print(f"โหลดข้อมูลใช้เวลา {time.perf_counter() - start:.1f} วินาที")
+    
+    jobs = expand_jobs(args)
+    unknown = unknown_filter_values(jobs)
+    if unknown:
+        for tab, key, value in unknown:
+            print(f"❌ ไม่มี {key} = {value!r} ในข้อมูล {tab}")
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'data_version': dc.DATA_VERSION,
+        'options': {'maps': maps, 'map_type': args.map_type, 'render': args.render,
+                    'format': args.format, 'scale': args.scale},
+        'files': [],
+        'skipped': [],
+    }
+    failed = 0
+    
+    # Choropleth ไม่ขึ้นกับตัวกรอง: export ครั้งเดียวต่อชุดข้อมูล
+    if 'choropleth' in maps:
+        for data_type in sorted({job['tab'] for job in jobs}):
+            filename = f"choropleth_{data_type}.png"
+            try:
+                png_data = dc.render_html_to_png(dc.get_map_html(data_type))
+                write_output(args.out, filename, png_data, {'map': 'choropleth', 'tab': data_type}, manifest)
+                print(f"✅ {filename}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ {filename}: {e}")
+    
+    plotly_maps = [name for name in maps if name in PLOTLY_MAPS]
+    if plotly_maps and jobs:
+        # fork ใช้ข้อมูลที่โหลดแล้วร่วมกับ process หลัก (ระบบที่ไม่มี fork จะ import ใหม่ใน initializer)
+        context = (multiprocessing.get_context('fork')
+                   if 'fork' in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=context,
+                                 initializer=load_dashboard) as pool:
+            futures = {pool.submit(build_job_figures, job, plotly_maps, args.map_type, args.render): job
+                       for job in jobs}
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                filters = {key: job[key] for key in FILTER_KEYS if job.get(key) is not None}
+                try:
+                    job, figures = future.result()
+                except Exception as e:
+                    failed += 1
+                    figures = {}
+                    print(f"❌ {job['tab']} {filters}: {e}")
+                    manifest['skipped'].append({'tab': job['tab'], 'filters': filters, 'reason': str(e)})
+                else:
+                    if not figures:
+                        manifest['skipped'].append({'tab': job['tab'], 'filters': filters, 'reason': 'ไม่มีข้อมูล'})
+                
+                for map_name, fig_json in figures.items():
+                    filename = output_name(map_name, job, args.format)
+                    width, height = MAP_SIZES[map_name]
+                    try:
+                        # figure ผ่านการ validate ตอนสร้างใน worker แล้ว
+                        data = pio.to_image(json.loads(fig_json), format=args.format, validate=False,
+                                            width=width, height=height, scale=args.scale)
+                    except Exception as e:
+                        failed += 1
+                        print(f"❌ {filename}: {e}")
+                        manifest['skipped'].append({'tab': job['tab'], 'filters': filters, 'reason': str(e)})
+                        continue
+                    write_output(args.out, filename, data,
+                                 {'map': map_name, 'tab': job['tab'], 'filters': filters}, manifest)
+                
+                if done % 20 == 0 or done == len(futures):
+                    print(f"  {done}/{len(futures)} ชุดตัวกรอง ({time.perf_counter() - start:.0f} วินาที)")
+    
+    manifest['files'].sort(key=lambda entry: entry['file'])
+    manifest['elapsed_seconds'] = round(time.perf_counter() - start, 1)
+    manifest['failed'] = failed
+    with open(os.path.join(args.out, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    
+    dc.EXPORT_BROWSER_POOL.close()
+    print(f"{'❌' if failed else '✅'} Export {len(manifest['files'])} ไฟล์ ข้าม {len(manifest['skipped'])} ชุด "
+          f"ล้มเหลว {failed} รายการ ใช้เวลา {manifest['elapsed_seconds']} วินาที → {args.out}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
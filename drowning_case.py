@@ -1,33 +1,55 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # เวลาเริ่ม import โมดูล (ใช้รายงานเวลาเริ่มระบบ)
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output, State, callback_context
+from dash import Dash, html, dcc, Input, Output, State, callback_context, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from datetime import datetime
 import json
-import folium
-from folium.plugins import HeatMap
-from branca.element import Element
 import base64
 from io import BytesIO
 import numpy as np
 import os
-import plotly.io as pio
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-import time
-import os
+import importlib.util
+import plotly.colors as pcolors
+import hashlib
+import hmac
+import threading
+import pickle
+import uuid
+import atexit
+import tempfile
+import struct
+import zlib
+import difflib
+import unicodedata
+from collections import OrderedDict, Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from flask import jsonify, Response, abort, request, has_request_context, g
+from urllib.parse import urlparse
 
-# ลองโหลด geopandas (ถ้ามี)
-try:
-    import geopandas as gpd
-    HAS_GEOPANDAS = True
-except ImportError:
-    HAS_GEOPANDAS = False
+# ตรวจว่ามี geopandas หรือไม่ (import จริงตอนโหลด Shapefile ใน load_dashboard_data)
+# folium, plotly.express, plotly.io และ selenium ก็ import ในฟังก์ชันที่ใช้ เพื่อให้เริ่มระบบได้เร็ว
+gpd = None
+shapely = None
+HAS_GEOPANDAS = importlib.util.find_spec('geopandas') is not None
+if not HAS_GEOPANDAS:
     print("ไม่พบ geopandas - จะใช้ CircleMarker แทน Shapefile")
 
+def import_geopandas():
+    """import geopandas และ shapely เข้าตัวแปรของโมดูล (ครั้งแรกที่ต้องใช้)"""
+    global gpd, shapely, HAS_GEOPANDAS
+    if HAS_GEOPANDAS and gpd is None:
+        try:
+            import geopandas as gpd
+            import shapely
+        except ImportError as e:
+            HAS_GEOPANDAS = False
+            print(f"ไม่สามารถโหลด geopandas: {e} - จะใช้ CircleMarker แทน Shapefile")
+
 # สร้าง Dash app
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
@@ -54,11 +76,11 @@ def load_logo_base64(filepath):
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = BASE_DIR
 
-# โหลดโลโก้
+# โหลดโลโก้ (ใน load_dashboard_data)
 LOGO_GD_PATH = os.path.join(DATA_DIR, "kk.png")
 LOGO_KK_PATH = os.path.join(DATA_DIR, "gd.png")
-LOGO_GD_BASE64 = load_logo_base64(LOGO_GD_PATH)
-LOGO_KK_BASE64 = load_logo_base64(LOGO_KK_PATH)
+LOGO_GD_BASE64 = None
+LOGO_KK_BASE64 = None
 
 # =============== กำหนดชื่อคอลัมน์ ===============
 COLUMN_MAPPING = {
@@ -122,52 +144,497 @@ def sort_zones_numerically(zones):
     valid_zones = [z for z in zones if str(z) != 'nan' and str(z).strip() != '']
     return sorted(valid_zones, key=extract_number)
 
-# =============== โหลด Shapefile สำหรับข้อมูลการจมน้ำ (ระดับตำบล) ===============
-gdf_drowning = None
-HAS_DROWNING_SHAPEFILE = False
+# =============== ลายเซ็นไฟล์ (path, mtime, size) สำหรับตรวจว่าไฟล์เปลี่ยนหรือไม่ ===============
+def get_file_signature(filepath):
+    """คืนค่า (path, mtime_ns, size) ของไฟล์ หรือ None ถ้าไม่พบไฟล์"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+
+def get_shapefile_signature(shp_path):
+    """ลายเซ็นของ Shapefile รวม .shp (รูปทรง) และ .dbf (attribute เช่น 'สรุ')"""
+    base = os.path.splitext(shp_path)[0]
+    return (get_file_signature(base + '.shp'), get_file_signature(base + '.dbf'))
 
-if HAS_GEOPANDAS:
+DROWNING_SHAPEFILE_PATH = os.path.join(DATA_DIR, "case_drowning.shp")
+DEATH_SHAPEFILE_PATH = os.path.join(DATA_DIR, "case_death.shp")
+
+# =============== โหลด Shapefile (อ่านไฟล์ใน load_dashboard_data) ===============
+def load_shapefile(shp_path, label):
+    """อ่าน Shapefile เป็น GeoDataFrame (EPSG:4326) คืนค่า None ถ้าอ่านไม่ได้"""
+    import_geopandas()
+    if not HAS_GEOPANDAS:
+        return None
     try:
-        gdf_drowning = gpd.read_file(os.path.join(DATA_DIR, "case_drowning.shp"), encoding='utf-8')
-        print(f"โหลด Shapefile การจมน้ำสำเร็จ: {len(gdf_drowning)} polygons")
-        print(f"คอลัมน์ใน Shapefile การจมน้ำ: {gdf_drowning.columns.tolist()}")
-        
-        if gdf_drowning.crs is None:
-            gdf_drowning.set_crs(epsg=4326, inplace=True)
-        elif gdf_drowning.crs.to_epsg() != 4326:
-            gdf_drowning = gdf_drowning.to_crs(epsg=4326)
+        gdf = gpd.read_file(shp_path, encoding='utf-8')
+        print(f"โหลด Shapefile {label}สำเร็จ: {len(gdf)} polygons")
+        print(f"คอลัมน์ใน Shapefile {label}: {gdf.columns.tolist()}")
         
-        HAS_DROWNING_SHAPEFILE = True
+        if gdf.crs is None:
+            gdf.set_crs(epsg=4326, inplace=True)
+        elif gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
+        return gdf
     except Exception as e:
-        print(f"ไม่สามารถโหลด Shapefile การจมน้ำ: {e}")
+        print(f"ไม่สามารถโหลด Shapefile {label}: {e}")
+        return None
+
+# ลายเซ็นคำนวณทันที (แค่ stat ไฟล์) เพราะใช้เป็นเวอร์ชันของแคชตั้งแต่ตอน import
+# ข้อมูลการจมน้ำ (ระดับตำบล)
+gdf_drowning = None
+HAS_DROWNING_SHAPEFILE = False
+DROWNING_SHAPEFILE_SIGNATURE = get_shapefile_signature(DROWNING_SHAPEFILE_PATH) if HAS_GEOPANDAS else None
 
-# =============== โหลด Shapefile สำหรับข้อมูลมรณบัตร (ระดับอำเภอ) ===============
+# ข้อมูลมรณบัตร (ระดับอำเภอ)
 gdf_death = None
 HAS_DEATH_SHAPEFILE = False
+DEATH_SHAPEFILE_SIGNATURE = get_shapefile_signature(DEATH_SHAPEFILE_PATH) if HAS_GEOPANDAS else None
 
-if HAS_GEOPANDAS:
-    try:
-        gdf_death = gpd.read_file(os.path.join(DATA_DIR, "case_death.shp"), encoding='utf-8')
-        print(f"โหลด Shapefile มรณบัตรสำเร็จ: {len(gdf_death)} polygons")
-        print(f"คอลัมน์ใน Shapefile มรณบัตร: {gdf_death.columns.tolist()}")
+# =============== ลดความละเอียด Geometry (Simplify + ปัดพิกัด) สำหรับแผนที่ ===============
+# tolerance (หน่วยองศา) ตามระดับ zoom ของแผนที่ ยิ่ง zoom ต่ำยิ่งลดรายละเอียดได้มาก
+SIMPLIFY_TOLERANCE_BY_ZOOM = {
+    6: 0.005,
+    8: 0.002,
+    10: 0.0005,
+}
+COORDINATE_PRECISION = 5  # ทศนิยม 5 ตำแหน่ง (~1 เมตร)
+CHOROPLETH_ZOOM = 6
+
+_simplified_gdf_cache = {}
+
+def simplify_geometries(gdf, tolerance, precision=COORDINATE_PRECISION):
+    """
+    Simplify polygon ทั้งชุดพร้อมกันโดยรักษาขอบที่ใช้ร่วมกันระหว่างพื้นที่ข้างเคียง
+    - ปัดพิกัดลง grid ตาม precision ก่อน เพื่อให้จุดบนขอบร่วมตรงกันพอดี
+    - ใช้ coverage simplify (shapely >= 2.1) ซึ่งลดจุดบนขอบร่วมแบบเดียวกันทั้งสองฝั่ง
+    """
+    result = gdf[gdf.geometry.notna()].copy()
+    geoms = shapely.set_precision(np.asarray(result.geometry.values), 10 ** -precision)
+    
+    if hasattr(shapely, 'coverage_simplify'):
+        geoms = shapely.coverage_simplify(geoms, tolerance)
+    else:
+        print("shapely < 2.1 ไม่มี coverage_simplify - ใช้ simplify แบบรายพื้นที่ (ขอบร่วมอาจไม่ตรงกันเล็กน้อย)")
+        geoms = shapely.simplify(geoms, tolerance, preserve_topology=True)
+    
+    result = result.set_geometry(gpd.GeoSeries(geoms, index=result.index, crs=gdf.crs))
+    return result[~result.geometry.is_empty]
+
+def get_simplified_gdf(data_type='drowning', zoom=CHOROPLETH_ZOOM):
+    """
+    คืนค่า GeoDataFrame ที่ลดความละเอียดแล้วสำหรับระดับ zoom ที่กำหนด
+    ไฟล์ที่ได้เก็บเป็น GeoJSON ข้างไฟล์ต้นฉบับ เช่น case_drowning.z6.<hash>.geojson
+    และสร้างใหม่เมื่อ Shapefile หรือค่า tolerance/precision เปลี่ยน
+    """
+    data = current_data()
+    if data_type == 'death_cert':
+        gdf, shp_path, signature = data.gdf_death, DEATH_SHAPEFILE_PATH, data.DEATH_SHAPEFILE_SIGNATURE
+    else:
+        gdf, shp_path, signature = data.gdf_drowning, DROWNING_SHAPEFILE_PATH, data.DROWNING_SHAPEFILE_SIGNATURE
+    
+    if gdf is None:
+        return None
+    
+    tolerance = SIMPLIFY_TOLERANCE_BY_ZOOM[zoom]
+    raw = json.dumps([signature, tolerance, COORDINATE_PRECISION], ensure_ascii=False)
+    key = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]
+    
+    cached = _simplified_gdf_cache.get((data_type, zoom))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    
+    base = os.path.splitext(shp_path)[0]
+    derived_path = f"{base}.z{zoom}.{key}.geojson"
+    simplified = None
+    
+    if os.path.exists(derived_path):
+        try:
+            simplified = gpd.read_file(derived_path)
+        except Exception as e:
+            print(f"ไม่สามารถอ่านไฟล์ {derived_path}: {e}")
+    
+    if simplified is None:
+        start = time.perf_counter()
+        simplified = simplify_geometries(gdf, tolerance)
+        print(f"Simplify {os.path.basename(shp_path)} ที่ zoom {zoom} "
+              f"(tolerance {tolerance}) ใช้เวลา {time.perf_counter() - start:.2f} วินาที")
         
-        if gdf_death.crs is None:
-            gdf_death.set_crs(epsg=4326, inplace=True)
-        elif gdf_death.crs.to_epsg() != 4326:
-            gdf_death = gdf_death.to_crs(epsg=4326)
+        try:
+            tmp_path = f"{derived_path}.{os.getpid()}.tmp"
+            simplified.to_file(tmp_path, driver='GeoJSON', COORDINATE_PRECISION=COORDINATE_PRECISION)
+            os.replace(tmp_path, derived_path)
+            
+            # ลบไฟล์ที่สร้างจาก Shapefile หรือค่าตั้งค่าเวอร์ชันเก่า
+            prefix = f"{os.path.basename(base)}.z{zoom}."
+            for name in os.listdir(os.path.dirname(derived_path)):
+                if name.startswith(prefix) and name.endswith('.geojson') and name != os.path.basename(derived_path):
+                    os.remove(os.path.join(os.path.dirname(derived_path), name))
+        except Exception as e:
+            print(f"ไม่สามารถบันทึกไฟล์ {derived_path}: {e}")
+    
+    _simplified_gdf_cache[(data_type, zoom)] = (key, simplified)
+    return simplified
+
+# =============== ที่เก็บข้อมูลแบบ Arrow IPC (memory-mapped) ===============
+# การอ่าน Excel (โดยเฉพาะ .xls ขนาดหลาย MB) ใช้เวลาหลายวินาทีทุกครั้งที่ worker เริ่มทำงาน
+# จึงเก็บข้อมูลหลัง normalize เป็นไฟล์ Arrow IPC แบบไม่บีบอัด แล้วเปิดด้วย memory map
+# ทุก process (gunicorn worker, batch_export.py, script วิเคราะห์) จึงใช้หน้าหน่วยความจำของไฟล์ชุดเดียวกันจาก page cache
+# ไฟล์ข้อมูลผูกกับ checksum ของไฟล์ Excel ต้นฉบับ เมื่อไฟล์ต้นฉบับเปลี่ยนจะอ่าน Excel ใหม่อัตโนมัติ
+# ไฟล์ <ชื่อ>.current ชี้ไปยังไฟล์ข้อมูลล่าสุด และเปลี่ยนด้วย os.replace (atomic) หลังเขียนไฟล์ข้อมูลใหม่เสร็จแล้วเท่านั้น
+# ระเบียนที่ ingest ภายหลังเก็บเป็นไฟล์ delta แยก (รายชื่ออยู่ใน .current ต่อจากไฟล์หลัก) ระเบียนที่ key ซ้ำใช้ค่าล่าสุด
+try:
+    import pyarrow
+    import pyarrow.ipc
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+    print("ไม่พบ pyarrow - จะอ่านไฟล์ Excel โดยตรงทุกครั้ง")
+
+try:
+    import fcntl  # ล็อกไฟล์ข้าม process (ไม่มีบน Windows)
+except ImportError:
+    fcntl = None
+
+DATA_CACHE_DIR = os.path.join(DATA_DIR, ".data_cache")
+DATA_CACHE_VERSION = 3  # เพิ่มเลขนี้เมื่อแก้ไขขั้นตอน normalize หรือรูปแบบไฟล์ เพื่อให้ไฟล์ข้อมูลเดิมหมดอายุ
+
+DROWNING_EXCEL_PATH = os.path.join(DATA_DIR, "Drowning_Report_สรุป.xlsx")
+DEATH_CERT_EXCEL_PATH = os.path.join(DATA_DIR, "Death_Certificate_สรุป.xls")
+
+# คอลัมน์ key ของระเบียน (1 แถวต่อผู้จมน้ำ 1 คน) ใช้ตัดระเบียนซ้ำตอน ingest
+# ข้อมูลมรณบัตรเป็นข้อมูลสรุปที่ไม่มี key จึง ingest ไม่ได้
+INGEST_KEYS = {'drowning': os.environ.get('INGEST_KEY_COLUMN', 'ลำดับ')}
+
+def get_file_checksum(filepath):
+    """คำนวณ SHA-256 ของไฟล์"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _make_arrow_compatible(frame):
+    """ปรับคอลัมน์ที่มีชนิดข้อมูลปนกัน (เช่น ตัวเลขปนข้อความ) ให้เขียนเป็น Arrow ได้"""
+    frame = frame.reset_index(drop=True)
+    frame.columns = [str(col) for col in frame.columns]
+    
+    for col in frame.columns:
+        if frame[col].dtype != object:
+            continue
+        inferred = pd.api.types.infer_dtype(frame[col], skipna=True)
+        if inferred == 'mixed-integer-float':
+            frame[col] = pd.to_numeric(frame[col], errors='coerce')
+        elif inferred.startswith('mixed'):
+            frame[col] = frame[col].where(frame[col].isna(), frame[col].astype(str))
+    
+    return frame
+
+def _data_file_path(cache_name, checksum):
+    return os.path.join(DATA_CACHE_DIR, f"{cache_name}_{checksum[:16]}_v{DATA_CACHE_VERSION}.arrow")
+
+def _current_pointer_path(cache_name):
+    return os.path.join(DATA_CACHE_DIR, f"{cache_name}.current")
+
+def _delta_file_path(cache_name):
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    return os.path.join(DATA_CACHE_DIR, f"{cache_name}_delta_{stamp}_{os.getpid()}_v{DATA_CACHE_VERSION}.arrow")
+
+def write_arrow_table(frame, path):
+    """เขียน DataFrame เป็นไฟล์ Arrow IPC แบบไม่บีบอัด (เขียนไฟล์ชั่วคราวแล้ว os.replace)"""
+    table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pyarrow.OSFile(tmp_path, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def open_arrow_table(path):
+    """
+    เปิดไฟล์ Arrow IPC ด้วย memory map แล้วแปลงเป็น DataFrame
+    - คอลัมน์ข้อความเป็น pd.ArrowDtype ที่อ้างอิงหน้าของไฟล์โดยตรง (zero-copy)
+    - คอลัมน์ตัวเลขที่ไม่มีค่าว่างก็อ้างอิงหน้าของไฟล์ (split_blocks) ส่วน categorical แปลงเป็นของ pandas
+    """
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')).read_all()
+    text_types = (pyarrow.string(), pyarrow.large_string())
+    frame = table.to_pandas(split_blocks=True,
+                            types_mapper=lambda arrow_type: pd.ArrowDtype(arrow_type) if arrow_type in text_types else None)
+    
+    # คอลัมน์ข้อความที่ใช้คำนวณด้วย .str และ np.select ใช้ object แบบเดิม
+    if COMPANION_COLUMN in frame.columns:
+        frame[COMPANION_COLUMN] = table.column(COMPANION_COLUMN).to_pandas()
+    return frame
+
+def read_current_pointer(cache_name):
+    """ข้อมูลในไฟล์ .current (ไฟล์ข้อมูลล่าสุด checksum ของต้นฉบับ จำนวนแถว) หรือ None"""
+    try:
+        with open(_current_pointer_path(cache_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def swap_current_pointer(cache_name, data_path, checksum, rows, deltas=()):
+    """
+    ชี้ .current ไปยังไฟล์ข้อมูลใหม่และไฟล์ delta ของไฟล์นั้น
+    (process ที่อ่าน .current จะเห็นชุดเดิมหรือชุดใหม่ทั้งชุดเท่านั้น) คืนค่า pointer ที่เขียน
+    """
+    pointer = {
+        'file': os.path.basename(data_path),
+        'deltas': list(deltas),
+        'source_checksum': checksum,
+        'rows': rows,
+        'version': DATA_CACHE_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+    }
+    pointer_path = _current_pointer_path(cache_name)
+    tmp_path = f"{pointer_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f, ensure_ascii=False)
+    os.replace(tmp_path, pointer_path)
+    return pointer
+
+def store_files_of(pointer):
+    """(ไฟล์หลัก, ไฟล์ delta ตามลำดับ) ของ pointer ใช้เทียบว่าข้อมูลที่โหลดไว้ตรงกับ .current หรือไม่"""
+    return pointer['file'], tuple(pointer.get('deltas', ()))
+
+_store_thread_lock = threading.Lock()
+
+@contextmanager
+def _store_lock(cache_name):
+    """ล็อกการแก้ไข .current ข้าม process (worker หลายตัวหรือ ingest.py พร้อมกัน) บน Windows ล็อกเฉพาะใน process"""
+    os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+    with _store_thread_lock, open(os.path.join(DATA_CACHE_DIR, f"{cache_name}.lock"), 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)  # ปลดล็อกเมื่อปิดไฟล์
+        yield
+
+def concat_frames(frames):
+    """ต่อ DataFrame ตามแถว โดยคอลัมน์ categorical ของทุกชุดใช้ category ร่วมกัน (ไม่กลายเป็น object)"""
+    frames = [frame.copy(deep=False) for frame in frames]
+    categorical = []
+    for frame in frames:
+        categorical += [col for col, dtype in frame.dtypes.items()
+                        if isinstance(dtype, pd.CategoricalDtype) and col not in categorical]
+    
+    for col in categorical:
+        current = next(frame[col].cat.categories for frame in frames
+                       if col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype))
+        known = set(current)
+        extra = []
+        for frame in frames:
+            if col not in frame.columns:
+                continue
+            values = (frame[col].cat.categories if isinstance(frame[col].dtype, pd.CategoricalDtype)
+                      else frame[col].dropna().unique())
+            extra += [value for value in values if value not in known]
+            known.update(values)
+        categories = current
+        if extra:
+            categories = _stable_categories(pd.Series(list(current) + extra), col)
         
-        HAS_DEATH_SHAPEFILE = True
+        for frame in frames:
+            if col not in frame.columns:
+                frame[col] = pd.Categorical.from_codes(np.full(len(frame), -1), categories=categories)
+            elif not (isinstance(frame[col].dtype, pd.CategoricalDtype)
+                      and frame[col].cat.categories.equals(pd.Index(categories))):
+                frame[col] = pd.Categorical(frame[col], categories=categories)
+    
+    return pd.concat(frames, ignore_index=True)
+
+def merge_delta_frames(base, deltas, key):
+    """ข้อมูลหลัก + delta ตามลำดับ: ระเบียนที่ key ซ้ำใช้ค่าจาก delta ล่าสุด (ต่อท้ายข้อมูลหลัก)"""
+    delta = concat_frames(deltas).drop_duplicates(key, keep='last')
+    if key in base.columns:
+        base = base[~base[key].isin(delta[key]).to_numpy()]
+    return concat_frames([base, delta])
+
+def open_pointer_table(cache_name, pointer):
+    """
+    DataFrame ของไฟล์หลักตาม pointer รวมกับไฟล์ delta ที่ ingest ภายหลัง
+    frame.attrs['store_files'] บอกชุดไฟล์ที่โหลดมา (ใช้ตรวจว่ามี delta ใหม่ที่ยังไม่ได้ใช้หรือไม่)
+    """
+    frame = open_arrow_table(os.path.join(DATA_CACHE_DIR, pointer['file']))
+    deltas = [open_arrow_table(os.path.join(DATA_CACHE_DIR, name)) for name in pointer.get('deltas', ())]
+    if deltas:
+        frame = merge_delta_frames(frame, deltas, INGEST_KEYS[cache_name])
+    frame.attrs['store_files'] = store_files_of(pointer)
+    return frame
+
+def open_current_table(cache_name):
+    """DataFrame ของข้อมูลล่าสุดตามไฟล์ .current (รวม delta) โดยไม่ต้องมีไฟล์ Excel (สำหรับ script วิเคราะห์) หรือ None"""
+    pointer = read_current_pointer(cache_name) if HAS_PYARROW else None
+    if pointer is None or pointer.get('version') != DATA_CACHE_VERSION:
+        return None
+    return open_pointer_table(cache_name, pointer)
+
+def remove_stale_data_files(cache_name, keep_names):
+    """ลบไฟล์ข้อมูลที่ .current ไม่ได้ชี้ถึงแล้ว (process ที่ยังเปิดไฟล์เก่าอยู่ใช้ต่อได้บน Linux ส่วน Windows จะลบในรอบถัดไป)"""
+    for name in os.listdir(DATA_CACHE_DIR):
+        # .feather มีไว้ลบแคชรูปแบบเดิม (ก่อนเปลี่ยนเป็น Arrow IPC) ที่ยังค้างอยู่ในเครื่องที่อัปเกรดมาเท่านั้น
+        if (name.startswith(f"{cache_name}_") and name.endswith(('.arrow', '.feather'))
+                and name not in keep_names):
+            try:
+                os.remove(os.path.join(DATA_CACHE_DIR, name))
+            except OSError:
+                pass
+
+def carry_over_deltas(cache_name, base, pointer):
+    """
+    ระเบียนที่ ingest ไว้กับไฟล์ Excel ชุดก่อนและยังไม่มีในไฟล์ชุดใหม่ เขียนเป็น delta ของชุดใหม่
+    (ระเบียนที่มีในไฟล์ใหม่แล้วใช้ค่าจากไฟล์ใหม่ เพราะไฟล์ Excel คือข้อมูลทั้งชุดที่ใหม่กว่า)
+    คืนค่า (รายชื่อไฟล์ delta, จำนวนระเบียน)
+    """
+    key = INGEST_KEYS.get(cache_name)
+    names = (pointer or {}).get('deltas') or []
+    if not names or key not in base.columns:
+        return [], 0
+    try:
+        delta = concat_frames([open_arrow_table(os.path.join(DATA_CACHE_DIR, name)) for name in names])
     except Exception as e:
-        print(f"ไม่สามารถโหลด Shapefile มรณบัตร: {e}")
+        print(f"ไม่สามารถอ่านไฟล์ delta เดิมของ {cache_name}: {e}")
+        return [], 0
+    
+    delta = delta.drop_duplicates(key, keep='last')
+    delta = delta[~delta[key].isin(base[key]).to_numpy()]
+    if len(delta) == 0:
+        return [], 0
+    path = _delta_file_path(cache_name)
+    write_arrow_table(_make_arrow_compatible(delta), path)
+    print(f"ย้ายระเบียนที่ ingest ไว้และยังไม่มีในไฟล์ใหม่ {len(delta):,} ระเบียน → {path}")
+    return [os.path.basename(path)], len(delta)
 
-# =============== โหลดข้อมูลการจมน้ำ ===============
-try:
-    df = pd.read_excel(os.path.join(DATA_DIR, "Drowning_Report_สรุป.xlsx"))
-    print("โหลดไฟล์ข้อมูลการจมน้ำสำเร็จ")
-    print(f"จำนวนแถว: {len(df)}")
-    print(f"คอลัมน์ดั้งเดิม: {df.columns.tolist()}")
+def use_data_file(cache_name, frame, data_path, checksum):
+    """
+    เริ่มใช้ไฟล์ข้อมูลของไฟล์ Excel ชุดนี้: ชี้ .current มาที่ไฟล์นี้ (พร้อม delta ที่ย้ายมาจากชุดก่อน)
+    แล้วลบไฟล์ที่ไม่ใช้แล้ว คืนค่า DataFrame ของข้อมูลตาม .current ใหม่
+    """
+    with _store_lock(cache_name):
+        pointer = read_current_pointer(cache_name)
+        if (pointer is not None and pointer.get('source_checksum') == checksum
+                and pointer.get('version') == DATA_CACHE_VERSION):
+            # process อื่นเพิ่งสลับมาใช้ไฟล์ชุดเดียวกัน
+            return open_pointer_table(cache_name, pointer)
+        
+        deltas, carried = carry_over_deltas(cache_name, frame, pointer)
+        pointer = swap_current_pointer(cache_name, data_path, checksum, len(frame) + carried, deltas)
+        remove_stale_data_files(cache_name, {os.path.basename(data_path), *deltas})
+    
+    if deltas:
+        return open_pointer_table(cache_name, pointer)
+    frame.attrs['store_files'] = store_files_of(pointer)
+    return frame
+
+def load_excel_with_cache(excel_path, normalize, cache_name):
+    """
+    อ่านไฟล์ Excel แล้ว normalize ด้วยฟังก์ชัน normalize
+    ถ้ามีไฟล์ Arrow ที่ตรงกับ checksum ของไฟล์ จะเปิดไฟล์นั้นแบบ memory map แทนการอ่าน Excel
+    (รวมกับระเบียนที่ ingest ภายหลังตาม .current) ถ้าไม่มีไฟล์ Excel จะใช้ข้อมูลล่าสุดตามไฟล์ .current
+    """
+    start = time.perf_counter()
+    if HAS_PYARROW and not os.path.exists(excel_path):
+        frame = open_current_table(cache_name)
+        if frame is not None:
+            print(f"ไม่พบ {os.path.basename(excel_path)} - ใช้ข้อมูล {cache_name} ล่าสุดจาก {DATA_CACHE_DIR}")
+            return frame
+    
+    checksum = get_file_checksum(excel_path)
+    data_path = _data_file_path(cache_name, checksum)
+    pointer = read_current_pointer(cache_name) if HAS_PYARROW else None
+    
+    if (pointer is not None and pointer.get('source_checksum') == checksum
+            and pointer.get('version') == DATA_CACHE_VERSION):
+        try:
+            frame = open_pointer_table(cache_name, pointer)
+            print(f"เปิด {cache_name} แบบ memory map ({time.perf_counter() - start:.3f} วินาที)")
+            return frame
+        except Exception as e:
+            print(f"ไม่สามารถเปิดไฟล์ข้อมูลตาม {_current_pointer_path(cache_name)}: {e}")
+    
+    if HAS_PYARROW and os.path.exists(data_path):
+        try:
+            frame = use_data_file(cache_name, open_arrow_table(data_path), data_path, checksum)
+            print(f"เปิด {cache_name} แบบ memory map ({time.perf_counter() - start:.3f} วินาที)")
+            return frame
+        except Exception as e:
+            print(f"ไม่สามารถเปิดไฟล์ข้อมูล {data_path}: {e}")
+    
+    frame = _make_arrow_compatible(normalize(pd.read_excel(excel_path)))
+    print(f"อ่าน Excel {os.path.basename(excel_path)} ({time.perf_counter() - start:.2f} วินาที)")
+    
+    if HAS_PYARROW:
+        try:
+            os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+            write_arrow_table(frame, data_path)
+            print(f"บันทึกข้อมูล {data_path}")
+            
+            # ใช้ไฟล์ที่เพิ่งเขียนแบบ memory map แทนสำเนาจาก Excel เพื่อใช้หน้าหน่วยความจำร่วมกับ process อื่น
+            frame = use_data_file(cache_name, open_arrow_table(data_path), data_path, checksum)
+        except Exception as e:
+            print(f"ไม่สามารถบันทึกข้อมูล {data_path}: {e}")
+    
+    return frame
+
+# =============== Schema ชนิดข้อมูลแบบกระชับ (categorical / integer ขนาดเล็ก) ===============
+# คอลัมน์ที่ใช้กรองและ groupby บ่อย แปลงเป็น categorical เพื่อลดหน่วยความจำและให้การเปรียบเทียบ == เร็วขึ้น
+CATEGORICAL_COLUMNS = ['จังหวัด', 'อำเภอ', 'ตำบล', 'เขต', 'เดือน', 'สถานะ']
+SMALL_NUMERIC_COLUMNS = ['ปี', 'อายุ']
+
+def _to_small_numeric(series):
+    """แปลงเป็นจำนวนเต็มขนาดเล็กที่สุดที่พอดีกับข้อมูล (ถ้ามีทศนิยมจะใช้ float32)"""
+    values = pd.to_numeric(series, errors='coerce')
+    non_null = values.dropna()
+    
+    if len(non_null) > 0 and not (non_null == non_null.round()).all():
+        return values.astype('float32')
+    
+    lo = non_null.min() if len(non_null) > 0 else 0
+    hi = non_null.max() if len(non_null) > 0 else 0
+    for dtype in ['int8', 'int16', 'int32']:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            break
+    else:
+        dtype = 'int64'
+    
+    # ใช้ nullable integer (Int16 ฯลฯ) เมื่อมีค่าว่าง
+    if values.isna().any():
+        return values.astype(dtype.capitalize())
+    return values.astype(dtype)
+
+def _stable_categories(series, col):
+    """ลำดับ category ที่คงที่: เรียงตามค่า (เขตเรียงตามตัวเลข)"""
+    values = series.dropna().unique().tolist()
+    if col == 'เขต':
+        ordered = sort_zones_numerically(values)
+        return ordered + sorted(v for v in values if v not in ordered)
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=str)
+
+def apply_compact_schema(frame, label):
+    """แปลงคอลัมน์มิติเป็น categorical และคอลัมน์ตัวเลขเป็น integer ขนาดเล็ก พร้อมรายงานหน่วยความจำ"""
+    before = frame.memory_usage(deep=True).sum()
+    
+    for col in CATEGORICAL_COLUMNS:
+        if col in frame.columns:
+            frame[col] = pd.Categorical(frame[col], categories=_stable_categories(frame[col], col))
+    
+    for col in SMALL_NUMERIC_COLUMNS:
+        if col in frame.columns:
+            frame[col] = _to_small_numeric(frame[col])
+    
+    after = frame.memory_usage(deep=True).sum()
+    print(f"หน่วยความจำ {label}: {before / 1e6:.2f} MB → {after / 1e6:.2f} MB")
+    return frame
+
+# =============== Normalize ข้อมูลการจมน้ำ ===============
+def normalize_drowning_frame(raw_df):
+    """Rename คอลัมน์ของข้อมูลการจมน้ำให้เป็นชื่อมาตรฐานที่ใช้ในแดชบอร์ด"""
+    print(f"จำนวนแถว: {len(raw_df)}")
+    print(f"คอลัมน์ดั้งเดิม: {raw_df.columns.tolist()}")
     
-    # Rename คอลัมน์
     rename_dict_thai = {
         'จังหวัดที่เกิดเหตุ': 'จังหวัด',
         'อำเภอที่เกิดเหตุ': 'อำเภอ',
@@ -180,31 +647,20 @@ try:
     }
     
     for old_name, new_name in rename_dict_thai.items():
-        if old_name in df.columns:
-            df.rename(columns={old_name: new_name}, inplace=True)
+        if old_name in raw_df.columns:
+            raw_df.rename(columns={old_name: new_name}, inplace=True)
             print(f"  Renamed: {old_name} → {new_name}")
     
-    if 'เขต' in df.columns:
-        df['เขต'] = df['เขต'].astype(str).str.strip()
-    
-    df['lat'] = df['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1] if x in PROVINCE_COORDS else None)
-    df['lon'] = df['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0] if x in PROVINCE_COORDS else None)
+    if 'เขต' in raw_df.columns:
+        raw_df['เขต'] = raw_df['เขต'].astype(str).str.strip()
     
-    print(f"คอลัมน์หลังแปลง: {df.columns.tolist()}")
-    
-except Exception as e:
-    print(f"Error โหลดข้อมูลการจมน้ำ: {e}")
-    import traceback
-    traceback.print_exc()
-    df = pd.DataFrame()
+    return apply_compact_schema(raw_df, 'ข้อมูลการจมน้ำ')
 
-# =============== โหลดข้อมูลมรณบัตร (ไฟล์แยก) ===============
-try:
-    df_death_cert = pd.read_excel(os.path.join(DATA_DIR, "Death_Certificate_สรุป.xls"))
-    print("=" * 50)
-    print("โหลดไฟล์ข้อมูลมรณบัตรสำเร็จ")
-    print(f"จำนวนแถว: {len(df_death_cert)}")
-    print(f"คอลัมน์ดั้งเดิม: {df_death_cert.columns.tolist()}")
+# =============== Normalize ข้อมูลมรณบัตร ===============
+def normalize_death_cert_frame(raw_df):
+    """Rename คอลัมน์ของข้อมูลมรณบัตรให้เป็นชื่อมาตรฐานเดียวกับข้อมูลการจมน้ำ"""
+    print(f"จำนวนแถว: {len(raw_df)}")
+    print(f"คอลัมน์ดั้งเดิม: {raw_df.columns.tolist()}")
     
     rename_mapping = {
         'จังหวัดที่เสียชีวิต': 'จังหวัด',
@@ -216,36 +672,1067 @@ try:
     }
     
     for old_name, new_name in rename_mapping.items():
-        if old_name in df_death_cert.columns:
-            df_death_cert.rename(columns={old_name: new_name}, inplace=True)
+        if old_name in raw_df.columns:
+            raw_df.rename(columns={old_name: new_name}, inplace=True)
             print(f"  Renamed: {old_name} → {new_name}")
     
-    for col in df_death_cert.columns:
+    for col in raw_df.columns:
         if 'สรุป' in str(col) or 'สรุ' in str(col):
-            df_death_cert.rename(columns={col: 'สรุป'}, inplace=True)
+            raw_df.rename(columns={col: 'สรุป'}, inplace=True)
             print(f"  Renamed: {col} → สรุป")
             break
     
-    df_death_cert['สถานะ'] = 'เสียชีวิต'
+    raw_df['สถานะ'] = 'เสียชีวิต'
+    
+    if 'เขต' in raw_df.columns:
+        raw_df['เขต'] = raw_df['เขต'].astype(str).str.strip()
+    
+    return apply_compact_schema(raw_df, 'ข้อมูลมรณบัตร')
+
+# =============== จัดกลุ่มผู้อยู่ด้วยและกลุ่มอายุ (คำนวณครั้งเดียวตอนโหลด) ===============
+COMPANION_COLUMN = 'ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร'
+
+def add_companion_groups(frame):
+    """เพิ่มคอลัมน์ 'กลุ่มผู้อยู่ด้วย' และ 'กลุ่มอายุ' ที่ใช้ในส่วนวิเคราะห์การอยู่กับใคร"""
+    if COMPANION_COLUMN in frame.columns:
+        values = frame[COMPANION_COLUMN]
+        text = values.astype(str).str.strip()
+        frame['กลุ่มผู้อยู่ด้วย'] = np.select(
+            [values.isna().to_numpy(),
+             text.str.contains('ผู้ปกครอง/ผู้ดูแลเด็ก', regex=False).to_numpy(),
+             (text == 'เพื่อน').to_numpy(),
+             (text == 'อยู่คนเดียว').to_numpy()],
+            ['ไม่ระบุ', 'ผู้ปกครอง', 'เพื่อน', 'อยู่เพียงลำพัง'],
+            default='อื่นๆ'
+        ).astype(object)
+    
+    if 'อายุ' in frame.columns:
+        ages = pd.to_numeric(frame['อายุ'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        frame['กลุ่มอายุ'] = np.where(ages < 15, 'ต่ำกว่า 15 ปี', '15 ปีขึ้นไป').astype(object)
+    
+    return frame
+
+# =============== โหลดข้อมูลการจมน้ำ ===============
+df = pd.DataFrame()  # โหลดใน load_dashboard_data
+DROWNING_STORE_FILES = None  # (ไฟล์หลัก, ไฟล์ delta) ในที่เก็บข้อมูลที่ df โหลดมา
+
+def prepare_drowning_frame(df):
+    """เพิ่มพิกัดจังหวัดและกลุ่มผู้อยู่ด้วย (ใช้กับข้อมูลทั้งชุดและระเบียนที่ ingest)"""
+    df['lat'] = df['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1] if x in PROVINCE_COORDS else None).astype(float)
+    df['lon'] = df['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0] if x in PROVINCE_COORDS else None).astype(float)
+    add_companion_groups(df)
+    return df
+
+def load_drowning_data():
+    """อ่านข้อมูลการจมน้ำ (จากที่เก็บข้อมูล Arrow IPC แบบ memory map) พร้อมพิกัดจังหวัดและกลุ่มผู้อยู่ด้วย"""
+    try:
+        df = load_excel_with_cache(DROWNING_EXCEL_PATH, normalize_drowning_frame, 'drowning')
+        print("โหลดไฟล์ข้อมูลการจมน้ำสำเร็จ")
+        print(f"จำนวนแถว: {len(df)}")
+        
+        prepare_drowning_frame(df)
+        
+        print(f"คอลัมน์หลังแปลง: {df.columns.tolist()}")
+        return df
+    
+    except Exception as e:
+        print(f"Error โหลดข้อมูลการจมน้ำ: {e}")
+        import traceback
+        traceback.print_exc()
+        return pd.DataFrame()
+
+# =============== โหลดข้อมูลมรณบัตร (ไฟล์แยก) ===============
+df_death_cert = pd.DataFrame()  # โหลดใน load_dashboard_data
+
+def load_death_cert_data():
+    """อ่านข้อมูลมรณบัตร (จากที่เก็บข้อมูล Arrow IPC แบบ memory map) พร้อมพิกัดจังหวัด"""
+    try:
+        print("=" * 50)
+        df_death_cert = load_excel_with_cache(DEATH_CERT_EXCEL_PATH, normalize_death_cert_frame, 'death_cert')
+        print("โหลดไฟล์ข้อมูลมรณบัตรสำเร็จ")
+        print(f"จำนวนแถว: {len(df_death_cert)}")
+        
+        if 'จังหวัด' in df_death_cert.columns:
+            df_death_cert['lat'] = df_death_cert['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1] if x in PROVINCE_COORDS else None).astype(float)
+            df_death_cert['lon'] = df_death_cert['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0] if x in PROVINCE_COORDS else None).astype(float)
+        
+        print("=" * 50)
+        return df_death_cert
+    
+    except Exception as e:
+        print(f"Error โหลดข้อมูลมรณบัตร: {e}")
+        import traceback
+        traceback.print_exc()
+        return pd.DataFrame()
+
+# =============== Normalize ชื่อพื้นที่ภาษาไทย ===============
+# ชื่อใน Excel และใน Shapefile เขียนต่างกันได้ เช่น "ต.บางรัก" / "ตำบล บางรัก" / "บางรัก"
+# หรือมีช่องว่างและอักขระความกว้างศูนย์ปนมา จึง normalize ก่อนนำไปจับคู่
+NAME_PREFIXES = [
+    ['จังหวัด', 'จ.'],
+    ['กิ่งอำเภอ', 'อำเภอ', 'เขต', 'อ.'],
+    ['ตำบล', 'แขวง', 'ต.'],
+]
+ZERO_WIDTH_CHARS = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff'), None)
+
+def normalize_thai_admin_name(name, prefixes=()):
+    """ชื่อพื้นที่แบบมาตรฐาน: NFC, ไม่มีช่องว่าง/อักขระความกว้างศูนย์ และตัดคำนำหน้า (ต./อ./จ. ฯลฯ)"""
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ''
+    text = unicodedata.normalize('NFC', str(name)).translate(ZERO_WIDTH_CHARS)
+    text = ''.join(text.split())
+    for prefix in prefixes:
+        if text.startswith(prefix) and len(text) > len(prefix):
+            return text[len(prefix):]
+    return text
+
+# =============== Index สำหรับจับคู่ชื่อแบบ fuzzy (bigram + SequenceMatcher) ===============
+NAME_MATCH_VERSION = 2  # 2: ชื่อที่ตรงกับหลายพื้นที่ถือว่าจับคู่ไม่ได้
+NAME_MATCH_THRESHOLD = 0.85  # ความคล้ายขั้นต่ำที่ถือว่าเป็นชื่อเดียวกัน (ชื่อสั้นที่อยู่ในชื่อยาวจะไม่ผ่าน)
+
+def _name_bigrams(name):
+    padded = f" {name} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+class FuzzyNameIndex:
+    """Inverted index ของ bigram → ชื่อ ใช้คัดชื่อที่ใกล้เคียงก่อนวัดความคล้ายด้วย SequenceMatcher"""
+    
+    def __init__(self, names):
+        self.names = sorted(set(names) - {''})
+        self.bigrams = {name: _name_bigrams(name) for name in self.names}
+        self.postings = defaultdict(list)
+        for name in self.names:
+            for gram in self.bigrams[name]:
+                self.postings[gram].append(name)
+    
+    def best(self, name, allowed=None):
+        """ชื่อที่คล้าย name มากที่สุด (ความคล้าย ≥ NAME_MATCH_THRESHOLD) หรือ None"""
+        if not name:
+            return None
+        grams = _name_bigrams(name)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self.postings.get(gram, ()):
+                shared[candidate] += 1
+        
+        best_name, best_score = None, NAME_MATCH_THRESHOLD
+        for candidate, count in shared.items():
+            if allowed is not None and candidate not in allowed:
+                continue
+            # Dice ของ bigram เป็นขอบบนคร่าวๆ ตัดชื่อที่ไม่มีทางผ่านเกณฑ์ก่อนวัดแบบละเอียด
+            if 2 * count / (len(grams) + len(self.bigrams[candidate])) < NAME_MATCH_THRESHOLD - 0.2:
+                continue
+            score = difflib.SequenceMatcher(None, name, candidate).ratio()
+            if score > best_score or (score == best_score and best_name is not None and candidate < best_name):
+                best_name, best_score = candidate, score
+        return best_name
+
+# =============== Gazetteer พิกัด centroid ของพื้นที่ (สร้างครั้งเดียวตอนโหลด) ===============
+# คำนวณ centroid ของทุก polygon ครั้งเดียว เก็บ key "จังหวัด_อำเภอ_ตำบล" → พิกัด ใน numpy array
+# ชื่อพื้นที่แต่ละชุดในข้อมูลถูกจับคู่กับ Shapefile ครั้งเดียวตอนโหลด (ชื่อตรง → ชื่อ normalize → fuzzy
+# ภายในจังหวัด/อำเภอเดียวกัน) ผลการจับคู่บันทึกไว้ใน DATA_CACHE_DIR และรายงานชื่อที่จับคู่ไม่ได้
+# ตอนคำขอ การหาพิกัดจึงเป็นการ lookup จาก dict ทั้งชุด
+DROWNING_GAZETTEER_COLUMNS = [
+    ['PRO_TH', 'PROVINCE', 'จังหวัด', 'PRO_NAME', 'NAME_1', 'PV_TH'],
+    ['อำเ', 'AMP_TH', 'AMPHOE', 'อำเภอ', 'AMP_NAME', 'NAME_2', 'AP_TH'],
+    ['ตำบ', 'TAM_TH', 'TAMBON', 'ตำบล', 'TAM_NAME', 'NAME_3', 'TB_TH'],
+]
+DEATH_GAZETTEER_COLUMNS = [
+    ['PRO_TH', 'PROVINCE', 'จังหวัด', 'PRO_NAME', 'NAME_1', 'PROV_NAM_T', 'PV_TH'],
+    ['อำเ', 'AMP_TH', 'AMPHOE', 'อำเภอ', 'AMP_NAME', 'NAME_2', 'DISTRICT', 'AP_TH'],
+]
+
+# พิกัดจังหวัด (ใช้เมื่อหาพื้นที่ใน Shapefile ไม่พบ)
+PROVINCE_COORD_TABLE = pd.DataFrame.from_dict(PROVINCE_COORDS, orient='index', columns=['lon', 'lat'])
+
+def find_name_column(columns, candidates):
+    """คอลัมน์ชื่อพื้นที่ใน Shapefile (ถ้าตรงหลายคอลัมน์ ใช้คอลัมน์สุดท้าย)"""
+    found = None
+    for col in columns:
+        if col in candidates:
+            found = col
+    return found
+
+class Gazetteer:
+    """ตารางพิกัด centroid ของพื้นที่จาก Shapefile พร้อมผลการจับคู่ชื่อจากข้อมูล"""
+    
+    def __init__(self, gdf, name_cols):
+        # name_cols: คอลัมน์ชื่อของแต่ละระดับจากใหญ่ไปเล็ก (None = ไม่มีใน Shapefile)
+        parts = [gdf[col].astype(str).str.strip() if col else pd.Series('', index=gdf.index)
+                 for col in name_cols]
+        keys = parts[0]
+        for part in parts[1:]:
+            keys = keys + '_' + part
+        
+        centroids = gdf.geometry.centroid
+        table = pd.DataFrame({
+            'key': keys.to_numpy(),
+            'lat': centroids.y.to_numpy(),
+            'lon': centroids.x.to_numpy(),
+        })
+        for level, part in enumerate(parts):
+            table[level] = part.to_numpy()
+        table = table[parts[-1].to_numpy() != '']
+        
+        # key ซ้ำ: ลำดับตามครั้งแรกที่พบ แต่ใช้พิกัดของครั้งสุดท้าย
+        first = table.drop_duplicates('key', keep='first')
+        coords = table.drop_duplicates('key', keep='last').set_index('key').loc[first['key']]
+        
+        self.keys = pd.Index(first['key'].to_numpy())
+        self.lat = coords['lat'].to_numpy(dtype=float)
+        self.lon = coords['lon'].to_numpy(dtype=float)
+        
+        # ชื่อ normalize ของแต่ละระดับ: ชื่อ → ตำแหน่งใน keys และ index สำหรับ fuzzy
+        self.has_level = [col is not None for col in name_cols]
+        self.level_names = []
+        self.positions_by_name = []
+        self.fuzzy = []
+        for level in range(len(name_cols)):
+            names = np.array([normalize_thai_admin_name(name, NAME_PREFIXES[level])
+                              for name in first[level]], dtype=object)
+            by_name = defaultdict(list)
+            for position, name in enumerate(names):
+                by_name[name].append(position)
+            self.level_names.append(names)
+            self.positions_by_name.append({name: np.array(pos) for name, pos in by_name.items()})
+            self.fuzzy.append(FuzzyNameIndex(names) if self.has_level[level] else None)
+        
+        self.matches = {}  # key จากข้อมูล ("จังหวัด_อำเภอ_ตำบล") → ตำแหน่งใน keys (-1 = ไม่พบ)
     
-    if 'เขต' in df_death_cert.columns:
-        df_death_cert['เขต'] = df_death_cert['เขต'].astype(str).str.strip()
+    def match(self, names):
+        """ตำแหน่งของพื้นที่ที่ตรงกับชื่อ (เรียงจากระดับใหญ่ไปเล็ก) หรือ -1 ถ้าไม่พบหรือตรงกับหลายพื้นที่"""
+        candidates = None  # None = ทุกพื้นที่
+        last_level = len(names) - 1
+        
+        for level, raw_name in enumerate(names):
+            if not self.has_level[level]:
+                continue
+            name = normalize_thai_admin_name(raw_name, NAME_PREFIXES[level])
+            
+            positions = self.positions_by_name[level].get(name)
+            if positions is not None and candidates is not None:
+                positions = np.intersect1d(positions, candidates)
+            
+            if positions is None or len(positions) == 0:
+                allowed = None if candidates is None else set(self.level_names[level][candidates])
+                best = self.fuzzy[level].best(name, allowed)
+                if best is not None:
+                    positions = self.positions_by_name[level][best]
+                    if candidates is not None:
+                        positions = np.intersect1d(positions, candidates)
+            
+            if positions is None or len(positions) == 0:
+                if level == last_level:
+                    return -1
+                continue  # ไม่รู้ระดับนี้ ให้ระดับถัดไปหาจากทุกพื้นที่ที่เหลือ
+            candidates = positions
+        
+        # ระดับบนที่ไม่รู้จักไม่ได้ช่วยจำกัดพื้นที่ ชื่อซ้ำกันหลายจังหวัด/อำเภอจึงไม่เลือกพื้นที่ใดพื้นที่หนึ่ง
+        return int(candidates[0]) if candidates is not None and len(candidates) == 1 else -1
     
-    if 'จังหวัด' in df_death_cert.columns:
-        df_death_cert['lat'] = df_death_cert['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1] if x in PROVINCE_COORDS else None)
-        df_death_cert['lon'] = df_death_cert['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0] if x in PROVINCE_COORDS else None)
+    def _data_keys(self, frame, key_cols):
+        keys = frame[key_cols[0]].astype(str)
+        for col in key_cols[1:]:
+            keys = keys + '_' + frame[col].astype(str)
+        return keys
     
-    print("=" * 50)
+    def prime(self, frame, key_cols, cache_name):
+        """
+        จับคู่ชื่อพื้นที่ทุกชุดที่มีใน frame ล่วงหน้า ใช้ผลเดิมจากไฟล์ถ้า Shapefile ไม่เปลี่ยน
+        แล้วบันทึกผลการจับคู่และรายงานชื่อที่จับคู่ไม่ได้ไว้ใน DATA_CACHE_DIR
+        """
+        start = time.perf_counter()
+        names = frame[key_cols].dropna().astype(str)
+        counts = names.value_counts(sort=False)
+        signature = hashlib.sha1(json.dumps(
+            [NAME_MATCH_VERSION, NAME_MATCH_THRESHOLD, self.keys.tolist()], ensure_ascii=False
+        ).encode('utf-8')).hexdigest()
+        path = os.path.join(DATA_CACHE_DIR, f"name_matches_{cache_name}.json")
+        
+        saved = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                if stored.get('signature') == signature:
+                    saved = {tuple(entry['names']): entry['match'] for entry in stored['matches']}
+            except (OSError, ValueError, KeyError) as e:
+                print(f"ไม่สามารถอ่านผลการจับคู่ชื่อ {path}: {e}")
+        
+        resolved = 0
+        for combo in counts.index:
+            key = '_'.join(combo)
+            if key in self.matches:
+                continue
+            if combo in saved:
+                matched = saved[combo]
+                self.matches[key] = self.keys.get_loc(matched) if matched in self.keys else -1
+            else:
+                self.matches[key] = self.match(combo)
+                resolved += 1
+        
+        entries = []
+        unmatched = []
+        for combo, count in counts.items():
+            position = self.matches['_'.join(combo)]
+            entries.append({'names': list(combo), 'match': self.keys[position] if position >= 0 else None})
+            if position < 0:
+                unmatched.append(list(combo) + [int(count)])
+        
+        try:
+            os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+            if resolved:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'signature': signature, 'matches': entries}, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            report_path = os.path.join(DATA_CACHE_DIR, f"unmatched_names_{cache_name}.csv")
+            pd.DataFrame(unmatched, columns=key_cols + ['จำนวนแถว']).to_csv(report_path, index=False, encoding='utf-8-sig')
+        except OSError as e:
+            print(f"ไม่สามารถบันทึกผลการจับคู่ชื่อ {path}: {e}")
+            report_path = None
+        
+        print(f"จับคู่ชื่อพื้นที่ {cache_name}: {len(counts):,} ชุด (ใหม่ {resolved:,}), "
+              f"จับคู่ไม่ได้ {len(unmatched):,} ชุด ({time.perf_counter() - start:.2f} วินาที)")
+        if unmatched and report_path:
+            print(f"  รายชื่อที่จับคู่ไม่ได้: {report_path}")
     
-except Exception as e:
-    print(f"Error โหลดข้อมูลมรณบัตร: {e}")
-    import traceback
-    traceback.print_exc()
-    df_death_cert = pd.DataFrame()
+    def locate(self, frame, key_cols, province_col='จังหวัด'):
+        """
+        คืนค่า (lat, lon) ของแต่ละแถวใน frame จากผลการจับคู่ชื่อ
+        ชื่อที่ไม่พบใน Shapefile ใช้พิกัดจังหวัดแทน (NaN ถ้าไม่รู้จักจังหวัด)
+        """
+        keys = self._data_keys(frame, key_cols)
+        positions = keys.map(self.matches)
+        
+        unseen = positions.isna().to_numpy()
+        if unseen.any():
+            # ชื่อที่ไม่มีตอนโหลด (เช่น ข้อมูลที่เพิ่มภายหลัง) จับคู่ครั้งเดียวแล้วเก็บไว้
+            for key, combo in zip(keys[unseen], frame.loc[unseen, key_cols].astype(str).itertuples(index=False)):
+                if key not in self.matches:
+                    self.matches[key] = self.match(tuple(combo))
+            positions = keys.map(self.matches)
+        positions = positions.to_numpy(dtype=np.int64)
+        
+        found = positions >= 0
+        lat = np.full(len(frame), np.nan)
+        lon = np.full(len(frame), np.nan)
+        lat[found] = self.lat[positions[found]]
+        lon[found] = self.lon[positions[found]]
+        
+        if not found.all():
+            province_coords = PROVINCE_COORD_TABLE.reindex(frame[province_col].to_numpy()[~found])
+            lat[~found] = province_coords['lat'].to_numpy(dtype=float)
+            lon[~found] = province_coords['lon'].to_numpy(dtype=float)
+        
+        return lat, lon
+
+def build_gazetteer(gdf, column_candidates, label):
+    """สร้าง Gazetteer ถ้า Shapefile มีคอลัมน์ชื่อพื้นที่ระดับเล็กสุด"""
+    if gdf is None:
+        return None
+    name_cols = [find_name_column(gdf.columns, candidates) for candidates in column_candidates]
+    if name_cols[-1] is None:
+        print(f"ไม่พบคอลัมน์ชื่อพื้นที่ใน Shapefile {label} - ใช้พิกัดจังหวัดแทน")
+        return None
+    try:
+        start = time.perf_counter()
+        gazetteer = Gazetteer(gdf, name_cols)
+        print(f"✅ สร้าง Gazetteer {label}: {len(gazetteer.keys):,} พื้นที่ ({time.perf_counter() - start:.2f} วินาที)")
+        return gazetteer
+    except Exception as e:
+        print(f"ไม่สามารถสร้าง Gazetteer {label}: {e}")
+        return None
+
+DROWNING_GAZETTEER = None  # สร้างใน load_dashboard_data
+DEATH_GAZETTEER = None
+
+# =============== Spatial Index (STRtree) ของ polygon ใน Shapefile ===============
+# สร้าง STRtree ของ polygon ครั้งเดียวต่อ GeoDataFrame แล้วใช้ร่วมกันทั้งแอพ
+# - หา polygon ที่จุดเกิดเหตุอยู่ (point-in-polygon) ของทุกแถวพร้อมกัน เมื่อข้อมูลมีคอลัมน์พิกัด
+# - หา polygon ที่อยู่ในกรอบแผนที่ (bbox) สำหรับคำขอตาม viewport ผ่าน /geojson/<data_type>
+# ผลลัพธ์เป็นลำดับแถวของ GeoDataFrame จึงใช้ต่อกับ attribute ของ Shapefile (Heatmap/Choropleth) ได้ทันที
+LATITUDE_COLUMNS = ['ละติจูด', 'Latitude', 'latitude', 'LATITUDE', 'LAT']
+LONGITUDE_COLUMNS = ['ลองจิจูด', 'Longitude', 'longitude', 'LONGITUDE', 'LON', 'LONG']
+POLYGON_COLUMN = 'ลำดับ polygon'  # แถวใน Shapefile ที่จุดเกิดเหตุอยู่ (-1 = ไม่มีพิกัด/อยู่นอกทุก polygon)
+
+class SpatialIndex:
+    """STRtree ของ polygon ใน GeoDataFrame"""
+    
+    def __init__(self, gdf):
+        self.gdf = gdf
+        self.geometries = np.asarray(gdf.geometry.values)
+        self.tree = shapely.STRtree(self.geometries)
+    
+    def locate_points(self, lon, lat):
+        """ลำดับ polygon ที่แต่ละจุดอยู่ (-1 ถ้าไม่มีพิกัดหรืออยู่นอกทุก polygon)"""
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        result = np.full(len(lon), -1, dtype=np.int64)
+        
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        if len(valid) == 0:
+            return result
+        
+        points = shapely.points(lon[valid], lat[valid])
+        point_idx, polygon_idx = self.tree.query(points, predicate='intersects')
+        
+        # จุดบนขอบร่วมของหลาย polygon ใช้ polygon ที่มาก่อนใน Shapefile
+        order = np.lexsort((polygon_idx, point_idx))
+        point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+        first = np.unique(point_idx, return_index=True)[1]
+        result[valid[point_idx[first]]] = polygon_idx[first]
+        return result
+    
+    def query_bbox(self, minx, miny, maxx, maxy):
+        """ลำดับ polygon (เรียงจากน้อยไปมาก) ที่ตัดกับกรอบ bbox"""
+        return np.sort(self.tree.query(shapely.box(minx, miny, maxx, maxy), predicate='intersects'))
+    
+    def count_points(self, positions):
+        """จำนวนจุดต่อ polygon จากผลของ locate_points (สำหรับสถิติรายพื้นที่)"""
+        positions = np.asarray(positions)
+        return np.bincount(positions[positions >= 0], minlength=len(self.geometries))
+
+_spatial_index_cache = {}
+
+def get_spatial_index(data_type='drowning', zoom=None, gdf=None):
+    """
+    SpatialIndex ของ Shapefile ตามประเภทข้อมูล (zoom=None = geometry เต็ม, ไม่งั้นใช้ geometry ที่ simplify แล้ว)
+    gdf: GeoDataFrame ชุดใหม่ที่ยังไม่ได้สลับเข้าใช้งาน (ตอนสร้างข้อมูลใหม่ระหว่าง reload)
+    """
+    if not HAS_GEOPANDAS:
+        return None
+    if gdf is not None:
+        pass
+    elif zoom is None:
+        data = current_data()
+        gdf = data.gdf_death if data_type == 'death_cert' else data.gdf_drowning
+    else:
+        gdf = get_simplified_gdf(data_type, zoom)
+    if gdf is None:
+        return None
+    
+    cached = _spatial_index_cache.get((data_type, zoom))
+    if cached is not None and cached.gdf is gdf:
+        return cached
+    
+    start = time.perf_counter()
+    spatial_index = SpatialIndex(gdf)
+    print(f"สร้าง STRtree {data_type} (zoom {zoom}): {len(gdf):,} polygons ({time.perf_counter() - start:.2f} วินาที)")
+    _spatial_index_cache[(data_type, zoom)] = spatial_index
+    return spatial_index
+
+@server.route('/geojson/<data_type>')
+def serve_geojson_bbox(data_type):
+    """
+    GeoJSON ของ polygon ที่อยู่ในกรอบแผนที่ เช่น /geojson/drowning?bbox=100,13,101,14&zoom=8
+    ใช้ geometry ที่ simplify แล้วตามระดับ zoom ที่ใกล้ที่สุด (ไม่เกิน zoom ที่ขอ)
+    """
+    if data_type not in ('drowning', 'death_cert'):
+        abort(404)
+    try:
+        minx, miny, maxx, maxy = [float(v) for v in request.args.get('bbox', '').split(',')]
+        zoom = int(request.args.get('zoom', CHOROPLETH_ZOOM))
+    except ValueError:
+        abort(400)
+    
+    zoom = max((z for z in SIMPLIFY_TOLERANCE_BY_ZOOM if z <= zoom), default=min(SIMPLIFY_TOLERANCE_BY_ZOOM))
+    spatial_index = get_spatial_index(data_type, zoom)
+    if spatial_index is None:
+        abort(404)
+    
+    subset = spatial_index.gdf.iloc[spatial_index.query_bbox(minx, miny, maxx, maxy)]
+    return Response(subset.to_json(), mimetype='application/geo+json')
+
+def assign_polygons_from_coordinates(frame, data_type, name_columns, label, gdf=None):
+    """
+    หา polygon ของแต่ละแถวจากคอลัมน์พิกัด (ถ้าข้อมูลมี) เก็บไว้ใน POLYGON_COLUMN
+    แถวที่มีพิกัดแต่ไม่มีชื่อพื้นที่ จะเติมชื่อจาก Shapefile ให้ ตัวกรองและ Heatmap จึงนับแถวนั้นได้
+    name_columns: [(คอลัมน์ในข้อมูล, ชื่อคอลัมน์ที่เป็นไปได้ใน Shapefile), ...]
+    gdf: Shapefile ที่ใช้ (ค่าเริ่มต้น = ชุดที่โหลดอยู่)
+    """
+    lat_col = find_name_column(frame.columns, LATITUDE_COLUMNS)
+    lon_col = find_name_column(frame.columns, LONGITUDE_COLUMNS)
+    if lat_col is None or lon_col is None:
+        return frame
+    spatial_index = get_spatial_index(data_type, gdf=gdf)
+    if spatial_index is None:
+        return frame
+    
+    start = time.perf_counter()
+    lat = pd.to_numeric(frame[lat_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    lon = pd.to_numeric(frame[lon_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    positions = spatial_index.locate_points(lon, lat)
+    frame[POLYGON_COLUMN] = positions.astype(np.int32)
+    found = positions >= 0
+    
+    for frame_col, candidates in name_columns:
+        gdf_col = find_name_column(spatial_index.gdf.columns, candidates)
+        if gdf_col is None or frame_col not in frame.columns:
+            continue
+        missing = found & frame[frame_col].isna().to_numpy()
+        if not missing.any():
+            continue
+        
+        names = spatial_index.gdf[gdf_col].astype(str).str.strip().to_numpy(dtype=object)
+        values = frame[frame_col].astype(object).to_numpy(copy=True)
+        values[missing] = names[positions[missing]]
+        filled = pd.Series(values, index=frame.index)
+        if isinstance(frame[frame_col].dtype, pd.CategoricalDtype):
+            filled = pd.Categorical(filled, categories=_stable_categories(filled, frame_col))
+        frame[frame_col] = filled
+        print(f"  เติม {frame_col} จากพิกัด: {missing.sum():,} แถว")
+    
+    print(f"หา polygon ของ{label}จากพิกัด: {found.sum():,}/{len(frame):,} แถว "
+          f"({time.perf_counter() - start:.2f} วินาที)")
+    return frame
+
+
+# =============== Inverted Index สำหรับตัวกรองของแดชบอร์ด ===============
+# แต่ละมิติของตัวกรองเก็บ "ค่า → เลขแถวที่มีค่านั้น (เรียงจากน้อยไปมาก)" ที่สร้างครั้งเดียวตอนโหลดข้อมูล
+# คำขอหนึ่งครั้งเริ่มจากรายการเลขแถวของมิติที่แคบที่สุด แล้วตัดด้วยรหัสค่าของมิติอื่น
+# จากนั้นดึงแถวจาก DataFrame เพียงครั้งเดียว แทนการสร้าง boolean mask และ DataFrame ใหม่ทีละขั้น
+FILTER_DIMENSIONS = {
+    'province': 'จังหวัด',
+    'district': 'อำเภอ',
+    'subdistrict': 'ตำบล',
+    'zone': 'เขต',
+    'month': 'เดือน',
+    'year': 'ปี',
+    'age': 'อายุ',
+}
+
+# กลุ่มอายุที่ใช้ใน dropdown อายุ (แถวที่ไม่มีอายุไม่อยู่ในกลุ่มใด)
+AGE_GROUPS = ['<15', '15+']
+
+class FilterIndex:
+    """Inverted index ของมิติตัวกรอง ใช้ร่วมกันทุก callback ที่ต้องกรองข้อมูล"""
+    
+    def __init__(self, frame, dimensions=FILTER_DIMENSIONS):
+        self.frame = frame
+        self.n_rows = len(frame)
+        self.codes = {}     # มิติ → รหัสค่าของแต่ละแถว (-1 = ไม่มีค่า)
+        self.lookup = {}    # มิติ → {ค่า: รหัส}
+        self.values = {}    # มิติ → รายการค่าเรียงตามรหัส
+        self.postings = {}  # มิติ → รายการเลขแถวของแต่ละรหัส
+        
+        for dim, col in dimensions.items():
+            if col not in frame.columns:
+                continue
+            
+            if dim == 'age' and pd.api.types.is_numeric_dtype(frame[col]):
+                codes = self._age_codes(frame[col])
+                values = list(AGE_GROUPS)
+            else:
+                codes, uniques = pd.factorize(frame[col], sort=True)
+                codes = codes.astype(np.int32)
+                values = list(uniques.tolist() if hasattr(uniques, 'tolist') else uniques)
+            
+            # argsort แบบ stable ทำให้เลขแถวในแต่ละรหัสเรียงจากน้อยไปมาก
+            order = np.argsort(codes, kind='stable').astype(np.int64)
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            
+            self.codes[dim] = codes
+            self.values[dim] = values
+            self.lookup[dim] = {value: code for code, value in enumerate(values)}
+            self.postings[dim] = [order[bounds[i]:bounds[i + 1]] for i in range(len(values))]
+    
+    @staticmethod
+    def _age_codes(series):
+        """รหัสกลุ่มอายุตาม AGE_GROUPS ของแต่ละแถว (-1 = ไม่มีอายุ)"""
+        ages = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        codes = np.full(len(ages), -1, dtype=np.int32)
+        codes[ages < 15] = 0
+        codes[ages >= 15] = 1
+        return codes
+    
+    @staticmethod
+    def _value_order(column, values):
+        """ลำดับรหัสเมื่อเรียงค่าแบบเดียวกับ pd.factorize(sort=True): categorical ตามลำดับ category นอกนั้นตามค่า"""
+        codes = range(len(values))
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            rank = {value: i for i, value in enumerate(column.cat.categories)}
+            return sorted(codes, key=lambda code: rank.get(values[code], len(rank)))
+        try:
+            return sorted(codes, key=lambda code: values[code])
+        except TypeError:
+            return sorted(codes, key=lambda code: str(values[code]))
+    
+    def updated(self, frame, removed, dimensions=FILTER_DIMENSIONS):
+        """
+        Index ของ frame ที่ได้จากการตัดแถว removed ออก (แถวที่เหลือเรียงตามเดิม) แล้วต่อแถวใหม่ไว้ท้าย
+        คำนวณรหัสเฉพาะแถวใหม่ แถวเดิมใช้รหัสเดิมแล้วเลื่อนเลขแถวตามจำนวนแถวที่ถูกตัดก่อนหน้า
+        """
+        keep = np.ones(self.n_rows, dtype=bool)
+        keep[removed] = False
+        shift = np.cumsum(~keep)
+        n_kept = self.n_rows - len(removed)
+        
+        index = FilterIndex.__new__(FilterIndex)
+        index.frame = frame
+        index.n_rows = len(frame)
+        index.codes, index.lookup, index.values, index.postings = {}, {}, {}, {}
+        
+        for dim, old_codes in self.codes.items():
+            column = frame[dimensions[dim]]
+            added = column.iloc[n_kept:]
+            values = list(self.values[dim])
+            lookup = dict(self.lookup[dim])
+            
+            if dim == 'age' and pd.api.types.is_numeric_dtype(column):
+                added_codes = self._age_codes(added)
+            else:
+                added_codes = np.full(len(added), -1, dtype=np.int32)
+                for i, value in enumerate(added.tolist()):
+                    if pd.isna(value):
+                        continue
+                    if value not in lookup:
+                        lookup[value] = len(values)
+                        values.append(value)
+                    added_codes[i] = lookup[value]
+            
+            postings = list(self.postings[dim])
+            if len(removed):
+                for code, rows in enumerate(postings):
+                    rows = rows[keep[rows]]
+                    postings[code] = rows - shift[rows]
+            postings += [np.empty(0, dtype=np.int64)] * (len(values) - len(postings))
+            
+            # แถวใหม่มีเลขแถวมากกว่าแถวเดิมทุกแถว ต่อท้ายรายการของรหัสนั้นแล้วยังเรียงอยู่
+            order = np.argsort(added_codes, kind='stable')
+            bounds = np.searchsorted(added_codes[order], np.arange(len(values) + 1))
+            for code in np.unique(added_codes[added_codes >= 0]):
+                postings[code] = np.concatenate([postings[code], order[bounds[code]:bounds[code + 1]] + n_kept])
+            codes = np.concatenate([old_codes[keep], added_codes])
+            
+            if len(values) > len(self.values[dim]):
+                # มีค่าใหม่: เรียงรหัสใหม่ให้เหมือนสร้าง index ทั้งชุด (distinct คืนค่าตามลำดับรหัส)
+                ranked = self._value_order(column, values)
+                remap = np.empty(len(values), dtype=np.int32)
+                remap[ranked] = np.arange(len(values), dtype=np.int32)
+                codes = np.where(codes >= 0, remap[codes], -1).astype(np.int32)
+                values = [values[code] for code in ranked]
+                postings = [postings[code] for code in ranked]
+                lookup = {value: code for code, value in enumerate(values)}
+            
+            index.codes[dim] = codes
+            index.values[dim] = values
+            index.lookup[dim] = lookup
+            index.postings[dim] = postings
+        
+        return index
+    
+    @staticmethod
+    def _normalize_value(dim, value):
+        if dim == 'zone':
+            return str(value).strip()
+        return value
+    
+    def select(self, **criteria):
+        """
+        คืนค่าเลขแถวที่ตรงกับเงื่อนไขทุกมิติ (ค่า 'ALL' หรือ None = ไม่กรองมิตินั้น)
+        คืนค่า None เมื่อไม่มีเงื่อนไขใดเลย หมายถึงทุกแถว
+        """
+        terms = []
+        for dim, value in criteria.items():
+            if value is None or value == 'ALL' or dim not in self.postings:
+                continue
+            code = self.lookup[dim].get(self._normalize_value(dim, value))
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            terms.append((len(self.postings[dim][code]), dim, code))
+        
+        if not terms:
+            return None
+        
+        terms.sort()
+        _, dim, code = terms[0]
+        rows = self.postings[dim][code]
+        for _, dim, code in terms[1:]:
+            rows = rows[self.codes[dim][rows] == code]
+        return rows
+    
+    def filter(self, **criteria):
+        """คืนค่า DataFrame ของแถวที่ตรงกับเงื่อนไข (ดึงแถวจาก DataFrame ต้นฉบับครั้งเดียว)"""
+        rows = self.select(**criteria)
+        if rows is None:
+            return self.frame
+        return self.frame.take(rows)
+    
+    def distinct(self, dim, **criteria):
+        """ค่าที่แตกต่างกันของมิติ dim ในแถวที่ตรงกับเงื่อนไข (เรียงแล้ว ไม่รวมค่าว่าง)"""
+        if dim not in self.codes:
+            return []
+        rows = self.select(**criteria)
+        codes = self.codes[dim] if rows is None else self.codes[dim][rows]
+        present = np.unique(codes)
+        return [self.values[dim][code] for code in present if code >= 0]
+
+DROWNING_FILTER_INDEX = None  # สร้างใน load_dashboard_data
+DEATH_CERT_FILTER_INDEX = None
+
+# =============== OLAP Cube สรุปข้อมูลล่วงหน้า ===============
+# รวมข้อมูลดิบเป็น "เซลล์" ตามทุกมิติของตัวกรอง + สถานะ + ระดับสรุป ครั้งเดียวตอนโหลดข้อมูล
+# แต่ละเซลล์เก็บจำนวนแถวและผลรวมที่ต้องใช้ (สรุป, อายุ) กราฟวงกลม, Histogram, กราฟแท่ง
+# และตัวเลขสถิติคำนวณด้วยการ roll-up เซลล์ที่ตรงกับตัวกรอง โดยไม่ต้องกลับไปอ่านข้อมูลดิบ
+CUBE_DIMENSIONS = ['จังหวัด', 'อำเภอ', 'ตำบล', 'เขต', 'เดือน', 'ปี', 'ช่วงอายุ', 'สถานะ', 'ระดับสรุป']
+
+# มิติ 'age' ของ cube ใช้คอลัมน์กลุ่มอายุที่คำนวณไว้แล้ว แทนอายุรายคน
+CUBE_FILTER_DIMENSIONS = {**FILTER_DIMENSIONS, 'age': 'ช่วงอายุ'}
+
+# คอลัมน์ของข้อมูลดิบที่ cube ใช้ (ตอน ingest ดึงเฉพาะคอลัมน์เหล่านี้ของแถวที่เปลี่ยน)
+CUBE_SOURCE_COLUMNS = ['จังหวัด', 'อำเภอ', 'ตำบล', 'เขต', 'เดือน', 'ปี', 'สถานะ', 'อายุ', 'สรุป']
+
+class AggregateCube:
+    """ตารางสรุปล่วงหน้า (cube) ของข้อมูลหนึ่งชุด พร้อม query แบบ roll-up ตามตัวกรอง"""
+    
+    def __init__(self, frame, label=''):
+        work = pd.DataFrame(index=frame.index)
+        for col in ['จังหวัด', 'อำเภอ', 'ตำบล', 'เขต', 'เดือน', 'ปี', 'สถานะ']:
+            if col in frame.columns:
+                work[col] = frame[col]
+        
+        # ตัววัด (measure) ที่รวมได้ด้วยการบวก
+        work['จำนวน'] = np.int64(1)
+        
+        if 'อายุ' in frame.columns:
+            ages = pd.to_numeric(frame['อายุ'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            bands = np.full(len(ages), None, dtype=object)
+            bands[ages < 15] = AGE_GROUPS[0]
+            bands[ages >= 15] = AGE_GROUPS[1]
+            work['ช่วงอายุ'] = pd.Categorical(bands, categories=AGE_GROUPS)
+            work['ผลรวมอายุ'] = np.nan_to_num(ages)
+            work['จำนวนที่มีอายุ'] = (~np.isnan(ages)).astype(np.int64)
+        
+        if 'สรุป' in frame.columns:
+            summary = pd.to_numeric(frame['สรุป'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            # ระดับสรุป: 1-4 ตามค่าจริง, 5 = ตั้งแต่ 5 ขึ้นไป, 0 = ไม่มีค่า/ค่าอื่น
+            levels = np.zeros(len(summary), dtype=np.int8)
+            for level in range(1, 5):
+                levels[summary == level] = level
+            levels[summary >= 5] = 5
+            work['ระดับสรุป'] = levels
+            work['สรุป'] = frame['สรุป']
+            work['จำนวนสรุปมากกว่า1'] = (summary > 1).astype(np.int64)
+        
+        self.dimensions = [col for col in CUBE_DIMENSIONS if col in work.columns]
+        self.measures = [col for col in work.columns if col not in self.dimensions]
+        
+        if self.dimensions:
+            self.cells = (work.groupby(self.dimensions, observed=True, dropna=False, sort=False)[self.measures]
+                              .sum().reset_index())
+        elif len(work):
+            self.cells = work[self.measures].sum().to_frame().T
+        else:
+            # ไม่มีข้อมูล (เช่น ไม่มีไฟล์ Excel) จึงไม่มีเซลล์ Selection.has_data เป็น False
+            self.cells = work[self.measures].iloc[:0].reset_index(drop=True)
+        
+        self.index = FilterIndex(self.cells, CUBE_FILTER_DIMENSIONS)
+        self._live = None       # ตำแหน่งเซลล์ที่จำนวนมากกว่า 0 (None = ทุกเซลล์)
+        self._live_mask = None
+        self._positions = None  # key ของเซลล์ → ตำแหน่ง (สร้างเมื่อ ingest ครั้งแรก)
+        
+        if label:
+            print(f"✅ สร้าง Cube {label}: {len(frame):,} แถว → {len(self.cells):,} เซลล์")
+    
+    def _cell_keys(self, cells):
+        """key ของแต่ละเซลล์ = tuple ค่าของทุกมิติ (ค่าว่างเป็น None เพื่อให้ใช้เป็น key ของ dict ได้)"""
+        values = cells[self.dimensions].astype(object)
+        return list(values.where(values.notna(), None).itertuples(index=False, name=None))
+    
+    def updated(self, added, removed):
+        """
+        Cube หลังเพิ่มแถว added และถอนแถว removed (แถวข้อมูลดิบ) โดยสรุปเฉพาะแถวเหล่านั้นแล้วบวก/ลบเข้าเซลล์เดิม
+        เซลล์เดิมอยู่ตำแหน่งเดิม (Hex Index ของเซลล์เดิมจึงใช้ต่อได้) เซลล์ใหม่ต่อท้าย
+        เซลล์ที่จำนวนเหลือ 0 ยังอยู่ในตาราง แต่ query จะไม่คืนค่า คืนค่า None ถ้ามิติของข้อมูลไม่ตรงกับ cube เดิม
+        """
+        changes = AggregateCube(added)
+        if changes.dimensions != self.dimensions or changes.measures != self.measures:
+            return None
+        changes = changes.cells
+        if len(removed):
+            retracted = AggregateCube(removed).cells
+            retracted[self.measures] = -retracted[self.measures]
+            changes = concat_frames([changes, retracted])
+        
+        positions = self._positions
+        if positions is None:
+            positions = {key: position for position, key in enumerate(self._cell_keys(self.cells))}
+        self._positions = None  # dict ย้ายไปอยู่กับ cube ใหม่
+        
+        targets = np.empty(len(changes), dtype=np.int64)
+        new_rows = []
+        for i, key in enumerate(self._cell_keys(changes)):
+            position = positions.get(key)
+            if position is None:
+                position = positions[key] = len(self.cells) + len(new_rows)
+                new_rows.append(i)
+            targets[i] = position
+        
+        existing = targets < len(self.cells)
+        cells = self.cells.copy(deep=False)
+        for col in self.measures:
+            delta = changes[col].to_numpy()
+            values = cells[col].to_numpy()
+            values = values.astype(np.result_type(values, delta), copy=True)
+            np.add.at(values, targets[existing], delta[existing])
+            cells[col] = values
+        cells = concat_frames([cells, changes.iloc[new_rows]])
+        
+        cube = AggregateCube.__new__(AggregateCube)
+        cube.dimensions = self.dimensions
+        cube.measures = self.measures
+        cube.cells = cells
+        cube.index = self.index.updated(cells, np.empty(0, dtype=np.int64), CUBE_FILTER_DIMENSIONS)
+        cube._live_mask = cells['จำนวน'].to_numpy() > 0
+        cube._live = None if cube._live_mask.all() else np.flatnonzero(cube._live_mask)
+        cube._positions = positions
+        return cube
+    
+    def query(self, **criteria):
+        """คืนค่าเซลล์ที่ตรงกับตัวกรอง (ใช้ชื่อมิติเดียวกับ FilterIndex)"""
+        rows = self.index.select(**criteria)
+        if self._live is not None:
+            # เซลล์ที่ถูกถอนแถวออกจนไม่เหลือ (ระเบียนที่แก้ไขผ่าน ingest) ไม่นับเป็นผลลัพธ์
+            rows = self._live if rows is None else rows[self._live_mask[rows]]
+        if rows is None:
+            return self.cells
+        return self.cells.take(rows)
+    
+    def rollup(self, by, measures=None, **criteria):
+        """Roll-up เซลล์ที่ตรงกับตัวกรองขึ้นไปที่ระดับของมิติ by"""
+        cells = self.query(**criteria)
+        return cells.groupby(by, observed=True)[measures or self.measures].sum()
+
+DROWNING_CUBE = None  # สร้างใน load_dashboard_data
+DEATH_CERT_CUBE = None
+
+# =============== Hexagonal Binning ของเซลล์ใน Cube ===============
+# แต่ละเซลล์ของ cube วางที่ centroid ของพื้นที่ (Gazetteer หรือพิกัดจังหวัด) แล้วกำหนดช่อง hex
+# ของทุกความละเอียดครั้งเดียวตอนโหลด ตอนคำขอรวมตัววัดของเซลล์ที่ผ่านตัวกรองตามรหัส hex ด้วย np.bincount
+# (จำนวนตามสถานะ/ปีมาจากมิติของ cube อยู่แล้ว) แล้ววาดเป็น Choroplethmapbox trace เดียว
+# ขนาดของแผนที่จึงขึ้นกับจำนวนช่อง hex ไม่ใช่จำนวนแถวหรือจำนวนพื้นที่
+HEX_SIZES = (0.05, 0.1, 0.2, 0.4)  # รัศมี hex (องศา ในแกน Web Mercator) จากละเอียดไปหยาบ
+HEX_MAX_ACROSS = 40  # ใช้ขนาดที่ละเอียดที่สุดที่ข้อมูลกว้างไม่เกินจำนวนช่องนี้
+
+def _mercator_y(lat):
+    """พิกัด y ของ Web Mercator ในหน่วยองศา"""
+    return np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
+
+def _mercator_lat(y):
+    return np.degrees(2 * np.arctan(np.exp(np.radians(y))) - np.pi / 2)
+
+def hex_axial(lon, lat, size):
+    """พิกัด axial (q, r) ของ hex แบบ pointy-top ที่แต่ละจุดอยู่"""
+    x = np.asarray(lon, dtype=float) / size
+    y = _mercator_y(np.asarray(lat, dtype=float)) / size
+    q = np.sqrt(3) / 3 * x - y / 3
+    r = 2 / 3 * y
+    
+    # ปัดเศษแบบ cube coordinates (q + r + s = 0) แก้แกนที่ปัดคลาดมากที่สุด
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+class HexIndex:
+    """รหัสช่อง hex ของแต่ละเซลล์ใน cube ทุกความละเอียด (ตำแหน่งเดียวกับ cube.cells)"""
+    
+    def __init__(self, lon, lat, sizes=HEX_SIZES):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.sizes = sizes
+        valid = np.isfinite(self.lon) & np.isfinite(self.lat)
+        
+        self.codes = {}
+        self.hexes = {}
+        self._rings = {}
+        for size in sizes:
+            q, r = hex_axial(self.lon[valid], self.lat[valid], size)
+            hexes, inverse = np.unique(np.column_stack([q, r]), axis=0, return_inverse=True)
+            codes = np.full(len(self.lon), -1, dtype=np.int64)
+            codes[valid] = inverse.ravel()
+            self.codes[size] = codes
+            self.hexes[size] = hexes
+    
+    def extended(self, lon, lat):
+        """HexIndex ที่มีเซลล์เพิ่มท้ายตาราง (เซลล์ใหม่ของ cube หลัง ingest) คำนวณช่อง hex เฉพาะเซลล์ใหม่"""
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        
+        index = HexIndex.__new__(HexIndex)
+        index.lon = np.concatenate([self.lon, lon])
+        index.lat = np.concatenate([self.lat, lat])
+        index.sizes = self.sizes
+        index.codes = {}
+        index.hexes = {}
+        index._rings = {}
+        for size in self.sizes:
+            old_hexes = self.hexes[size]
+            q, r = hex_axial(lon[valid], lat[valid], size)
+            hexes, inverse = np.unique(np.vstack([old_hexes, np.column_stack([q, r])]), axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            codes = np.full(len(lon), -1, dtype=np.int64)
+            codes[valid] = inverse[len(old_hexes):]
+            
+            old_codes = self.codes[size]
+            if len(hexes) == len(old_hexes):
+                if size in self._rings:
+                    index._rings[size] = self._rings[size]
+            else:
+                # มีช่อง hex ใหม่: ลำดับ hex เรียงตาม (q, r) เหมือนสร้างทั้งชุด รหัสของเซลล์เดิมจึงต้องเลื่อนตาม
+                old_codes = np.where(old_codes >= 0, inverse[:len(old_hexes)][old_codes], -1)
+            index.codes[size] = np.concatenate([old_codes, codes])
+            index.hexes[size] = hexes
+        return index
+    
+    def choose_size(self, positions):
+        """ความละเอียดที่เหมาะกับขอบเขตของเซลล์ที่เลือก"""
+        lon = self.lon[positions]
+        y = _mercator_y(self.lat[positions])
+        valid = np.isfinite(lon) & np.isfinite(y)
+        if not valid.any():
+            return self.sizes[-1]
+        extent = max(np.ptp(lon[valid]), np.ptp(y[valid]))
+        for size in self.sizes:
+            if extent / size <= HEX_MAX_ACROSS:
+                return size
+        return self.sizes[-1]
+    
+    def aggregate(self, positions, weights, size):
+        """รวม weights ของเซลล์ตามช่อง hex: คืนค่า (ลำดับ hex ที่มีค่า, ผลรวม)"""
+        codes = self.codes[size][positions]
+        keep = codes >= 0
+        totals = np.bincount(codes[keep], weights=np.asarray(weights, dtype=float)[keep],
+                             minlength=len(self.hexes[size]))
+        present = np.flatnonzero(totals > 0)
+        return present, totals[present]
+    
+    def geojson(self, size, hex_ids):
+        """GeoJSON ของช่อง hex ที่ระบุ (id ของ feature = ลำดับ hex)"""
+        rings = self._rings.get(size)
+        if rings is None:
+            q, r = self.hexes[size][:, 0], self.hexes[size][:, 1]
+            center_x = size * np.sqrt(3) * (q + r / 2)
+            center_y = size * 1.5 * r
+            angles = np.radians(30 + 60 * np.arange(7))  # 7 จุด = ring ปิด ทวนเข็มนาฬิกา
+            x = center_x[:, None] + size * np.cos(angles)
+            y = center_y[:, None] + size * np.sin(angles)
+            rings = np.stack([x, _mercator_lat(y)], axis=-1).round(COORDINATE_PRECISION)
+            self._rings[size] = rings
+        
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'id': int(h),
+                 'geometry': {'type': 'Polygon', 'coordinates': [rings[h].tolist()]}}
+                for h in hex_ids
+            ]
+        }
+
+def locate_cells(cells, gazetteer, key_cols):
+    """พิกัด (lat, lon) ของเซลล์ใน cube จาก centroid ใน Gazetteer หรือพิกัดจังหวัด"""
+    if gazetteer is not None and all(col in cells.columns for col in key_cols):
+        return gazetteer.locate(cells, key_cols)
+    province_coords = PROVINCE_COORD_TABLE.reindex(cells['จังหวัด'].to_numpy())
+    return province_coords['lat'].to_numpy(dtype=float), province_coords['lon'].to_numpy(dtype=float)
+
+def build_hex_index(cube, gazetteer, key_cols, label):
+    """วางเซลล์ของ cube บนพิกัด centroid แล้วสร้าง HexIndex"""
+    cells = cube.cells
+    if len(cells) == 0 or 'จังหวัด' not in cells.columns:
+        return None
+    try:
+        start = time.perf_counter()
+        lat, lon = locate_cells(cells, gazetteer, key_cols)
+        hex_index = HexIndex(lon, lat)
+        print(f"✅ สร้าง Hex Index {label}: {len(cells):,} เซลล์ ({time.perf_counter() - start:.2f} วินาที)")
+        return hex_index
+    except Exception as e:
+        print(f"ไม่สามารถสร้าง Hex Index {label}: {e}")
+        return None
+
+DROWNING_HEX_INDEX = None  # สร้างใน load_dashboard_data
+DEATH_CERT_HEX_INDEX = None
+
+# map_type → (สถานะที่นับ, colorscale)
+HEX_STATUS_BY_MAP_TYPE = {
+    'deceased_rate': ('เสียชีวิต', 'Reds'),
+    'injured_rate': ('บาดเจ็บ', 'Oranges'),
+    'not_injured_rate': ('ไม่บาดเจ็บ', 'Greens'),
+}
+
+def create_hex_heatmap(cells, map_type='deceased_rate', data_type='drowning'):
+    """Heatmap แบบ hexagonal binning: อัตรา (%) ของแต่ละช่อง hex เทียบกับทั้งหมดที่ผ่านตัวกรอง"""
+    data = current_data()
+    if data_type == 'death_cert':
+        hex_index = data.DEATH_CERT_HEX_INDEX
+        colorscale = 'Reds'
+        weights = (pd.to_numeric(cells['สรุป'], errors='coerce').fillna(0).to_numpy(dtype=float)
+                   if 'สรุป' in cells.columns else None)
+    else:
+        hex_index = data.DROWNING_HEX_INDEX
+        status, colorscale = HEX_STATUS_BY_MAP_TYPE.get(map_type, HEX_STATUS_BY_MAP_TYPE['deceased_rate'])
+        weights = (np.where(cells['สถานะ'].to_numpy() == status, cells['จำนวน'].to_numpy(dtype=float), 0.0)
+                   if 'สถานะ' in cells.columns else None)
+    
+    fig = go.Figure()
+    if hex_index is None or weights is None or weights.sum() <= 0:
+        fig.add_annotation(text="ไม่มีข้อมูล", showarrow=False)
+        fig.update_layout(height=400)
+        return fig
+    
+    positions = cells.index.to_numpy()
+    size = hex_index.choose_size(positions)
+    hex_ids, counts = hex_index.aggregate(positions, weights, size)
+    if len(hex_ids) == 0:
+        fig.add_annotation(text="ไม่มีข้อมูลพิกัด", showarrow=False)
+        fig.update_layout(height=400)
+        return fig
+    
+    rates = (counts * 100 / weights.sum()).round(2)
+    fig.add_trace(go.Choroplethmapbox(
+        geojson=hex_index.geojson(size, hex_ids),
+        locations=hex_ids,
+        z=rates,
+        customdata=counts,
+        colorscale=colorscale,
+        zmin=0,
+        zmax=rates.max(),
+        marker_opacity=0.75,
+        marker_line_width=0.5,
+        marker_line_color='white',
+        colorbar=dict(
+            title=dict(text='อัตรา (%)', font=dict(family='Sarabun', size=10)),
+            ticksuffix='%',
+            len=0.7
+        ),
+        hovertemplate="จำนวน: %{customdata:,.0f} ราย<br>" +
+                      "อัตรา: %{z:.2f}%<extra></extra>"
+    ))
+    
+    fig.update_layout(
+        title=None,
+        mapbox=dict(
+            style='carto-positron',
+            center=dict(lat=13.5, lon=101),
+            zoom=5
+        ),
+        margin=dict(l=0, r=0, t=35, b=0),
+        height=400,
+        font=dict(family='Sarabun')
+    )
+    return fig
 
 # =============== ฟังก์ชันคำนวณอัตราสถานะ (สำหรับข้อมูลการจมน้ำ) ===============
-def calculate_status_rates(filtered_df):
-    if 'สถานะ' not in filtered_df.columns or len(filtered_df) == 0:
+def calculate_status_rates(cells):
+    """อัตราสถานะจากเซลล์ของ cube ที่ผ่านตัวกรองแล้ว"""
+    if 'สถานะ' not in cells.columns or len(cells) == 0:
         return {
             'deceased': {'count': 0, 'rate': 0},
             'injured': {'count': 0, 'rate': 0},
@@ -253,7 +1740,7 @@ def calculate_status_rates(filtered_df):
             'total': 0
         }
     
-    status_counts = filtered_df['สถานะ'].value_counts()
+    status_counts = cells.groupby('สถานะ', observed=True)['จำนวน'].sum()
     
     deceased = status_counts.get('เสียชีวิต', 0)
     injured = status_counts.get('บาดเจ็บ', 0)
@@ -276,8 +1763,9 @@ def calculate_status_rates(filtered_df):
     }
 
 # =============== ฟังก์ชันคำนวณอัตราจาก "สรุป" (สำหรับมรณบัตร) ===============
-def calculate_death_summary_rates(filtered_df):
-    if 'สรุป' not in filtered_df.columns or len(filtered_df) == 0:
+def calculate_death_summary_rates(cells):
+    """จำนวนตามระดับสรุป (1-4, ≥5) จากเซลล์ของ cube ที่ผ่านตัวกรองแล้ว"""
+    if 'ระดับสรุป' not in cells.columns or len(cells) == 0:
         return {
             'class_1': {'count': 0, 'rate': 0},
             'class_2': {'count': 0, 'rate': 0},
@@ -287,13 +1775,13 @@ def calculate_death_summary_rates(filtered_df):
             'total': 0
         }
     
-    summary_counts = filtered_df['สรุป'].value_counts()
+    summary_counts = cells.groupby('ระดับสรุป')['จำนวน'].sum()
     
     class_1 = summary_counts.get(1, 0)
     class_2 = summary_counts.get(2, 0)
     class_3 = summary_counts.get(3, 0)
     class_4 = summary_counts.get(4, 0)
-    class_5 = sum([summary_counts.get(i, 0) for i in summary_counts.index if i >= 5])
+    class_5 = summary_counts.get(5, 0)
     
     total = class_1 + class_2 + class_3 + class_4 + class_5
     
@@ -317,21 +1805,25 @@ def calculate_death_summary_rates(filtered_df):
     }
 
 # =============== ฟังก์ชันคำนวณความถี่ตามปี ===============
-def calculate_frequency_by_year(filtered_df):
-    if 'ปี' not in filtered_df.columns or 'สถานะ' not in filtered_df.columns:
+def calculate_frequency_by_year(cells):
+    """ความถี่รายปีจากเซลล์ของ cube ที่ผ่านตัวกรองแล้ว"""
+    if 'ปี' not in cells.columns or 'สถานะ' not in cells.columns:
         return None
     
-    years = sorted(filtered_df['ปี'].dropna().unique())
+    years = sorted(cells['ปี'].dropna().unique())
     
     if len(years) == 0:
         return None
     
+    # ตาราง ปี × สถานะ (ปีที่ไม่มีสถานะเลยจะไม่มีแถว ให้นับเป็น 0)
+    year_status = cells.groupby(['ปี', 'สถานะ'], observed=True)['จำนวน'].sum().unstack(fill_value=0)
+    no_status = pd.Series(dtype='int64')
+    
     incident_counts = []
     death_counts = []
     
     for year in years:
-        year_df = filtered_df[filtered_df['ปี'] == year]
-        status = year_df['สถานะ'].value_counts()
+        status = year_status.loc[year] if year in year_status.index else no_status
         
         injured = status.get('บาดเจ็บ', 0)
         not_injured = status.get('ไม่บาดเจ็บ', 0)
@@ -379,7 +1871,7 @@ def analyze_companion_and_age(filtered_df):
             return None
     
     # กรองเฉพาะแถวที่มีข้อมูลผู้อยู่ด้วย
-    analysis_df = filtered_df[filtered_df['ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร'].notna()].copy()
+    analysis_df = filtered_df[filtered_df['ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร'].notna()]
     
     print("=" * 60)
     print("DEBUG: เริ่มวิเคราะห์ข้อมูลผู้อยู่ด้วย")
@@ -398,31 +1890,7 @@ def analyze_companion_and_age(filtered_df):
     # แสดงข้อมูลตัวอย่างเพื่อ debug
     print(f"DEBUG: ตัวอย่างข้อมูล 'ขณะเกิดเหตุ': {analysis_df['ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร'].unique()[:5]}")
     
-    # สร้างกลุ่มอายุ
-    analysis_df['กลุ่มอายุ'] = analysis_df['อายุ'].apply(
-        lambda x: 'ต่ำกว่า 15 ปี' if pd.notna(x) and x < 15 else '15 ปีขึ้นไป'
-    )
-    
-    # ฟังก์ชันจัดกลุ่มผู้อยู่ด้วยแบบยืดหยุน
-    def categorize_companion(value):
-        if pd.isna(value):
-            return 'ไม่ระบุ'
-    
-        value_str = str(value).strip()
-    
-        # เปลี่ยนเป็น exact match ตามที่คุณบอก
-        if 'ผู้ปกครอง/ผู้ดูแลเด็ก' in value_str:
-            return 'ผู้ปกครอง'
-        elif value_str == 'เพื่อน':
-            return 'เพื่อน'
-        elif value_str == 'อยู่คนเดียว':
-            return 'อยู่เพียงลำพัง'
-        else:
-            return 'อื่นๆ'
-    
-    analysis_df['กลุ่มผู้อยู่ด้วย'] = analysis_df['ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร'].apply(
-        categorize_companion
-    )
+    # 'กลุ่มผู้อยู่ด้วย' และ 'กลุ่มอายุ' คำนวณไว้แล้วตอนโหลดข้อมูล (add_companion_groups)
     
     # แสดงผลการจัดกลุ่ม
     print(f"DEBUG: การจัดกลุ่มผู้อยู่ด้วย:")
@@ -444,49 +1912,186 @@ def analyze_companion_and_age(filtered_df):
 
     return result
 
+# =============== Kernel Density บน Grid (คำนวณฝั่ง Server) ===============
+# โหมด 'raster' ของ Heatmap: แทนที่จะส่งจุดทุกพื้นที่ให้ browser คำนวณ density เอง
+# server รวมน้ำหนักลง grid คงที่ครอบคลุมประเทศไทย แล้ว convolve กับ Gaussian kernel ด้วย FFT
+# ผลลัพธ์ส่งเป็นภาพ PNG ภาพเดียว (mapbox image layer) ขนาดไม่ขึ้นกับจำนวนพื้นที่
+# grid ใช้แกน y แบบ Web Mercator ภาพจึงวางบนแผนที่ได้ตรงโดยไม่ต้อง reproject
+HEATMAP_RENDER_MODES = ('points', 'raster', 'hex')
+HEATMAP_RENDER_MODE = os.environ.get('HEATMAP_RENDER_MODE', 'points')
+if HEATMAP_RENDER_MODE not in HEATMAP_RENDER_MODES:
+    HEATMAP_RENDER_MODE = 'points'
+
+KDE_BOUNDS = (97.3, 5.6, 105.7, 20.5)  # lon_min, lat_min, lon_max, lat_max
+KDE_CELL_SIZE = 0.04  # ขนาดช่อง grid (องศา ~4 กม.) kernel กว้างหลายช่อง ภาพจึงยังเรียบ
+KDE_BANDWIDTH = 0.15  # ส่วนเบี่ยงเบนมาตรฐานของ Gaussian kernel (องศา)
+KDE_MIN_LEVEL = 0.02  # ความหนาแน่นต่ำกว่านี้ (เทียบกับค่าสูงสุด) แสดงเป็นโปร่งใส
+
+def compute_kde_grid(lon, lat, weights, bounds=KDE_BOUNDS, cell_size=KDE_CELL_SIZE, bandwidth=KDE_BANDWIDTH):
+    """
+    ความหนาแน่นแบบถ่วงน้ำหนักบน grid (แถวแรก = ใต้สุด)
+    คืนค่า (density, extent) โดย extent = (lon_min, lat_min, lon_max, lat_max) ของ grid จริง
+    """
+    lon_min, lat_min, lon_max, lat_max = bounds
+    y_min, y_max = _mercator_y(lat_min), _mercator_y(lat_max)
+    nx = int(np.ceil((lon_max - lon_min) / cell_size))
+    ny = int(np.ceil((y_max - y_min) / cell_size))
+    
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    col = np.floor((lon - lon_min) / cell_size)
+    row = np.floor((_mercator_y(lat) - y_min) / cell_size)
+    inside = (col >= 0) & (col < nx) & (row >= 0) & (row < ny) & np.isfinite(weights)
+    flat = row[inside].astype(np.int64) * nx + col[inside].astype(np.int64)
+    grid = np.bincount(flat, weights=weights[inside], minlength=nx * ny).reshape(ny, nx)
+    
+    # Gaussian kernel แยกแกนได้ แต่ใช้ FFT 2 มิติครั้งเดียว (pad ขอบกันค่าวนรอบ)
+    radius = int(np.ceil(3 * bandwidth / cell_size))
+    offsets = np.arange(-radius, radius + 1) * cell_size
+    kernel_1d = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel = np.outer(kernel_1d, kernel_1d)
+    kernel /= kernel.sum()
+    
+    shape = (ny + 2 * radius, nx + 2 * radius)
+    spectrum = np.fft.rfft2(grid, shape) * np.fft.rfft2(kernel, shape)
+    density = np.fft.irfft2(spectrum, shape)[radius:radius + ny, radius:radius + nx]
+    density[density < 1e-12 * max(density.max(), 1e-300)] = 0
+    
+    extent = (lon_min, lat_min, lon_min + nx * cell_size, float(_mercator_lat(y_min + ny * cell_size)))
+    return density, extent
+
+def encode_png_rgba(rgba):
+    """เข้ารหัสภาพ RGBA (uint8, แถวแรก = บนสุด) เป็นไฟล์ PNG โดยใช้แค่ zlib"""
+    height, width = rgba.shape[:2]
+    flat = rgba.reshape(height, width * 4)
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 1  # filter type: Sub (เก็บผลต่างจากพิกเซลทางซ้าย บีบอัดได้ดีกว่ามาก)
+    raw[:, 1:5] = flat[:, :4]
+    raw[:, 5:] = flat[:, 4:] - flat[:, :-4]
+    
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+    
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+_colorscale_lut_cache = {}
+
+def colorscale_lut(colorscale):
+    """ตารางสี 256 ระดับ (uint8 RGB) จาก colorscale ของ Plotly"""
+    lut = _colorscale_lut_cache.get(colorscale)
+    if lut is None:
+        colors = pcolors.sample_colorscale(colorscale, np.linspace(0, 1, 256))
+        lut = np.array([pcolors.unlabel_rgb(color) for color in colors]).round().astype(np.uint8)
+        _colorscale_lut_cache[colorscale] = lut
+    return lut
+
+def add_density_raster(fig, lat, lon, weights, colorscale):
+    """เพิ่มภาพความหนาแน่นจาก compute_kde_grid เป็น image layer ของ mapbox พร้อม colorbar (% ของค่าสูงสุด)"""
+    density, (lon_min, lat_min, lon_max, lat_max) = compute_kde_grid(lon, lat, weights)
+    peak = density.max()
+    level = density / peak if peak > 0 else density
+    
+    rgba = np.empty(level.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = colorscale_lut(colorscale)[np.clip((level * 255).astype(int), 0, 255)]
+    rgba[..., 3] = np.where(level >= KDE_MIN_LEVEL, 90 + 150 * level, 0).astype(np.uint8)
+    image = 'data:image/png;base64,' + base64.b64encode(encode_png_rgba(rgba[::-1])).decode('ascii')
+    
+    fig.update_layout(mapbox_layers=[dict(
+        sourcetype='image',
+        source=image,
+        coordinates=[[lon_min, lat_max], [lon_max, lat_max], [lon_max, lat_min], [lon_min, lat_min]],
+    )])
+    
+    # trace ว่างสำหรับแสดง colorbar อย่างเดียว
+    fig.add_trace(go.Scattermapbox(
+        lat=[None], lon=[None], mode='markers', hoverinfo='skip', showlegend=False,
+        marker=dict(
+            color=[0], colorscale=colorscale, cmin=0, cmax=100, showscale=True,
+            colorbar=dict(
+                title=dict(text='ความหนาแน่น (%)', font=dict(family='Sarabun', size=10)),
+                ticksuffix='%',
+                len=0.7
+            )
+        )
+    ))
+    return fig
+
+# =============== ตำแหน่งสำรองแบบคงที่ (เมื่อไม่มี Shapefile) ===============
+# พื้นที่ย่อยในจังหวัดเดียวกันกระจายรอบพิกัดจังหวัดด้วย offset จาก hash ของชื่อพื้นที่
+# hash_pandas_object ไม่ขึ้นกับ PYTHONHASHSEED ตำแหน่งจึงเหมือนกันทุก process/worker และแคชผลได้
+def fallback_area_coordinates(frame, key_cols, lat_spread=0.2, lon_spread=0.2):
+    """
+    คืนค่า (lat, lon) = พิกัดจังหวัด + offset คงที่ตามชื่อพื้นที่ (key_cols)
+    จังหวัดที่มีพื้นที่เดียวใช้พิกัดจังหวัดตรงๆ, จังหวัดที่ไม่รู้จักได้ NaN
+    """
+    provinces = frame['จังหวัด']
+    coords = PROVINCE_COORD_TABLE.reindex(provinces.to_numpy())
+    lat = coords['lat'].to_numpy(dtype=float)
+    lon = coords['lon'].to_numpy(dtype=float)
+    
+    hashes = pd.util.hash_pandas_object(frame[key_cols].astype(str), index=False).to_numpy()
+    u = (hashes >> np.uint64(32)).astype(float) / 2 ** 32
+    v = (hashes & np.uint64(0xffffffff)).astype(float) / 2 ** 32
+    
+    shared = (provinces.map(provinces.value_counts()).to_numpy(dtype=float) > 1)
+    lat = lat + np.where(shared, (2 * u - 1) * lat_spread, 0)
+    lon = lon + np.where(shared, (2 * v - 1) * lon_spread, 0)
+    return lat, lon
+
 # =============== ฟังก์ชันสร้างแผนที่ Heatmap (แก้ไขใหม่ - รายตำบลสำหรับจมน้ำ, รายอำเภอสำหรับมรณบัตร) ===============
-def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='drowning'):
+def create_shapefile_heatmap(cells, map_type='deceased_rate', data_type='drowning', render='points'):
     """
     สร้างแผนที่ Heatmap ตามประเภทอัตรา
     - สำหรับ drowning: แสดงอัตราการเสียชีวิต/บาดเจ็บ/ไม่บาดเจ็บ รายตำบล (คำนวณจากบัญญัติไตรยางค์)
     - สำหรับ death_cert: แสดงอัตราการเสียชีวิตรายอำเภอ (คำนวณจากบัญญัติไตรยางค์)
+    - cells คือเซลล์ของ cube ที่ผ่านตัวกรองแล้ว
+    - render: 'points' = ส่งจุดให้ browser คำนวณ density, 'raster' = คำนวณ KDE ที่ server แล้วส่งเป็นภาพ,
+      'hex' = รวมตามช่องหกเหลี่ยม
     """
+    data = current_data()
     
-    if len(filtered_df) == 0:
+    if len(cells) == 0:
         fig = go.Figure()
         fig.add_annotation(text="ไม่มีข้อมูล", showarrow=False)
         fig.update_layout(height=400)
         return fig
     
+    if render == 'hex':
+        return create_hex_heatmap(cells, map_type, data_type)
+    
     # =============== สำหรับข้อมูลการจมน้ำ - แสดงอัตรารายตำบล ===============
     if data_type == 'drowning':
-        if 'จังหวัด' not in filtered_df.columns or 'สถานะ' not in filtered_df.columns:
+        if 'จังหวัด' not in cells.columns or 'สถานะ' not in cells.columns:
             fig = go.Figure()
             fig.add_annotation(text="ไม่มีข้อมูลจังหวัด/สถานะ", showarrow=False)
             fig.update_layout(height=400)
             return fig
         
         # ตรวจสอบว่ามีคอลัมน์ อำเภอ และ ตำบล หรือไม่
-        has_district = 'อำเภอ' in filtered_df.columns
-        has_subdistrict = 'ตำบล' in filtered_df.columns
+        has_district = 'อำเภอ' in cells.columns
+        has_subdistrict = 'ตำบล' in cells.columns
         
         # =============== รวมข้อมูลเป็นรายตำบล และนับตามสถานะ ===============
         if has_subdistrict and has_district:
             # รวมตามจังหวัด+อำเภอ+ตำบล+สถานะ
-            status_pivot = filtered_df.groupby(['จังหวัด', 'อำเภอ', 'ตำบล', 'สถานะ']).size().unstack(fill_value=0)
+            status_pivot = cells.groupby(['จังหวัด', 'อำเภอ', 'ตำบล', 'สถานะ'], observed=True)['จำนวน'].sum().unstack(fill_value=0)
             subdistrict_data = status_pivot.reset_index()
             area_level = "ตำบล"
             group_cols = ['จังหวัด', 'อำเภอ', 'ตำบล']
         elif has_district:
             # รวมตามจังหวัด+อำเภอ+สถานะ
-            status_pivot = filtered_df.groupby(['จังหวัด', 'อำเภอ', 'สถานะ']).size().unstack(fill_value=0)
+            status_pivot = cells.groupby(['จังหวัด', 'อำเภอ', 'สถานะ'], observed=True)['จำนวน'].sum().unstack(fill_value=0)
             subdistrict_data = status_pivot.reset_index()
             subdistrict_data['ตำบล'] = '-'
             area_level = "อำเภอ"
             group_cols = ['จังหวัด', 'อำเภอ']
         else:
             # รวมตามจังหวัด+สถานะ
-            status_pivot = filtered_df.groupby(['จังหวัด', 'สถานะ']).size().unstack(fill_value=0)
+            status_pivot = cells.groupby(['จังหวัด', 'สถานะ'], observed=True)['จำนวน'].sum().unstack(fill_value=0)
             subdistrict_data = status_pivot.reset_index()
             subdistrict_data['อำเภอ'] = '-'
             subdistrict_data['ตำบล'] = '-'
@@ -522,71 +2127,21 @@ def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='d
         )
         
         # =============== ใช้ Centroid จาก Shapefile ถ้ามี ===============
-        if HAS_DROWNING_SHAPEFILE and gdf_drowning is not None and has_subdistrict:
-            # หาคอลัมน์ชื่อตำบล, อำเภอ, จังหวัดใน Shapefile
-            tam_col = None
-            amp_col = None
-            prov_col = None
-            
-            for col in gdf_drowning.columns:
-                if col in ['ตำบ', 'TAM_TH', 'TAMBON', 'ตำบล', 'TAM_NAME', 'NAME_3', 'TB_TH']:
-                    tam_col = col
-                if col in ['อำเ', 'AMP_TH', 'AMPHOE', 'อำเภอ', 'AMP_NAME', 'NAME_2', 'AP_TH']:
-                    amp_col = col
-                if col in ['PRO_TH', 'PROVINCE', 'จังหวัด', 'PRO_NAME', 'NAME_1', 'PV_TH']:
-                    prov_col = col
-            
-            if tam_col:
-                # คำนวณ centroid ของแต่ละตำบลจาก Shapefile
-                gdf_centroids = gdf_drowning.copy()
-                gdf_centroids['centroid'] = gdf_centroids.geometry.centroid
-                gdf_centroids['lon'] = gdf_centroids['centroid'].x
-                gdf_centroids['lat'] = gdf_centroids['centroid'].y
-                
-                # สร้าง dict ของพิกัดตำบล
-                subdistrict_coords = {}
-                for _, row in gdf_centroids.iterrows():
-                    tam_name = str(row.get(tam_col, '')).strip()
-                    amp_name = str(row.get(amp_col, '')).strip() if amp_col else ''
-                    prov_name = str(row.get(prov_col, '')).strip() if prov_col else ''
-                    if tam_name:
-                        key = f"{prov_name}_{amp_name}_{tam_name}"
-                        subdistrict_coords[key] = {'lat': row['lat'], 'lon': row['lon']}
-                
-                # Join พิกัดกับข้อมูลตำบล
-                def get_subdistrict_coords(row):
-                    key = f"{row['จังหวัด']}_{row['อำเภอ']}_{row['ตำบล']}"
-                    if key in subdistrict_coords:
-                        return pd.Series([subdistrict_coords[key]['lat'], subdistrict_coords[key]['lon']])
-                    # ลองหาแค่ตำบล+อำเภอ
-                    for k, v in subdistrict_coords.items():
-                        if row['ตำบล'] in k and row['อำเภอ'] in k:
-                            return pd.Series([v['lat'], v['lon']])
-                    # ใช้พิกัดจังหวัดแทน
-                    prov_coord = PROVINCE_COORDS.get(row['จังหวัด'], [None, None])
-                    return pd.Series([prov_coord[1], prov_coord[0]])
-                
-                subdistrict_data[['lat', 'lon']] = subdistrict_data.apply(get_subdistrict_coords, axis=1)
+        if data.HAS_DROWNING_SHAPEFILE and data.gdf_drowning is not None and has_subdistrict:
+            if data.DROWNING_GAZETTEER is not None:
+                # พิกัด centroid ของตำบลจาก Gazetteer (ชื่อที่จับคู่ไม่ได้ใช้พิกัดจังหวัด)
+                lat, lon = data.DROWNING_GAZETTEER.locate(subdistrict_data, ['จังหวัด', 'อำเภอ', 'ตำบล'])
+                subdistrict_data['lat'] = lat
+                subdistrict_data['lon'] = lon
             else:
                 # ใช้พิกัดจังหวัดแทน
-                subdistrict_data['lat'] = subdistrict_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1])
-                subdistrict_data['lon'] = subdistrict_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0])
+                subdistrict_data['lat'] = subdistrict_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1]).astype(float)
+                subdistrict_data['lon'] = subdistrict_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0]).astype(float)
         else:
-            # ใช้พิกัดจังหวัดแทน (มี offset เล็กน้อยเพื่อให้เห็นความแตกต่าง)
-            subdistrict_data['lat'] = subdistrict_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1])
-            subdistrict_data['lon'] = subdistrict_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0])
-            
-            # เพิ่ม offset เล็กน้อยสำหรับแต่ละตำบลในจังหวัดเดียวกัน
-            for prov in subdistrict_data['จังหวัด'].unique():
-                mask = subdistrict_data['จังหวัด'] == prov
-                n_items = mask.sum()
-                if n_items > 1:
-                    # สร้าง offset แบบ random เล็กน้อย
-                    np.random.seed(hash(prov) % 2**32)
-                    lat_offsets = np.random.uniform(-0.2, 0.2, n_items)
-                    lon_offsets = np.random.uniform(-0.2, 0.2, n_items)
-                    subdistrict_data.loc[mask, 'lat'] = subdistrict_data.loc[mask, 'lat'] + lat_offsets
-                    subdistrict_data.loc[mask, 'lon'] = subdistrict_data.loc[mask, 'lon'] + lon_offsets
+            # ใช้พิกัดจังหวัดแทน (มี offset คงที่ตามชื่อพื้นที่เพื่อให้เห็นความแตกต่าง)
+            lat, lon = fallback_area_coordinates(subdistrict_data, ['จังหวัด', 'อำเภอ', 'ตำบล'])
+            subdistrict_data['lat'] = lat
+            subdistrict_data['lon'] = lon
         
         # ลบแถวที่ไม่มีพิกัด
         subdistrict_data = subdistrict_data.dropna(subset=['lat', 'lon'])
@@ -640,22 +2195,26 @@ def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='d
                            f"จำนวน: %{{customdata[1]:,}} ราย<br>" +
                            "อัตรา: %{z:.2f}%<extra></extra>")
         
-        fig.add_trace(go.Densitymapbox(
-            lat=subdistrict_data['lat'],
-            lon=subdistrict_data['lon'],
-            z=subdistrict_data[rate_col],
-            radius=20,  # ลดขนาดเพื่อให้เห็นรายละเอียดตำบล
-            colorscale=colorscale,
-            zmin=0,
-            zmax=subdistrict_data[rate_col].max() if subdistrict_data[rate_col].max() > 0 else 1,
-            colorbar=dict(
-                title=dict(text='อัตรา (%)', font=dict(family='Sarabun', size=10)),
-                ticksuffix='%',
-                len=0.7
-            ),
-            hovertemplate=hovertemplate,
-            customdata=customdata
-        ))
+        if render == 'raster':
+            add_density_raster(fig, subdistrict_data['lat'], subdistrict_data['lon'],
+                               subdistrict_data[rate_col], colorscale)
+        else:
+            fig.add_trace(go.Densitymapbox(
+                lat=subdistrict_data['lat'],
+                lon=subdistrict_data['lon'],
+                z=subdistrict_data[rate_col],
+                radius=20,  # ลดขนาดเพื่อให้เห็นรายละเอียดตำบล
+                colorscale=colorscale,
+                zmin=0,
+                zmax=subdistrict_data[rate_col].max() if subdistrict_data[rate_col].max() > 0 else 1,
+                colorbar=dict(
+                    title=dict(text='อัตรา (%)', font=dict(family='Sarabun', size=10)),
+                    ticksuffix='%',
+                    len=0.7
+                ),
+                hovertemplate=hovertemplate,
+                customdata=customdata
+            ))
         
         fig.update_layout(
             title=None,
@@ -679,20 +2238,20 @@ def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='d
     
     # =============== สำหรับข้อมูลมรณบัตร - แสดงอัตราการเสียชีวิตรายอำเภอ ===============
     if data_type == 'death_cert':
-        if 'จังหวัด' not in filtered_df.columns or 'อำเภอ' not in filtered_df.columns:
+        if 'จังหวัด' not in cells.columns or 'อำเภอ' not in cells.columns:
             fig = go.Figure()
             fig.add_annotation(text="ไม่มีข้อมูลจังหวัด/อำเภอ", showarrow=False)
             fig.update_layout(height=400)
             return fig
         
-        if 'สรุป' not in filtered_df.columns:
+        if 'สรุป' not in cells.columns:
             fig = go.Figure()
             fig.add_annotation(text="ไม่มีคอลัมน์ 'สรุป' ในข้อมูล", showarrow=False)
             fig.update_layout(height=400)
             return fig
         
         # รวมจำนวนเสียชีวิต (สรุป) ตามจังหวัด+อำเภอ
-        district_data = filtered_df.groupby(['จังหวัด', 'อำเภอ']).agg({
+        district_data = cells.groupby(['จังหวัด', 'อำเภอ'], observed=True).agg({
             'สรุป': 'sum'
         }).reset_index()
         district_data.columns = ['จังหวัด', 'อำเภอ', 'จำนวนเสียชีวิต']
@@ -708,56 +2267,20 @@ def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='d
         district_data['อัตราการเสียชีวิต'] = (district_data['จำนวนเสียชีวิต'] * 100 / total_deaths).round(2)
         
         # ใช้ Centroid จาก Shapefile ถ้ามี
-        if HAS_DEATH_SHAPEFILE and gdf_death is not None:
-            amp_col = None
-            prov_col = None
-            
-            for col in gdf_death.columns:
-                if col in ['อำเ', 'AMP_TH', 'AMPHOE', 'อำเภอ', 'AMP_NAME', 'NAME_2', 'DISTRICT', 'AP_TH']:
-                    amp_col = col
-                if col in ['PRO_TH', 'PROVINCE', 'จังหวัด', 'PRO_NAME', 'NAME_1', 'PROV_NAM_T', 'PV_TH']:
-                    prov_col = col
-            
-            if amp_col:
-                gdf_centroids = gdf_death.copy()
-                gdf_centroids['centroid'] = gdf_centroids.geometry.centroid
-                gdf_centroids['lon'] = gdf_centroids['centroid'].x
-                gdf_centroids['lat'] = gdf_centroids['centroid'].y
-                
-                district_coords = {}
-                for _, row in gdf_centroids.iterrows():
-                    amp_name = str(row.get(amp_col, '')).strip()
-                    prov_name = str(row.get(prov_col, '')).strip() if prov_col else ''
-                    if amp_name:
-                        key = f"{prov_name}_{amp_name}"
-                        district_coords[key] = {'lat': row['lat'], 'lon': row['lon']}
-                
-                def get_district_coords(row):
-                    key = f"{row['จังหวัด']}_{row['อำเภอ']}"
-                    if key in district_coords:
-                        return pd.Series([district_coords[key]['lat'], district_coords[key]['lon']])
-                    for k, v in district_coords.items():
-                        if row['อำเภอ'] in k:
-                            return pd.Series([v['lat'], v['lon']])
-                    prov_coord = PROVINCE_COORDS.get(row['จังหวัด'], [None, None])
-                    return pd.Series([prov_coord[1], prov_coord[0]])
-                
-                district_data[['lat', 'lon']] = district_data.apply(get_district_coords, axis=1)
+        if data.HAS_DEATH_SHAPEFILE and data.gdf_death is not None:
+            if data.DEATH_GAZETTEER is not None:
+                # พิกัด centroid ของอำเภอจาก Gazetteer (ชื่อที่จับคู่ไม่ได้ใช้พิกัดจังหวัด)
+                lat, lon = data.DEATH_GAZETTEER.locate(district_data, ['จังหวัด', 'อำเภอ'])
+                district_data['lat'] = lat
+                district_data['lon'] = lon
             else:
-                district_data['lat'] = district_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1])
-                district_data['lon'] = district_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0])
+                district_data['lat'] = district_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1]).astype(float)
+                district_data['lon'] = district_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0]).astype(float)
         else:
-            district_data['lat'] = district_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[1])
-            district_data['lon'] = district_data['จังหวัด'].map(lambda x: PROVINCE_COORDS.get(x, [None, None])[0])
-            
-            for prov in district_data['จังหวัด'].unique():
-                mask = district_data['จังหวัด'] == prov
-                n_districts = mask.sum()
-                if n_districts > 1:
-                    offsets = np.linspace(-0.15, 0.15, n_districts)
-                    np.random.shuffle(offsets)
-                    district_data.loc[mask, 'lat'] = district_data.loc[mask, 'lat'] + offsets[:n_districts]
-                    district_data.loc[mask, 'lon'] = district_data.loc[mask, 'lon'] + offsets[:n_districts] * 0.5
+            lat, lon = fallback_area_coordinates(district_data, ['จังหวัด', 'อำเภอ'],
+                                                 lat_spread=0.15, lon_spread=0.075)
+            district_data['lat'] = lat
+            district_data['lon'] = lon
         
         district_data = district_data.dropna(subset=['lat', 'lon'])
         
@@ -769,25 +2292,29 @@ def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='d
         
         fig = go.Figure()
         
-        fig.add_trace(go.Densitymapbox(
-            lat=district_data['lat'],
-            lon=district_data['lon'],
-            z=district_data['อัตราการเสียชีวิต'],
-            radius=25,
-            colorscale='Reds',
-            zmin=0,
-            zmax=district_data['อัตราการเสียชีวิต'].max(),
-            colorbar=dict(
-                title=dict(text='อัตรา (%)', font=dict(family='Sarabun', size=10)),
-                ticksuffix='%',
-                len=0.7
-            ),
-            hovertemplate="<b>จังหวัด: %{customdata[0]}</b><br>" +
-                          "อำเภอ: %{customdata[1]}<br>" +
-                          "จำนวน: %{customdata[2]:,} ราย<br>" +
-                          "อัตรา: %{z:.2f}%<extra></extra>",
-            customdata=district_data[['จังหวัด', 'อำเภอ', 'จำนวนเสียชีวิต']].values
-        ))
+        if render == 'raster':
+            add_density_raster(fig, district_data['lat'], district_data['lon'],
+                               district_data['อัตราการเสียชีวิต'], 'Reds')
+        else:
+            fig.add_trace(go.Densitymapbox(
+                lat=district_data['lat'],
+                lon=district_data['lon'],
+                z=district_data['อัตราการเสียชีวิต'],
+                radius=25,
+                colorscale='Reds',
+                zmin=0,
+                zmax=district_data['อัตราการเสียชีวิต'].max(),
+                colorbar=dict(
+                    title=dict(text='อัตรา (%)', font=dict(family='Sarabun', size=10)),
+                    ticksuffix='%',
+                    len=0.7
+                ),
+                hovertemplate="<b>จังหวัด: %{customdata[0]}</b><br>" +
+                              "อำเภอ: %{customdata[1]}<br>" +
+                              "จำนวน: %{customdata[2]:,} ราย<br>" +
+                              "อัตรา: %{z:.2f}%<extra></extra>",
+                customdata=district_data[['จังหวัด', 'อำเภอ', 'จำนวนเสียชีวิต']].values
+            ))
         
         fig.update_layout(
             title=None,
@@ -816,36 +2343,33 @@ def create_shapefile_heatmap(filtered_df, map_type='deceased_rate', data_type='d
     return fig
 
 # =============== ฟังก์ชันกำหนด class จากค่า attribute 'สรุ' ===============
-def get_class_from_attribute(value):
-    if pd.isna(value) or value == 0:
-        return 0
-    elif value == 1:
-        return 1
-    elif value == 2:
-        return 2
-    elif value == 3:
-        return 3
-    elif value == 4:
-        return 4
-    else:
-        return 5
+def get_class_from_attribute(values):
+    """แปลงค่า 'สรุ' ทั้งคอลัมน์เป็น class 0-5 (0 = ไม่มีรายงาน, 5 = ตั้งแต่ 5 ครั้งขึ้นไป)"""
+    values = pd.to_numeric(pd.Series(values), errors='coerce').fillna(0)
+    classes = np.where(values.isin([1, 2, 3, 4]), values, 5)
+    classes = np.where(values == 0, 0, classes)
+    return pd.Series(classes.astype(int), index=values.index)
 
 # =============== ฟังก์ชันสร้างแผนที่ Choropleth จาก Shapefile โดยตรง ===============
 def create_choropleth_from_shapefile(data_type='drowning'):
+    import folium
+    from branca.element import Element
+    
+    data = current_data()
     m = folium.Map(location=[13.7563, 100.5018], zoom_start=6, tiles='cartodbpositron')
     
     if data_type == 'death_cert':
-        if not HAS_DEATH_SHAPEFILE or gdf_death is None:
+        if not data.HAS_DEATH_SHAPEFILE or data.gdf_death is None:
             return _create_fallback_map("ไม่พบ Shapefile มรณบัตร (case_death.shp)")
         
-        gdf = gdf_death.copy()
+        gdf = get_simplified_gdf('death_cert', CHOROPLETH_ZOOM)
         title_text = "จำนวนครั้งที่เกิดเหตุจมน้ำเสียชีวิต (2563-2567)"
         area_level = "อำเภอ"
     else:
-        if not HAS_DROWNING_SHAPEFILE or gdf_drowning is None:
+        if not data.HAS_DROWNING_SHAPEFILE or data.gdf_drowning is None:
             return _create_fallback_map("ไม่พบ Shapefile การจมน้ำ (case_drowning.shp)")
         
-        gdf = gdf_drowning.copy()
+        gdf = get_simplified_gdf('drowning', CHOROPLETH_ZOOM)
         title_text = "จำนวนครั้งที่เกิดเหตุจมน้ำเสียชีวิต (2563-2568)"
         area_level = "ตำบล"
     
@@ -862,9 +2386,6 @@ def create_choropleth_from_shapefile(data_type='drowning'):
     
     print(f"ใช้คอลัมน์: {summary_col}")
     
-    gdf['class'] = gdf[summary_col].apply(get_class_from_attribute)
-    gdf['color'] = gdf['class'].map(CHOROPLETH_COLORS)
-    
     name_col = None
     if data_type == 'death_cert':
         possible_name_cols = ['อำเ', 'AMP_TH', 'AMPHOE', 'อำเภอ', 'AMP_NAME', 'NAME_2', 'DISTRICT', 'AP_TH']
@@ -883,40 +2404,37 @@ def create_choropleth_from_shapefile(data_type='drowning'):
             prov_col = col
             break
     
-    for idx, row in gdf.iterrows():
-        if row.geometry is None:
-            continue
-        
-        area_name = row.get(name_col, 'N/A') if name_col else 'N/A'
-        prov_name = row.get(prov_col, 'N/A') if prov_col else 'N/A'
-        summary_value = row.get(summary_col, 0)
-        if pd.isna(summary_value):
-            summary_value = 0
-        
-        popup_text = f"""
-        <div style="font-family: Sarabun, sans-serif;">
-            <b>จังหวัด:</b> {prov_name}<br>
-            <b>{area_level}:</b> {area_name}<br>
-            <b>จำนวนครั้ง:</b> {int(summary_value)} ครั้ง
-        </div>
-        """
-        
-        fill_color = row['color']
-        
-        try:
-            folium.GeoJson(
-                row.geometry.__geo_interface__,
-                style_function=lambda x, fc=fill_color: {
-                    'fillColor': fc,
-                    'color': '#666666',
-                    'weight': 0.5,
-                    'fillOpacity': 0.7
-                },
-                popup=folium.Popup(popup_text, max_width=250)
-            ).add_to(m)
-        except Exception as e:
-            print(f"Error adding geometry {idx}: {e}")
-            continue
+    # รวมทุกพื้นที่เป็น FeatureCollection เดียว เก็บเฉพาะ property ที่ใช้แสดงผล
+    summary_values = pd.to_numeric(gdf[summary_col], errors='coerce').fillna(0)
+    classes = get_class_from_attribute(summary_values)
+    
+    features = gpd.GeoDataFrame({
+        'class': classes,
+        'color': classes.map(CHOROPLETH_COLORS),
+        'province': gdf[prov_col].astype(str) if prov_col else 'N/A',
+        'area': gdf[name_col].astype(str) if name_col else 'N/A',
+        'count_label': summary_values.astype(int).astype(str) + ' ครั้ง',
+    }, geometry=gdf.geometry, crs=gdf.crs)
+    features = features[features.geometry.notna() & ~features.geometry.is_empty].reset_index(drop=True)
+    
+    # ใช้ GeoJson layer เดียว สีและ popup อ่านจาก property ของแต่ละ feature
+    folium.GeoJson(
+        features.to_json(),
+        name=area_level,
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['color'],
+            'color': '#666666',
+            'weight': 0.5,
+            'fillOpacity': 0.7
+        },
+        popup=folium.GeoJsonPopup(
+            fields=['province', 'area', 'count_label'],
+            aliases=['จังหวัด:', f'{area_level}:', 'จำนวนครั้ง:'],
+            labels=True,
+            max_width=250,
+            style="font-family: Sarabun, sans-serif;"
+        )
+    ).add_to(m)
     
     legend_css = '''
     <style>
@@ -1004,10 +2522,10 @@ def create_choropleth_from_shapefile(data_type='drowning'):
     m.get_root().html.add_child(Element(legend_content))
     
     logo_img_tags = ""
-    if LOGO_GD_BASE64:
-        logo_img_tags += f'<img src="{LOGO_GD_BASE64}" style="height: 40px; width: auto;">'
-    if LOGO_KK_BASE64:
-        logo_img_tags += f'<img src="{LOGO_KK_BASE64}" style="height: 40px; width: auto;">'
+    if data.LOGO_GD_BASE64:
+        logo_img_tags += f'<img src="{data.LOGO_GD_BASE64}" style="height: 40px; width: auto;">'
+    if data.LOGO_KK_BASE64:
+        logo_img_tags += f'<img src="{data.LOGO_KK_BASE64}" style="height: 40px; width: auto;">'
     
     if logo_img_tags:
         logo_html = f'''
@@ -1042,6 +2560,8 @@ def create_choropleth_from_shapefile(data_type='drowning'):
     return m._repr_html_()
 
 def _create_fallback_map(message):
+    import folium
+    
     m = folium.Map(location=[13.7563, 100.5018], zoom_start=6, tiles='cartodbpositron')
     
     error_html = f'''
@@ -1061,11 +2581,883 @@ def _create_fallback_map(message):
     </div>
     '''
     m.get_root().html.add_child(folium.Element(error_html))
-    
+
     return m._repr_html_()
 
+# =============== แคชแผนที่ Choropleth (สร้างครั้งเดียวต่อเวอร์ชัน Shapefile) ===============
+# แผนที่ Choropleth ไม่ขึ้นกับตัวกรองใดๆ จึงสร้างครั้งเดียวแล้วเก็บไว้ทั้งในหน่วยความจำและบนดิสก์
+# key ของแคชคำนวณจาก path, mtime, size ของ Shapefile ที่โหลดไว้ จะสร้างใหม่เมื่อ Shapefile เปลี่ยนเท่านั้น
+MAP_CACHE_DIR = os.path.join(DATA_DIR, ".map_cache")
+CHOROPLETH_CACHE_VERSION = 3  # เพิ่มเลขนี้เมื่อแก้ไขวิธีสร้างแผนที่ เพื่อให้แคชเดิมหมดอายุ
+
+_choropleth_html_cache = {}
+_choropleth_cache_lock = threading.Lock()
+
+def _choropleth_cache_key(data_type):
+    data = current_data()
+    if data_type == 'death_cert':
+        signature = data.DEATH_SHAPEFILE_SIGNATURE
+    else:
+        signature = data.DROWNING_SHAPEFILE_SIGNATURE
+    raw = json.dumps([data_type, CHOROPLETH_CACHE_VERSION, signature,
+                      SIMPLIFY_TOLERANCE_BY_ZOOM[CHOROPLETH_ZOOM], COORDINATE_PRECISION], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def get_choropleth_html(data_type='drowning'):
+    """คืนค่า HTML ของแผนที่ Choropleth จากแคช (สร้างใหม่เฉพาะเมื่อยังไม่มีในแคช)"""
+    key = _choropleth_cache_key(data_type)
+
+    cached = _choropleth_html_cache.get(data_type)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with _choropleth_cache_lock:
+        cached = _choropleth_html_cache.get(data_type)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        cache_path = os.path.join(MAP_CACHE_DIR, f"choropleth_{data_type}_{key}.html")
+        map_html = None
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    map_html = f.read()
+                print(f"โหลดแผนที่ {data_type} จากแคช: {cache_path}")
+            except OSError as e:
+                print(f"ไม่สามารถอ่านแคชแผนที่ {cache_path}: {e}")
+
+        if map_html is None:
+            start = time.perf_counter()
+            map_html = create_choropleth_from_shapefile(data_type)
+            print(f"สร้างแผนที่ {data_type} ใหม่ ({time.perf_counter() - start:.2f} วินาที)")
+
+            try:
+                os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+                # เขียนไฟล์ชั่วคราวแล้ว rename เพื่อไม่ให้ worker อื่นอ่านไฟล์ที่เขียนไม่เสร็จ
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(map_html)
+                os.replace(tmp_path, cache_path)
+
+                # ลบแคชเวอร์ชันเก่าของแผนที่ประเภทเดียวกัน
+                prefix = f"choropleth_{data_type}_"
+                for name in os.listdir(MAP_CACHE_DIR):
+                    if name.startswith(prefix) and name.endswith('.html') and name != os.path.basename(cache_path):
+                        os.remove(os.path.join(MAP_CACHE_DIR, name))
+            except OSError as e:
+                print(f"ไม่สามารถบันทึกแคชแผนที่ {cache_path}: {e}")
+
+        _choropleth_html_cache[data_type] = (key, map_html)
+        return map_html
+
+# =============== ส่งแผนที่ Folium ผ่าน URL ===============
+# Iframe โหลดแผนที่จาก route นี้แทนการส่ง HTML ขนาดใหญ่กลับไปใน callback ทุกครั้ง
+# URL มีเวอร์ชันของแคชอยู่ด้วย browser จึงเก็บแผนที่ไว้ได้จนกว่า Shapefile จะเปลี่ยน
+MAP_NAMES = ('drowning', 'death_cert', 'empty')
+
+def get_map_html(name):
+    """HTML ของแผนที่ตามชื่อ ('empty' = แผนที่เปล่าเมื่อไม่มีข้อมูลตามตัวกรอง)"""
+    if name == 'empty':
+        cached = _choropleth_html_cache.get('empty')
+        if cached is None:
+            import folium
+            empty_map = folium.Map(location=[13.7563, 100.5018], zoom_start=6)
+            cached = ('empty', empty_map._repr_html_())
+            _choropleth_html_cache['empty'] = cached
+        return cached[1]
+    return get_choropleth_html(name)
+
+def get_map_version(name):
+    """เวอร์ชันของแผนที่ที่ process นี้ใช้อยู่ (ค่า ?v= ใน URL ของแผนที่)"""
+    return 'empty' if name == 'empty' else _choropleth_cache_key(name)
+
+def get_map_src(name):
+    return app.get_relative_path(f"/maps/{name}.html") + f"?v={get_map_version(name)}"
+
+def get_map_name_from_src(src):
+    """ชื่อแผนที่จาก URL ที่ตั้งให้ Iframe (ใช้ตอน Export)"""
+    name = os.path.basename(urlparse(src).path)
+    if name.endswith('.html'):
+        name = name[:-len('.html')]
+    return name if name in MAP_NAMES else None
+
+@server.route('/maps/<name>.html')
+def serve_map(name):
+    if name not in MAP_NAMES:
+        abort(404)
+    response = Response(get_map_html(name), mimetype='text/html')
+    # แคชนานได้เฉพาะเมื่อ ?v= ตรงกับแผนที่ที่ส่งจริง worker ที่ยังไม่ reload Shapefile ชุดใหม่
+    # จะส่งแผนที่ชุดเดิมโดยห้ามแคช ไม่ให้ browser/proxy เก็บแผนที่เก่าไว้ภายใต้ URL ของเวอร์ชันใหม่
+    if request.args.get('v') == get_map_version(name):
+        response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# =============== แคชผลลัพธ์ของ Dashboard (LRU ตามชุดตัวกรอง) ===============
+# ผลลัพธ์ของ Dashboard ขึ้นกับชุดตัวกรองและเวอร์ชันข้อมูลเท่านั้น จึงเก็บไว้ตาม key ที่ normalize แล้ว
+# - backend 'memory': OrderedDict ภายใน process (แต่ละ gunicorn worker มีแคชของตัวเอง)
+# - backend 'disk': ไฟล์ pickle ในโฟลเดอร์เดียวกันที่ทุก worker ใช้ร่วมกัน
+#   (ตั้ง RESULT_CACHE_DIR=/dev/shm/... เพื่อให้อยู่ใน shared memory ของเครื่อง)
+# key ผูกกับ DATA_VERSION เมื่อไฟล์ข้อมูลหรือ Shapefile เปลี่ยน ผลลัพธ์เดิมทั้งหมดจะหมดอายุ
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(DATA_DIR, '.result_cache'))
+RESULT_CACHE_VERSION = 1  # เพิ่มเลขนี้เมื่อแก้ไขรูปแบบผลลัพธ์ของ Dashboard
+
+def get_source_signatures():
+    """ลายเซ็นของไฟล์ต้นฉบับทั้งหมด (Excel 2 ไฟล์ และ Shapefile 2 ชุด) ตามลำดับ"""
+    return (
+        get_file_signature(DROWNING_EXCEL_PATH),
+        get_file_signature(DEATH_CERT_EXCEL_PATH),
+        get_shapefile_signature(DROWNING_SHAPEFILE_PATH) if HAS_GEOPANDAS else None,
+        get_shapefile_signature(DEATH_SHAPEFILE_PATH) if HAS_GEOPANDAS else None,
+    )
+
+def compute_data_version(source_signatures, store_files=None):
+    """เวอร์ชันของข้อมูล คำนวณจากลายเซ็นของไฟล์ Excel และ Shapefile และไฟล์ในที่เก็บข้อมูล (delta ที่ ingest แล้ว)"""
+    raw = repr([RESULT_CACHE_VERSION, DATA_CACHE_VERSION, *source_signatures, store_files])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+SOURCE_SIGNATURES = get_source_signatures()  # ลายเซ็นของไฟล์ที่ข้อมูลชุดปัจจุบันโหลดมา
+DATA_VERSION = compute_data_version(SOURCE_SIGNATURES)
+
+class ResultCache:
+    """แคชผลลัพธ์ขนาดจำกัด ไล่รายการที่ใช้งานล่าสุดนานที่สุดออกก่อน (LRU) พร้อมตัวนับ hit/miss"""
+    
+    def __init__(self, maxsize=256, backend='memory', cache_dir=None, version=''):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if self.backend == 'disk':
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._remove_stale_files()
+            except OSError as e:
+                print(f"ไม่สามารถใช้โฟลเดอร์แคชผลลัพธ์ {self.cache_dir}: {e} - ใช้หน่วยความจำแทน")
+                self.backend = 'memory'
+    
+    def _file_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{self.version}_{digest}.pkl")
+    
+    def _disk_files(self):
+        prefix = f"{self.version}_"
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.startswith(prefix) and name.endswith('.pkl')]
+    
+    def _remove_stale_files(self):
+        """ลบไฟล์แคชของเวอร์ชันข้อมูลอื่น"""
+        prefix = f"{self.version}_"
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl') and not name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+    
+    def set_version(self, version):
+        """เปลี่ยนเวอร์ชันข้อมูล ผลลัพธ์ของเวอร์ชันเดิมทั้งหมดจะใช้ไม่ได้อีก"""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+            if self.backend == 'disk':
+                try:
+                    self._remove_stale_files()
+                except OSError as e:
+                    print(f"ไม่สามารถล้างแคชผลลัพธ์เดิม: {e}")
+            print(f"ล้างแคชผลลัพธ์ (เวอร์ชันข้อมูล {version})")
+    
+    def get(self, key, version=None):
+        """คืนค่าผลลัพธ์ที่เก็บไว้ หรือ None ถ้าไม่มีในแคช (ถ้าระบุ version ที่ไม่ใช่เวอร์ชันของแคชถือว่าไม่มี)"""
+        if version is not None and version != self.version:
+            with self._lock:
+                self.misses += 1
+            return None
+        if self.backend == 'disk':
+            path = self._file_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path)  # ใช้ mtime เป็นเวลาที่ใช้งานล่าสุดสำหรับ LRU
+            except (OSError, EOFError, pickle.UnpicklingError):
+                with self._lock:
+                    self.misses += 1
+                return None
+            with self._lock:
+                self.hits += 1
+            return value
+        
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key, value, version=None):
+        """เก็บผลลัพธ์ (ถ้าระบุ version ที่ใช้คำนวณแล้วข้อมูลถูกสลับไประหว่างนั้น จะไม่เก็บ)"""
+        if version is not None and version != self.version:
+            return
+        if self.backend == 'disk':
+            path = self._file_path(key)
+            try:
+                # เขียนไฟล์ชั่วคราวแล้ว rename เพื่อไม่ให้ worker อื่นอ่านไฟล์ที่เขียนไม่เสร็จ
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                
+                files = self._disk_files()
+                if len(files) > self.maxsize:
+                    files.sort(key=lambda p: os.stat(p).st_mtime_ns)
+                    for old_path in files[:len(files) - self.maxsize]:
+                        os.remove(old_path)
+                        with self._lock:
+                            self.evictions += 1
+            except OSError as e:
+                print(f"ไม่สามารถบันทึกแคชผลลัพธ์ {path}: {e}")
+            return
+        
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def stats(self):
+        """ตัวนับของแคช (สำหรับ backend 'disk' ตัวนับเป็นของ worker นี้เท่านั้น)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            if self.backend == 'disk':
+                try:
+                    size = len(self._disk_files())
+                except OSError:
+                    size = 0
+            else:
+                size = len(self._entries)
+            return {
+                'backend': self.backend,
+                'version': self.version,
+                'size': size,
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            }
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_BACKEND, RESULT_CACHE_DIR, DATA_VERSION)
+
+def get_cube(active_tab, data=None):
+    data = data or current_data()
+    return data.DEATH_CERT_CUBE if active_tab == "death-cert-tab" else data.DROWNING_CUBE
+
+def build_filter_state(active_tab, province, district, subdistrict, zone,
+                       dc_province, dc_district, dc_zone, month, year, age):
+    """
+    สถานะตัวกรองที่ normalize แล้ว (เก็บใน dcc.Store 'filter-state')
+    เก็บเฉพาะตัวกรองที่ Tab นั้นใช้จริง เช่น Tab มรณบัตรไม่ขึ้นกับตัวกรองของ Tab การจมน้ำ
+    """
+    def norm(dim, value):
+        if value is None or value == 'ALL':
+            return 'ALL'
+        return FilterIndex._normalize_value(dim, value)
+    
+    if active_tab == "death-cert-tab":
+        criteria = {'province': dc_province, 'district': dc_district, 'zone': dc_zone}
+    else:
+        active_tab = "drowning-tab"
+        criteria = {'province': province, 'district': district, 'subdistrict': subdistrict, 'zone': zone}
+    criteria.update(month=month, year=year, age=age)
+    criteria = {dim: norm(dim, value) for dim, value in criteria.items()}
+    
+    return {
+        'tab': active_tab,
+        'criteria': criteria,
+        'has_data': get_selection(active_tab, criteria).has_data,
+    }
+
+def filter_state_key(state):
+    """key ของแคชผลลัพธ์จาก filter-state"""
+    return (state['tab'],) + tuple(sorted(state['criteria'].items()))
+
+# =============== Selection ที่ใช้ร่วมกันต่อชุดตัวกรอง ===============
+# ทุก callback ที่ขึ้นกับ filter-state ใช้ Selection เดียวกัน: เซลล์ของ cube สำหรับส่วนสรุปผลและ Heatmap
+# และแถวของข้อมูลดิบสำหรับส่วนวิเคราะห์การอยู่กับใคร กรองครั้งเดียวต่อชุดตัวกรองแล้วเก็บไว้ในหน่วยความจำ
+SELECTION_CACHE_SIZE = 32
+
+class Selection:
+    """ผลการกรองของชุดตัวกรองหนึ่ง (แถวของข้อมูลดิบดึงเมื่อมีส่วนที่ต้องใช้ครั้งแรก)"""
+    
+    def __init__(self, tab, criteria):
+        self.tab = tab
+        self.criteria = criteria
+        # cube และ index มาจาก snapshot เดียวกัน แถวที่ดึงภายหลังจึงไม่ปนกับข้อมูลที่ reload เข้ามาใหม่
+        data = current_data()
+        self.cells = get_cube(tab, data).query(**criteria)
+        self._index = data.DEATH_CERT_FILTER_INDEX if tab == "death-cert-tab" else data.DROWNING_FILTER_INDEX
+        self._frame = None
+    
+    @property
+    def has_data(self):
+        return len(self.cells) > 0
+    
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = self._index.filter(**self.criteria)
+        return self._frame
+
+SELECTION_CACHE = ResultCache(SELECTION_CACHE_SIZE, 'memory', version=DATA_VERSION)
+
+def get_selection(tab, criteria):
+    """Selection ของชุดตัวกรอง (สร้างใหม่เฉพาะเมื่อยังไม่มีในแคช)"""
+    key = (tab,) + tuple(sorted(criteria.items()))
+    version = current_data().DATA_VERSION
+    selection = SELECTION_CACHE.get(key, version)
+    if selection is None:
+        selection = Selection(tab, criteria)
+        SELECTION_CACHE.set(key, selection, version)
+    return selection
+
+@server.route('/cache-stats')
+def result_cache_stats():
+    return jsonify(RESULT_CACHE.stats())
+
+# =============== โหลดข้อมูลและสร้าง Index (eager / lazy ตาม STARTUP_MODE) ===============
+# eager     = โหลดทั้งหมดตอน import (ค่าเริ่มต้น เหมาะกับ script ที่ import โมดูลนี้ไปใช้ เช่น batch_export.py)
+# lazy      = import เสร็จทันที แล้วโหลดข้อมูลใน thread เบื้องหลัง คำขอที่มาก่อนโหลดเสร็จจะรอ
+# on-demand = โหลดเมื่อมีคำขอแรกที่ต้องใช้ข้อมูล
+STARTUP_MODES = ('eager', 'lazy', 'on-demand')
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'eager')
+if STARTUP_MODE not in STARTUP_MODES:
+    print(f"STARTUP_MODE '{STARTUP_MODE}' ไม่รองรับ - ใช้ eager แทน")
+    STARTUP_MODE = 'eager'
+
+STARTUP_TIMINGS = OrderedDict()  # ขั้นตอน -> วินาที
+_data_loaded = False
+_data_load_lock = threading.Lock()
+
+@contextmanager
+def startup_step(name):
+    """จับเวลาขั้นตอนหนึ่งของการเริ่มระบบ"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = time.perf_counter() - start
+
+_layout_cache = {}  # Layout ที่สร้างจากข้อมูลชุดปัจจุบัน (ล้างเมื่อ reload)
+
+def build_dashboard_data():
+    """
+    โหลดโลโก้ Shapefile ข้อมูล Excel แล้วสร้าง Gazetteer, Index และ Cube ชุดใหม่
+    คืนค่าเป็น dict ของตัวแปรระดับโมดูล โดยไม่แตะข้อมูลที่ใช้งานอยู่ (ใช้สร้างข้อมูลใหม่ระหว่าง reload ได้)
+    """
+    source_signatures = get_source_signatures()
+    
+    with startup_step('โลโก้'):
+        logo_gd = load_logo_base64(LOGO_GD_PATH)
+        logo_kk = load_logo_base64(LOGO_KK_PATH)
+    
+    with startup_step('Shapefile'):
+        new_gdf_drowning = load_shapefile(DROWNING_SHAPEFILE_PATH, 'การจมน้ำ')
+        new_gdf_death = load_shapefile(DEATH_SHAPEFILE_PATH, 'มรณบัตร')
+    
+    with startup_step('ข้อมูล Excel'):
+        new_df = load_drowning_data()
+        new_df_death_cert = load_death_cert_data()
+    
+    with startup_step('Gazetteer'):
+        drowning_gazetteer = build_gazetteer(new_gdf_drowning, DROWNING_GAZETTEER_COLUMNS, 'ตำบล')
+        death_gazetteer = build_gazetteer(new_gdf_death, DEATH_GAZETTEER_COLUMNS, 'อำเภอ')
+    
+    with startup_step('Spatial index'):
+        if new_gdf_drowning is not None:
+            assign_polygons_from_coordinates(new_df, 'drowning',
+                                             list(zip(['จังหวัด', 'อำเภอ', 'ตำบล'], DROWNING_GAZETTEER_COLUMNS)),
+                                             'ข้อมูลการจมน้ำ', gdf=new_gdf_drowning)
+        if new_gdf_death is not None:
+            assign_polygons_from_coordinates(new_df_death_cert, 'death_cert',
+                                             list(zip(['จังหวัด', 'อำเภอ'], DEATH_GAZETTEER_COLUMNS)),
+                                             'ข้อมูลมรณบัตร', gdf=new_gdf_death)
+    
+    # จับคู่ชื่อพื้นที่ที่มีในข้อมูลไว้ล่วงหน้า คำขอจึงไม่ต้องจับคู่เอง
+    with startup_step('จับคู่ชื่อพื้นที่'):
+        if drowning_gazetteer is not None and all(col in new_df.columns for col in ['จังหวัด', 'อำเภอ', 'ตำบล']):
+            drowning_gazetteer.prime(new_df, ['จังหวัด', 'อำเภอ', 'ตำบล'], 'drowning')
+        if death_gazetteer is not None and all(col in new_df_death_cert.columns for col in ['จังหวัด', 'อำเภอ']):
+            death_gazetteer.prime(new_df_death_cert, ['จังหวัด', 'อำเภอ'], 'death_cert')
+    
+    with startup_step('Filter index'):
+        drowning_filter_index = FilterIndex(new_df)
+        death_cert_filter_index = FilterIndex(new_df_death_cert)
+    
+    with startup_step('Cube'):
+        drowning_cube = AggregateCube(new_df, 'ข้อมูลการจมน้ำ')
+        death_cert_cube = AggregateCube(new_df_death_cert, 'ข้อมูลมรณบัตร')
+    
+    with startup_step('Hex index'):
+        drowning_hex_index = build_hex_index(drowning_cube, drowning_gazetteer,
+                                             ['จังหวัด', 'อำเภอ', 'ตำบล'], 'ข้อมูลการจมน้ำ')
+        death_cert_hex_index = build_hex_index(death_cert_cube, death_gazetteer,
+                                               ['จังหวัด', 'อำเภอ'], 'ข้อมูลมรณบัตร')
+    
+    store_files = new_df.attrs.get('store_files')
+    return {
+        'SOURCE_SIGNATURES': source_signatures,
+        'DATA_VERSION': compute_data_version(source_signatures, store_files),
+        'DROWNING_STORE_FILES': store_files,
+        'DROWNING_SHAPEFILE_SIGNATURE': source_signatures[2],
+        'DEATH_SHAPEFILE_SIGNATURE': source_signatures[3],
+        'LOGO_GD_BASE64': logo_gd,
+        'LOGO_KK_BASE64': logo_kk,
+        'gdf_drowning': new_gdf_drowning,
+        'HAS_DROWNING_SHAPEFILE': new_gdf_drowning is not None,
+        'gdf_death': new_gdf_death,
+        'HAS_DEATH_SHAPEFILE': new_gdf_death is not None,
+        'df': new_df,
+        'df_death_cert': new_df_death_cert,
+        'DROWNING_GAZETTEER': drowning_gazetteer,
+        'DEATH_GAZETTEER': death_gazetteer,
+        'DROWNING_FILTER_INDEX': drowning_filter_index,
+        'DEATH_CERT_FILTER_INDEX': death_cert_filter_index,
+        'DROWNING_CUBE': drowning_cube,
+        'DEATH_CERT_CUBE': death_cert_cube,
+        'DROWNING_HEX_INDEX': drowning_hex_index,
+        'DEATH_CERT_HEX_INDEX': death_cert_hex_index,
+    }
+
+# =============== Snapshot ของข้อมูลที่ใช้ตอบคำขอ ===============
+# ข้อมูลทั้งชุด (ตาราง, Index, Cube, Gazetteer, Hex index, Shapefile) อยู่ใน DashboardData ก้อนเดียว
+# สลับชุดใหม่ด้วยการกำหนด DASHBOARD_DATA ครั้งเดียว และแต่ละคำขออ่าน DASHBOARD_DATA ครั้งเดียวผ่าน current_data
+# คำขอที่ทำงานคร่อมการสลับจึงใช้ข้อมูลชุดเดิมทั้งชุดจนจบ ไม่เห็นของสองชุดปนกัน
+# ตัวแปรระดับโมดูล (df, DROWNING_CUBE, ...) อัปเดตตามหลังสลับ ใช้ได้เฉพาะ script ที่ไม่มีการ reload ระหว่างทำงาน
+DASHBOARD_DATA_KEYS = (
+    'SOURCE_SIGNATURES', 'DATA_VERSION', 'DROWNING_STORE_FILES',
+    'DROWNING_SHAPEFILE_SIGNATURE', 'DEATH_SHAPEFILE_SIGNATURE', 'LOGO_GD_BASE64', 'LOGO_KK_BASE64',
+    'gdf_drowning', 'HAS_DROWNING_SHAPEFILE', 'gdf_death', 'HAS_DEATH_SHAPEFILE', 'df', 'df_death_cert',
+    'DROWNING_GAZETTEER', 'DEATH_GAZETTEER', 'DROWNING_FILTER_INDEX', 'DEATH_CERT_FILTER_INDEX',
+    'DROWNING_CUBE', 'DEATH_CERT_CUBE', 'DROWNING_HEX_INDEX', 'DEATH_CERT_HEX_INDEX',
+)
+
+class DashboardData:
+    """ข้อมูลชุดหนึ่ง (attribute ชื่อเดียวกับตัวแปรระดับโมดูล) ไม่แก้ไขหลังสร้าง ชุดใหม่สร้างด้วย replace"""
+    
+    def __init__(self, values):
+        self.__dict__.update(values)
+    
+    def replace(self, changes):
+        """snapshot ใหม่ที่แทนค่าเฉพาะส่วนใน changes (เช่น ผลของ build_drowning_increment)"""
+        return DashboardData({**self.__dict__, **changes})
+
+DASHBOARD_DATA = DashboardData({key: globals()[key] for key in DASHBOARD_DATA_KEYS})
+
+def current_data():
+    """snapshot ของคำขอปัจจุบัน (อ่าน DASHBOARD_DATA ครั้งแรกแล้วใช้ชุดเดิมจนจบคำขอ) นอกคำขอคืนค่าชุดล่าสุด"""
+    if not has_request_context():
+        return DASHBOARD_DATA
+    if 'dashboard_data' not in g:
+        g.dashboard_data = DASHBOARD_DATA
+    return g.dashboard_data
+
+def install_dashboard_data(data):
+    """
+    สลับข้อมูลชุดใหม่เข้าแทนชุดเดิม (data อาจมีเฉพาะส่วนที่เปลี่ยน) ด้วยการกำหนด DASHBOARD_DATA ครั้งเดียว
+    แล้วอัปเดตตัวแปรระดับโมดูลและล้างแคชที่ผูกกับเวอร์ชันข้อมูล
+    """
+    global DASHBOARD_DATA
+    DASHBOARD_DATA = DASHBOARD_DATA.replace(data)
+    globals().update(data)
+    _layout_cache.clear()
+    RESULT_CACHE.set_version(data['DATA_VERSION'])
+    SELECTION_CACHE.set_version(data['DATA_VERSION'])
+
+def load_dashboard_data():
+    """โหลดข้อมูลทั้งหมดแล้วเริ่มใช้งาน (เรียกผ่าน ensure_data_loaded เท่านั้น)"""
+    install_dashboard_data(build_dashboard_data())
+
+def ensure_data_loaded():
+    """โหลดข้อมูลครั้งเดียวต่อ process (thread อื่นที่เรียกพร้อมกันจะรอจนโหลดเสร็จ)"""
+    global _data_loaded
+    if _data_loaded:
+        return
+    with _data_load_lock:
+        if _data_loaded:
+            return
+        start = time.perf_counter()
+        try:
+            load_dashboard_data()
+        except Exception as e:
+            print(f"Error โหลดข้อมูลแดชบอร์ด: {e}")
+            import traceback
+            traceback.print_exc()
+        _data_loaded = True
+        steps = ', '.join(f"{name} {seconds:.2f}" for name, seconds in STARTUP_TIMINGS.items() if name != 'import')
+        print(f"โหลดข้อมูลใช้เวลา {time.perf_counter() - start:.2f} วินาที ({steps})")
+
+# ไฟล์ JS/CSS ของ Dash และสถานะการเริ่มระบบไม่ต้องใช้ข้อมูล จึงตอบได้ทันทีระหว่างที่ข้อมูลยังโหลดอยู่
+NO_DATA_PATH_PARTS = ('/_dash-component-suites/', '/assets/', '/_favicon.ico', '/_reload-hash',
+                      '/startup-stats', '/data-version')
+
+def request_needs_data():
+    """คำขอปัจจุบันต้องใช้ข้อมูลหรือไม่ (นอก request เช่นตอน import ถือว่าไม่ต้องใช้)"""
+    return has_request_context() and not any(part in request.path for part in NO_DATA_PATH_PARTS)
+
+@server.before_request
+def wait_for_data():
+    if request_needs_data():
+        ensure_data_loaded()
+        DATA_RELOADER.ensure_started()
+
+@server.after_request
+def add_data_version_header(response):
+    """ทุก response บอกเวอร์ชันข้อมูลที่ใช้ตอบ (ดูได้ว่า worker ไหนยังใช้ข้อมูลชุดเดิม)"""
+    response.headers['X-Data-Version'] = current_data().DATA_VERSION
+    return response
+
+@server.route('/startup-stats')
+def startup_stats():
+    return jsonify({
+        'mode': STARTUP_MODE,
+        'import_seconds': round(STARTUP_TIMINGS.get('import', 0), 3),
+        'data_loaded': _data_loaded,
+        'steps': {name: round(seconds, 3) for name, seconds in STARTUP_TIMINGS.items() if name != 'import'},
+    })
+
+# =============== Reload ข้อมูลเมื่อไฟล์ต้นฉบับเปลี่ยน (ไม่ต้อง restart worker) ===============
+# thread ตรวจลายเซ็น (path, mtime, size) ของไฟล์ Excel และ Shapefile ทุก DATA_WATCH_INTERVAL วินาที
+# เมื่อไฟล์เปลี่ยนและลายเซ็นคงที่แล้ว 1 รอบ (คัดลอกไฟล์เสร็จแล้ว) จะสร้างข้อมูลชุดใหม่ใน thread นั้น
+# ระหว่างสร้าง คำขอยังใช้ข้อมูลชุดเดิม เสร็จแล้วสลับเข้าทีเดียวด้วย install_dashboard_data
+# แต่ละ worker มี thread ของตัวเอง ไฟล์ Arrow ที่ worker แรกสร้างจาก Excel ใหม่ worker อื่นเปิดใช้ได้ทันทีไม่ต้องอ่าน Excel ซ้ำ
+# thread เดียวกันตรวจ .current ด้วย: delta ที่ ingest จาก worker อื่นหรือ ingest.py จะถูกนำเข้าแบบ incremental
+DATA_WATCH_INTERVAL = float(os.environ.get('DATA_WATCH_INTERVAL', '10'))  # วินาที (0 = ไม่ตรวจ)
+
+class DataReloader:
+    """ตรวจไฟล์ต้นฉบับเป็นระยะ แล้ว reload ข้อมูลทั้งชุดเมื่อไฟล์เปลี่ยน"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.reloads = 0
+        self.ingests = 0
+        self.last_reload = None
+        self.last_error = None
+        self._failed_signatures = None
+        self._failed_store = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def ensure_started(self):
+        """เริ่ม thread ตรวจไฟล์ใน process นี้ (worker ที่ fork มาไม่มี thread ของ process หลัก จึงต้องเริ่มเอง)"""
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._watch, name='data-watcher', daemon=True).start()
+    
+    def _watch(self):
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            try:
+                signatures = get_source_signatures()
+            except Exception as e:
+                print(f"ไม่สามารถตรวจไฟล์ข้อมูล: {e}")
+                continue
+            
+            if signatures in (DASHBOARD_DATA.SOURCE_SIGNATURES, self._failed_signatures):
+                pending = None
+                self.sync_store()
+            elif signatures != pending:
+                # ไฟล์อาจยังคัดลอกไม่เสร็จ รอให้ลายเซ็นเท่าเดิมอีก 1 รอบก่อน
+                pending = signatures
+            else:
+                if not self.reload():
+                    self._failed_signatures = signatures
+                pending = None
+    
+    def _validate(self, data):
+        """ไม่สลับถ้าข้อมูลที่เคยมีหายไป (เช่น ไฟล์ใหม่อ่านไม่ได้แล้วได้ DataFrame ว่าง)"""
+        for key, label in (('df', 'ข้อมูลการจมน้ำ'), ('df_death_cert', 'ข้อมูลมรณบัตร'),
+                           ('gdf_drowning', 'Shapefile การจมน้ำ'), ('gdf_death', 'Shapefile มรณบัตร')):
+            old, new = getattr(DASHBOARD_DATA, key), data[key]
+            if old is not None and len(old) > 0 and (new is None or len(new) == 0):
+                return f"{label}ชุดใหม่ว่างเปล่า"
+        return None
+    
+    def reload(self):
+        """สร้างข้อมูลชุดใหม่แล้วสลับเข้าแทน คืนค่า True ถ้าสำเร็จ (ถ้าไม่สำเร็จจะใช้ข้อมูลเดิมต่อ)"""
+        ensure_data_loaded()
+        with _data_load_lock:
+            start = time.perf_counter()
+            old_version = DASHBOARD_DATA.DATA_VERSION
+            try:
+                data = build_dashboard_data()
+                problem = self._validate(data)
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                problem = str(e)
+            if problem:
+                self.last_error = problem
+                print(f"❌ reload ข้อมูลไม่สำเร็จ - ใช้ข้อมูลเดิมต่อ: {problem}")
+                return False
+            
+            install_dashboard_data(data)
+            self.reloads += 1
+            self.last_reload = datetime.now().isoformat(timespec='seconds')
+            self.last_error = None
+        print(f"✅ reload ข้อมูล {old_version} → {data['DATA_VERSION']} ({time.perf_counter() - start:.2f} วินาที)")
+        
+        # สร้างแผนที่ Choropleth ของข้อมูลชุดใหม่ไว้ก่อนที่ browser จะขอ
+        try:
+            for name in ('drowning', 'death_cert'):
+                get_map_html(name)
+        except Exception as e:
+            print(f"ไม่สามารถสร้างแผนที่หลัง reload: {e}")
+        return True
+    
+    def sync_store(self, full_reload=True):
+        """
+        นำ delta ใน .current ที่ process นี้ยังไม่มีเข้าแบบ incremental (ไฟล์หลักเดิม มีแต่ delta ต่อท้าย)
+        ถ้าไฟล์หลักเปลี่ยน (compact หรือ Excel ชุดใหม่) จะ reload ทั้งชุด (full_reload=False = ปล่อยให้ thread ตรวจไฟล์ทำ)
+        คืนค่า True ถ้าข้อมูลเปลี่ยน
+        """
+        if not HAS_PYARROW:
+            return False
+        with _data_load_lock:
+            pointer = read_current_pointer('drowning')
+            current = DASHBOARD_DATA.DROWNING_STORE_FILES
+            if pointer is None or current is None:
+                return False
+            files = store_files_of(pointer)
+            if files in (current, self._failed_store):
+                return False
+            
+            if files[0] == current[0] and files[1][:len(current[1])] == current[1]:
+                start = time.perf_counter()
+                old_version = DASHBOARD_DATA.DATA_VERSION
+                try:
+                    names = files[1][len(current[1]):]
+                    delta = concat_frames([open_arrow_table(os.path.join(DATA_CACHE_DIR, name)) for name in names])
+                    data = build_drowning_increment(delta, files)
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    data = None
+                if data is not None:
+                    install_dashboard_data(data)
+                    self.ingests += 1
+                    print(f"✅ ingest {len(delta):,} ระเบียน {old_version} → {data['DATA_VERSION']} "
+                          f"({time.perf_counter() - start:.3f} วินาที)")
+                    return True
+        
+        # ไฟล์หลักเปลี่ยน หรือนำ delta เข้าแบบ incremental ไม่ได้: สร้างข้อมูลใหม่ทั้งชุดจาก .current
+        if not full_reload:
+            return False
+        if self.reload():
+            return True
+        self._failed_store = files
+        return False
+
+DATA_RELOADER = DataReloader(DATA_WATCH_INTERVAL)
+
+@server.route('/data-version')
+def data_version_status():
+    data = current_data()
+    return jsonify({
+        'version': data.DATA_VERSION,
+        'data_loaded': _data_loaded,
+        'watch_interval': DATA_WATCH_INTERVAL,
+        'reloads': DATA_RELOADER.reloads,
+        'ingests': DATA_RELOADER.ingests,
+        'deltas': len(data.DROWNING_STORE_FILES[1]) if data.DROWNING_STORE_FILES else 0,
+        'last_reload': DATA_RELOADER.last_reload,
+        'last_error': DATA_RELOADER.last_error,
+    })
+
+# =============== นำเข้าระเบียนใหม่/ระเบียนที่แก้ไข (ingest) แบบ incremental ===============
+# ระเบียนจากไฟล์ CSV/Excel ผ่าน normalize แบบเดียวกับข้อมูลทั้งชุด ตัดระเบียนซ้ำตาม INGEST_KEYS
+# แล้วเขียนเป็นไฟล์ delta ต่อท้ายที่เก็บข้อมูล (ไม่เขียนข้อมูลเดิมซ้ำ) จากนั้นแต่ละ process นำ delta เข้าข้อมูลในหน่วยความจำ
+# โดยคำนวณ Filter index, Cube และ Hex index เฉพาะแถวที่เพิ่มและแถวเดิมที่ถูกแทนที่
+# compact_store รวม delta ทั้งหมดเป็นไฟล์เดียว (ทำเป็นครั้งคราว ให้การโหลดกลับมาเป็น memory map ล้วน)
+INGEST_TOKEN = os.environ.get('INGEST_TOKEN', '')  # ว่าง = ปิด /ingest (ใช้ ingest.py แทน)
+INGEST_REQUIRED_COLUMNS = ['จังหวัด']
+
+def read_delta_file(source, filename):
+    """อ่านไฟล์ระเบียนที่จะ ingest (.csv, .xls, .xlsx) เป็น DataFrame ดิบ (source = path หรือ file object)"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.csv':
+        return pd.read_csv(source, encoding='utf-8-sig')
+    if ext in ('.xls', '.xlsx'):
+        return pd.read_excel(source)
+    raise ValueError(f"ไม่รองรับไฟล์ {filename} (ใช้ .csv, .xls หรือ .xlsx)")
+
+def _store_keys(pointer, key):
+    """ค่า key ของทุกระเบียนในที่เก็บข้อมูล (อ่านเฉพาะคอลัมน์ key แบบ memory map)"""
+    keys = []
+    for name in (pointer['file'], *pointer.get('deltas', ())):
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(os.path.join(DATA_CACHE_DIR, name), 'r'))
+        index = reader.schema.get_field_index(key)
+        if index < 0:
+            continue
+        # batch จาก memory map อ้างอิงหน้าของไฟล์ ดึงคอลัมน์ key อย่างเดียวจึงไม่แตะหน้าของคอลัมน์อื่น
+        column = pyarrow.chunked_array([reader.get_batch(i).column(index) for i in range(reader.num_record_batches)],
+                                       type=reader.schema.field(index).type)
+        keys.append(column.to_numpy())
+    return np.concatenate(keys) if keys else np.empty(0)
+
+def append_delta_records(raw, cache_name='drowning'):
+    """
+    Normalize ระเบียนดิบ ตัดระเบียนซ้ำตาม key (ใช้แถวสุดท้าย) แล้วเขียนเป็นไฟล์ delta ต่อท้ายที่เก็บข้อมูล
+    คืนค่า dict สรุปผล (ไฟล์ delta, จำนวนระเบียน, ระเบียนใหม่, ระเบียนที่แก้ไข, แถวที่ข้ามเพราะไม่มี key)
+    """
+    key = INGEST_KEYS.get(cache_name)
+    if key is None:
+        raise ValueError(f"ข้อมูล {cache_name} ไม่รองรับการ ingest")
+    if not HAS_PYARROW:
+        raise ValueError("ต้องติดตั้ง pyarrow เพื่อ ingest ข้อมูล")
+    
+    frame = _make_arrow_compatible(normalize_drowning_frame(raw))
+    missing = [col for col in [key, *INGEST_REQUIRED_COLUMNS] if col not in frame.columns]
+    if missing:
+        raise ValueError(f"ไม่พบคอลัมน์ {', '.join(missing)} ในข้อมูลที่นำเข้า")
+    
+    skipped = int(frame[key].isna().sum())
+    frame = frame[frame[key].notna().to_numpy()].drop_duplicates(key, keep='last').reset_index(drop=True)
+    if len(frame) == 0:
+        raise ValueError(f"ไม่มีระเบียนที่มีค่า {key}")
+    if pd.api.types.is_float_dtype(frame[key]) and (frame[key] == frame[key].round()).all():
+        frame[key] = frame[key].astype('int64')
+    
+    with _store_lock(cache_name):
+        pointer = read_current_pointer(cache_name)
+        if pointer is None or pointer.get('version') != DATA_CACHE_VERSION:
+            raise ValueError(f"ยังไม่มีข้อมูล {cache_name} ใน {DATA_CACHE_DIR} (ต้องโหลดจากไฟล์ Excel ก่อน)")
+        corrected = int(frame[key].isin(_store_keys(pointer, key)).sum())
+        
+        path = _delta_file_path(cache_name)
+        write_arrow_table(frame, path)
+        swap_current_pointer(cache_name, os.path.join(DATA_CACHE_DIR, pointer['file']), pointer['source_checksum'],
+                             pointer['rows'] + len(frame) - corrected,
+                             [*pointer.get('deltas', ()), os.path.basename(path)])
+    
+    print(f"บันทึก delta {cache_name}: {len(frame):,} ระเบียน (ใหม่ {len(frame) - corrected:,}, "
+          f"แก้ไข {corrected:,}, ข้าม {skipped:,}) → {path}")
+    return {
+        'file': os.path.basename(path),
+        'rows': len(frame),
+        'new': len(frame) - corrected,
+        'corrected': corrected,
+        'skipped': skipped,
+    }
+
+def compact_store(cache_name='drowning'):
+    """รวมไฟล์หลักกับ delta ทั้งหมดเป็นไฟล์เดียว คืนค่า path ของไฟล์ใหม่ (None ถ้าไม่มี delta)"""
+    with _store_lock(cache_name):
+        pointer = read_current_pointer(cache_name)
+        if pointer is None or not pointer.get('deltas'):
+            return None
+        frame = _make_arrow_compatible(open_pointer_table(cache_name, pointer))
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        path = os.path.join(DATA_CACHE_DIR, f"{cache_name}_{pointer['source_checksum'][:16]}_c{stamp}"
+                                            f"_v{DATA_CACHE_VERSION}.arrow")
+        write_arrow_table(frame, path)
+        swap_current_pointer(cache_name, path, pointer['source_checksum'], len(frame))
+        remove_stale_data_files(cache_name, {os.path.basename(path)})
+    print(f"รวม {len(pointer['deltas'])} delta ของ {cache_name} → {path} ({len(frame):,} แถว)")
+    return path
+
+def build_drowning_increment(delta, store_files):
+    """
+    ข้อมูลการจมน้ำชุดปัจจุบัน + ระเบียนใน delta (key ซ้ำใช้ค่าจาก delta) โดยคำนวณ Filter index, Cube
+    และ Hex index เฉพาะแถวที่เพิ่มและแถวที่ถูกแทนที่ คืนค่า dict สำหรับ install_dashboard_data
+    หรือ None ถ้าต้องสร้างใหม่ทั้งชุด (เช่น ยังไม่มีข้อมูล)
+    """
+    key = INGEST_KEYS['drowning']
+    data = DASHBOARD_DATA
+    df = data.df
+    if len(df) == 0 or key not in df.columns or data.DROWNING_FILTER_INDEX is None or data.DROWNING_CUBE is None:
+        return None
+    
+    delta = prepare_drowning_frame(delta.drop_duplicates(key, keep='last').reset_index(drop=True))
+    if data.gdf_drowning is not None:
+        assign_polygons_from_coordinates(delta, 'drowning',
+                                         list(zip(['จังหวัด', 'อำเภอ', 'ตำบล'], DROWNING_GAZETTEER_COLUMNS)),
+                                         'ระเบียนที่ ingest', gdf=data.gdf_drowning)
+    
+    replaced = df[key].isin(delta[key]).to_numpy()
+    removed = np.flatnonzero(replaced)
+    new_df = concat_frames([df[~replaced] if len(removed) else df, delta])
+    
+    columns = [col for col in CUBE_SOURCE_COLUMNS if col in new_df.columns]
+    removed_rows = df[[col for col in columns if col in df.columns]].take(removed)
+    cube = data.DROWNING_CUBE.updated(new_df[columns].iloc[len(df) - len(removed):], removed_rows)
+    if cube is None:
+        return None
+    hex_index = data.DROWNING_HEX_INDEX
+    if hex_index is not None:
+        lat, lon = locate_cells(cube.cells.iloc[len(data.DROWNING_CUBE.cells):], data.DROWNING_GAZETTEER,
+                                ['จังหวัด', 'อำเภอ', 'ตำบล'])
+        hex_index = hex_index.extended(lon, lat)
+    
+    new_df.attrs['store_files'] = store_files
+    return {
+        'df': new_df,
+        'DROWNING_FILTER_INDEX': data.DROWNING_FILTER_INDEX.updated(new_df, removed),
+        'DROWNING_CUBE': cube,
+        'DROWNING_HEX_INDEX': hex_index,
+        'DROWNING_STORE_FILES': store_files,
+        'DATA_VERSION': compute_data_version(data.SOURCE_SIGNATURES, store_files),
+    }
+
+@server.route('/ingest', methods=['POST'])
+def ingest_records():
+    """
+    รับระเบียนใหม่/ระเบียนที่แก้ไขเป็นไฟล์ CSV หรือ Excel (multipart field 'file') หรือ body เป็น CSV
+    ต้องตั้ง INGEST_TOKEN และส่ง header Authorization: Bearer <token>
+    """
+    if not INGEST_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {INGEST_TOKEN}"):
+        abort(403)
+    
+    upload = request.files.get('file')
+    try:
+        if upload is not None:
+            raw = read_delta_file(upload.stream, upload.filename or '')
+        else:
+            raw = read_delta_file(BytesIO(request.get_data()), 'body.csv')
+        result = append_delta_records(raw)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # worker นี้นำ delta เข้าทันทีเฉพาะแบบ incremental worker อื่น (และการ reload ทั้งชุดเมื่อไฟล์หลักเปลี่ยน)
+    # ทำใน thread ตรวจไฟล์รอบถัดไป (DATA_WATCH_INTERVAL) ไม่สร้างข้อมูลทั้งชุดใน thread ของคำขอ
+    applied = DATA_RELOADER.sync_store(full_reload=False)
+    return jsonify({**result, 'applied': applied, 'version': DASHBOARD_DATA.DATA_VERSION})
+
+if STARTUP_MODE == 'eager':
+    ensure_data_loaded()
+
 # =============== สร้าง Zone Dropdown Options ===============
 def get_zone_options():
+    df = current_data().df
     if 'เขต' not in df.columns or len(df) == 0:
         return [{'label': 'ทั้งหมด', 'value': 'ALL'}]
     
@@ -1078,6 +3470,7 @@ def get_zone_options():
     return options
 
 def get_death_cert_province_options():
+    df_death_cert = current_data().df_death_cert
     if 'จังหวัด' not in df_death_cert.columns or len(df_death_cert) == 0:
         return [{'label': 'ทั้งหมด', 'value': 'ALL'}]
     
@@ -1090,6 +3483,7 @@ def get_death_cert_province_options():
     return options
 
 def get_death_cert_zone_options():
+    df_death_cert = current_data().df_death_cert
     if 'เขต' not in df_death_cert.columns or len(df_death_cert) == 0:
         return [{'label': 'ทั้งหมด', 'value': 'ALL'}]
     
@@ -1101,49 +3495,139 @@ def get_death_cert_zone_options():
     
     return options
 
-# =============== สร้าง Layout ===============
-logo_components = []
-if LOGO_GD_BASE64:
-    logo_components.append(html.Img(src=LOGO_GD_BASE64, style={'height': '50px', 'marginRight': '10px'}, className="d-inline"))
-if LOGO_KK_BASE64:
-    logo_components.append(html.Img(src=LOGO_KK_BASE64, style={'height': '50px'}, className="d-inline"))
-
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.Div(logo_components, style={'marginBottom': '10px', 'textAlign': 'right'})
-        ], width=12)
-    ]),
-    
-    dbc.Row([
-        dbc.Col([
-            html.H1("ระบบข้อมูลการจมน้ำและมรณบัตร ปี 2563-2568", 
-                   className="text-center mb-4 mt-2",
-                   style={'fontFamily': 'Sarabun, sans-serif', 'fontWeight': 'bold'})
-        ])
-    ]),
-    
-    dbc.Row([
-        dbc.Col([
-            dbc.Tabs([
-                dbc.Tab(label="ข้อมูลการจมน้ำ", tab_id="drowning-tab",
-                       label_style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
-                dbc.Tab(label="ข้อมูลมรณบัตร", tab_id="death-cert-tab",
-                       label_style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
-            ], id="data-tabs", active_tab="drowning-tab", className="mb-3")
-        ])
-    ]),
-    
-    # Filters สำหรับข้อมูลการจมน้ำ
-    html.Div(id='drowning-filters', children=[
+# =============== สร้าง Layout (หลังโหลดข้อมูลแล้ว เพราะตัวเลือกใน Dropdown มาจากข้อมูล) ===============
+def build_layout():
+    data = current_data()
+    df = data.df
+    logo_components = []
+    if data.LOGO_GD_BASE64:
+        logo_components.append(html.Img(src=data.LOGO_GD_BASE64, style={'height': '50px', 'marginRight': '10px'}, className="d-inline"))
+    if data.LOGO_KK_BASE64:
+        logo_components.append(html.Img(src=data.LOGO_KK_BASE64, style={'height': '50px'}, className="d-inline"))
+
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.Div(logo_components, style={'marginBottom': '10px', 'textAlign': 'right'})
+            ], width=12)
+        ]),
+        
+        dbc.Row([
+            dbc.Col([
+                html.H1("ระบบข้อมูลการจมน้ำและมรณบัตร ปี 2563-2568", 
+                       className="text-center mb-4 mt-2",
+                       style={'fontFamily': 'Sarabun, sans-serif', 'fontWeight': 'bold'})
+            ])
+        ]),
+        
+        dbc.Row([
+            dbc.Col([
+                dbc.Tabs([
+                    dbc.Tab(label="ข้อมูลการจมน้ำ", tab_id="drowning-tab",
+                           label_style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+                    dbc.Tab(label="ข้อมูลมรณบัตร", tab_id="death-cert-tab",
+                           label_style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+                ], id="data-tabs", active_tab="drowning-tab", className="mb-3")
+            ])
+        ]),
+        
+        # Filters สำหรับข้อมูลการจมน้ำ
+        html.Div(id='drowning-filters', children=[
+            dbc.Row([
+                dbc.Col([
+                    html.Label("จังหวัด", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='province-dropdown',
+                        options=[{'label': 'ทั้งหมด', 'value': 'ALL'}] + 
+                                [{'label': str(i), 'value': str(i)} for i in sorted(df['จังหวัด'].dropna().unique())] 
+                                if 'จังหวัด' in df.columns and len(df) > 0 else [{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=3),
+                
+                dbc.Col([
+                    html.Label("อำเภอ", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='district-dropdown',
+                        options=[{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=3),
+                
+                dbc.Col([
+                    html.Label("ตำบล", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='subdistrict-dropdown',
+                        options=[{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=3),
+                
+                dbc.Col([
+                    html.Label("เขต", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='zone-dropdown',
+                        options=get_zone_options(),
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=3),
+            ], className="mb-3 justify-content-center"),
+        ]),
+        
+        # Filters สำหรับข้อมูลมรณบัตร
+        html.Div(id='death-cert-filters', style={'display': 'none'}, children=[
+            dbc.Row([
+                dbc.Col([
+                    html.Label("จังหวัด", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='dc-province-dropdown',
+                        options=get_death_cert_province_options(),
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=4),
+                
+                dbc.Col([
+                    html.Label("อำเภอ", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='dc-district-dropdown',
+                        options=[{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=4),
+                
+                dbc.Col([
+                    html.Label("เขต", style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Dropdown(
+                        id='dc-zone-dropdown',
+                        options=get_death_cert_zone_options(),
+                        value='ALL',
+                        clearable=False,
+                        style={'fontFamily': 'Sarabun, sans-serif'}
+                    )
+                ], width=4),
+            ], className="mb-3 justify-content-center"),
+        ]),
+        
+        # บรรทัดที่ 2: เดือน / ปี / อายุ / ค้นหา
         dbc.Row([
             dbc.Col([
-                html.Label("จังหวัด", style={'fontFamily': 'Sarabun, sans-serif'}),
+                html.Label("เดือน", style={'fontFamily': 'Sarabun, sans-serif'}),
                 dcc.Dropdown(
-                    id='province-dropdown',
+                    id='month-dropdown',
                     options=[{'label': 'ทั้งหมด', 'value': 'ALL'}] + 
-                            [{'label': str(i), 'value': str(i)} for i in sorted(df['จังหวัด'].dropna().unique())] 
-                            if 'จังหวัด' in df.columns and len(df) > 0 else [{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                            [{'label': f'{i}', 'value': i} for i in range(1, 13)],
                     value='ALL',
                     clearable=False,
                     style={'fontFamily': 'Sarabun, sans-serif'}
@@ -1151,10 +3635,12 @@ app.layout = dbc.Container([
             ], width=3),
             
             dbc.Col([
-                html.Label("อำเภอ", style={'fontFamily': 'Sarabun, sans-serif'}),
+                html.Label("ปี", style={'fontFamily': 'Sarabun, sans-serif'}),
                 dcc.Dropdown(
-                    id='district-dropdown',
-                    options=[{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                    id='year-dropdown',
+                    options=[{'label': 'ทั้งหมด', 'value': 'ALL'}] + 
+                            [{'label': str(int(i)), 'value': int(i)} for i in sorted(df['ปี'].dropna().unique())] 
+                            if 'ปี' in df.columns and len(df) > 0 else [{'label': 'ทั้งหมด', 'value': 'ALL'}],
                     value='ALL',
                     clearable=False,
                     style={'fontFamily': 'Sarabun, sans-serif'}
@@ -1162,10 +3648,14 @@ app.layout = dbc.Container([
             ], width=3),
             
             dbc.Col([
-                html.Label("ตำบล", style={'fontFamily': 'Sarabun, sans-serif'}),
+                html.Label("อายุ", style={'fontFamily': 'Sarabun, sans-serif'}),
                 dcc.Dropdown(
-                    id='subdistrict-dropdown',
-                    options=[{'label': 'ทั้งหมด', 'value': 'ALL'}],
+                    id='age-dropdown',
+                    options=[
+                        {'label': 'ทั้งหมด', 'value': 'ALL'},
+                        {'label': 'อายุต่ำกว่า 15 ปี', 'value': '<15'},
+                        {'label': 'ทุกกลุ่มอายุ (15+)', 'value': '15+'}
+                    ],
                     value='ALL',
                     clearable=False,
                     style={'fontFamily': 'Sarabun, sans-serif'}
@@ -1173,319 +3663,250 @@ app.layout = dbc.Container([
             ], width=3),
             
             dbc.Col([
-                html.Label("เขต", style={'fontFamily': 'Sarabun, sans-serif'}),
-                dcc.Dropdown(
-                    id='zone-dropdown',
-                    options=get_zone_options(),
-                    value='ALL',
-                    clearable=False,
-                    style={'fontFamily': 'Sarabun, sans-serif'}
-                )
+                html.Label("\u00A0", style={'fontFamily': 'Sarabun, sans-serif'}),
+                dbc.Button("อัพเดท", id="search-button", color="primary", n_clicks=0,
+                          style={'width': '100%', 'fontFamily': 'Sarabun, sans-serif'})
             ], width=3),
-        ], className="mb-3 justify-content-center"),
-    ]),
-    
-    # Filters สำหรับข้อมูลมรณบัตร
-    html.Div(id='death-cert-filters', style={'display': 'none'}, children=[
+        ], className="mb-4 justify-content-center"),
+        
+        # แสดงสถิติ
         dbc.Row([
             dbc.Col([
-                html.Label("จังหวัด", style={'fontFamily': 'Sarabun, sans-serif'}),
-                dcc.Dropdown(
-                    id='dc-province-dropdown',
-                    options=get_death_cert_province_options(),
-                    value='ALL',
-                    clearable=False,
-                    style={'fontFamily': 'Sarabun, sans-serif'}
-                )
-            ], width=4),
-            
+                html.H4("สถิติข้อมูล", className="text-center mb-3",
+                       style={'fontFamily': 'Sarabun, sans-serif'}),
+                html.Div(id='statistics-output')
+            ])
+        ], className="mb-4"),
+        
+        # Pie Chart + Heatmap Map
+        dbc.Row([
             dbc.Col([
-                html.Label("อำเภอ", style={'fontFamily': 'Sarabun, sans-serif'}),
-                dcc.Dropdown(
-                    id='dc-district-dropdown',
-                    options=[{'label': 'ทั้งหมด', 'value': 'ALL'}],
-                    value='ALL',
-                    clearable=False,
-                    style={'fontFamily': 'Sarabun, sans-serif'}
-                )
-            ], width=4),
+                dcc.Graph(id='status-pie-chart', style={'height': '350px'}),
+                html.Div(id='status-details', className="mt-2")
+            ], width=6),
             
             dbc.Col([
-                html.Label("เขต", style={'fontFamily': 'Sarabun, sans-serif'}),
-                dcc.Dropdown(
-                    id='dc-zone-dropdown',
-                    options=get_death_cert_zone_options(),
-                    value='ALL',
-                    clearable=False,
-                    style={'fontFamily': 'Sarabun, sans-serif'}
-                )
-            ], width=4),
-        ], className="mb-3 justify-content-center"),
-    ]),
-    
-    # บรรทัดที่ 2: เดือน / ปี / อายุ / ค้นหา
-    dbc.Row([
-        dbc.Col([
-            html.Label("เดือน", style={'fontFamily': 'Sarabun, sans-serif'}),
-            dcc.Dropdown(
-                id='month-dropdown',
-                options=[{'label': 'ทั้งหมด', 'value': 'ALL'}] + 
-                        [{'label': f'{i}', 'value': i} for i in range(1, 13)],
-                value='ALL',
-                clearable=False,
-                style={'fontFamily': 'Sarabun, sans-serif'}
-            )
-        ], width=3),
-        
-        dbc.Col([
-            html.Label("ปี", style={'fontFamily': 'Sarabun, sans-serif'}),
-            dcc.Dropdown(
-                id='year-dropdown',
-                options=[{'label': 'ทั้งหมด', 'value': 'ALL'}] + 
-                        [{'label': str(int(i)), 'value': int(i)} for i in sorted(df['ปี'].dropna().unique())] 
-                        if 'ปี' in df.columns and len(df) > 0 else [{'label': 'ทั้งหมด', 'value': 'ALL'}],
-                value='ALL',
-                clearable=False,
-                style={'fontFamily': 'Sarabun, sans-serif'}
-            )
-        ], width=3),
-        
-        dbc.Col([
-            html.Label("อายุ", style={'fontFamily': 'Sarabun, sans-serif'}),
-            dcc.Dropdown(
-                id='age-dropdown',
-                options=[
-                    {'label': 'ทั้งหมด', 'value': 'ALL'},
-                    {'label': 'อายุต่ำกว่า 15 ปี', 'value': '<15'},
-                    {'label': 'ทุกกลุ่มอายุ (15+)', 'value': '15+'}
-                ],
-                value='ALL',
-                clearable=False,
-                style={'fontFamily': 'Sarabun, sans-serif'}
-            )
-        ], width=3),
-        
-        dbc.Col([
-            html.Label("\u00A0", style={'fontFamily': 'Sarabun, sans-serif'}),
-            dbc.Button("อัพเดท", id="search-button", color="primary", n_clicks=0,
-                      style={'width': '100%', 'fontFamily': 'Sarabun, sans-serif'})
-        ], width=3),
-    ], className="mb-4 justify-content-center"),
-    
-    # แสดงสถิติ
-    dbc.Row([
-        dbc.Col([
-            html.H4("สถิติข้อมูล", className="text-center mb-3",
-                   style={'fontFamily': 'Sarabun, sans-serif'}),
-            html.Div(id='statistics-output')
-        ])
-    ], className="mb-4"),
-    
-    # Pie Chart + Heatmap Map
-    dbc.Row([
-        dbc.Col([
-            dcc.Graph(id='status-pie-chart', style={'height': '350px'}),
-            html.Div(id='status-details', className="mt-2")
-        ], width=6),
-        
-        dbc.Col([
-            html.Div(id='heatmap-options-drowning', children=[
-                html.Label("แผนที่ Heatmap อัตรารายตำบล (%):", style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+                html.Div(id='heatmap-options-drowning', children=[
+                    html.Label("แผนที่ Heatmap อัตรารายตำบล (%):", style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+                    dcc.RadioItems(
+                        id='map-type-radio',
+                        options=[
+                            {'label': ' อัตราเสียชีวิต', 'value': 'deceased_rate'},
+                            {'label': ' อัตราบาดเจ็บ', 'value': 'injured_rate'},
+                            {'label': ' อัตราไม่บาดเจ็บ', 'value': 'not_injured_rate'}
+                        ],
+                        value='deceased_rate',
+                        inline=True,
+                        style={'fontFamily': 'Sarabun', 'marginBottom': '10px'}
+                    ),
+                ]),
+                html.Div(id='heatmap-options-death', style={'display': 'none'}, children=[
+                    html.Label("แผนที่ Heatmap อัตราการเสียชีวิตรายอำเภอ (%):", 
+                              style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+                ]),
                 dcc.RadioItems(
-                    id='map-type-radio',
+                    id='heatmap-render-radio',
                     options=[
-                        {'label': ' อัตราเสียชีวิต', 'value': 'deceased_rate'},
-                        {'label': ' อัตราบาดเจ็บ', 'value': 'injured_rate'},
-                        {'label': ' อัตราไม่บาดเจ็บ', 'value': 'not_injured_rate'}
+                        {'label': ' จุด (คำนวณใน browser)', 'value': 'points'},
+                        {'label': ' ภาพความหนาแน่น (คำนวณที่ server)', 'value': 'raster'},
+                        {'label': ' ช่องหกเหลี่ยม (hex)', 'value': 'hex'}
                     ],
-                    value='deceased_rate',
+                    value=HEATMAP_RENDER_MODE,
                     inline=True,
-                    style={'fontFamily': 'Sarabun', 'marginBottom': '10px'}
+                    style={'fontFamily': 'Sarabun', 'fontSize': '12px', 'marginBottom': '5px'}
                 ),
-            ]),
-            html.Div(id='heatmap-options-death', style={'display': 'none'}, children=[
-                html.Label("แผนที่ Heatmap อัตราการเสียชีวิตรายอำเภอ (%):", 
-                          style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
-            ]),
-            dcc.Graph(id='heatmap-map', style={'height': '450px'}),
-            dbc.Button(
-                "💾 Export Heatmap เป็น PNG", 
-                id="export-heatmap-btn", 
-                color="info", 
-                size="sm",
-                className="mt-2",
-                style={'fontFamily': 'Sarabun'}
-            )
-        ], width=6),
-    ], className="mb-4"),
-    
-    # วิเคราะห์การอยู่กับใครและอายุ
-    # วิเคราะห์การอยู่กับใครและอายุ (แสดงเฉพาะ Tab การจมน้ำ)
-    html.Div(id='companion-analysis-wrapper', style={'display': 'none'}, children=[
-        dbc.Row([
-            dbc.Col([
-                html.H4("วิเคราะห์ความเสี่ยงการเสียชีวิตจากการจมน้ำตามผู้อยู่ด้วยและกลุ่มอายุ", 
-                    className="text-center mb-3",
-                    style={'fontFamily': 'Sarabun, sans-serif'}),
-            ])
-        ]),
-    
-    dbc.Row([
-        # กราฟ Stacked Bar แสดงความสัมพันธ์
-        dbc.Col([
-            dcc.Graph(id='companion-age-chart', style={'height': '400px'})
-        ], width=6),
-        
-        # แผนที่ Heatmap แสดงกลุ่มเสี่ยง
-        dbc.Col([
-    #         html.Label("เลือกกลุ่มที่ต้องการดู:", 
-    #                 style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
-    #         dcc.RadioItems(
-    #             id='companion-filter-radio',
-    #             options=[
-    #                 {'label': ' ทั้งหมด', 'value': 'all'},
-    #                 {'label': ' อยู่กับผู้ปกครอง', 'value': 'ผู้ปกครอง/ผู้ดูแลเด็ก'},
-    #                 {'label': ' อยู่กับเพื่อน', 'value': 'เพื่อน'},
-    #                 {'label': ' อยู่คนเดียว', 'value': 'อยู่คนเดียว'}
-    #             ],
-    #             value='all',
-    #             inline=True,
-    #             style={'fontFamily': 'Sarabun', 'marginBottom': '10px'}
-    #         ),
-    #         dcc.Graph(id='companion-risk-map', style={'height': '350px'})
-    #     ], width=6),
-    # ], className="mb-4"),
-    
-            html.Label("เลือกกลุ่มที่ต้องการดู:", 
-                    style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
-            dcc.RadioItems(
-                id='companion-filter-radio',
-                options=[
-                    {'label': ' ทั้งหมด', 'value': 'all'},
-                    {'label': ' ผู้ปกครอง', 'value': 'ผู้ปกครอง'},
-                    {'label': ' เพื่อน', 'value': 'เพื่อน'},
-                    {'label': ' อยู่เพียงลำพัง', 'value': 'อยู่เพียงลำพัง'}
-                ],
-                value='all',
-                inline=True,
-                style={'fontFamily': 'Sarabun', 'marginBottom': '10px'}
-            ),   
-            dcc.Graph(id='companion-risk-map', style={'height': '350px'}),
-            dbc.Button(
-                "💾 Export แผนที่ความเสี่ยงเป็น PNG", 
-                id="export-companion-map-btn", 
-                color="secondary", 
-                size="sm",
-                className="mt-2",
-                style={'fontFamily': 'Sarabun', 'width': '100%'}
-            )
-        ], width=6),
-    ], className="mb-4"),
-    
-    # ตารางสรุปข้อมูล
-    dbc.Row([
-        dbc.Col([
-            html.Div(id='companion-summary-table')
-        ])
-    ], className="mb-4"),
-]),
-    
-    # Content ข้อมูลการจมน้ำ
-    html.Div(id='drowning-content', children=[
-        dbc.Row([
-            dbc.Col([
-                html.H4("ร้อยละความถี่การเกิดเหตุและเสียชีวิตจากการจมน้ำรายปี", 
-                       className="text-center mb-3",
-                       style={'fontFamily': 'Sarabun, sans-serif'}),
-                dcc.Graph(id='frequency-histogram', style={'height': '500px'})
-            ])
-        ], className="mb-4"),
-        
-        dbc.Row([
-            dbc.Col([
-                html.H4("แผนที่แสดงจำนวนการเกิดเหตุจมน้ำเสียชีวิตรายตำบล (2563-2568)", 
-                       className="text-center mb-3",
-                       style={'fontFamily': 'Sarabun, sans-serif'}),
-                html.Iframe(id='choropleth-map', style={'width': '100%', 'height': '600px', 'border': '1px solid #ddd'}),
+                dcc.Graph(id='heatmap-map', style={'height': '450px'}),
                 dbc.Button(
-                    "💾 Export แผนที่การจมน้ำเป็น PNG", 
-                    id="export-choropleth-btn", 
-                    color="success", 
+                    "💾 Export Heatmap เป็น PNG", 
+                    id="export-heatmap-btn", 
+                    color="info", 
                     size="sm",
                     className="mt-2",
                     style={'fontFamily': 'Sarabun'}
                 )
-            ])
+            ], width=6),
         ], className="mb-4"),
         
+        # วิเคราะห์การอยู่กับใครและอายุ
+        # วิเคราะห์การอยู่กับใครและอายุ (แสดงเฉพาะ Tab การจมน้ำ)
+        html.Div(id='companion-analysis-wrapper', style={'display': 'none'}, children=[
+            dbc.Row([
+                dbc.Col([
+                    html.H4("วิเคราะห์ความเสี่ยงการเสียชีวิตจากการจมน้ำตามผู้อยู่ด้วยและกลุ่มอายุ", 
+                        className="text-center mb-3",
+                        style={'fontFamily': 'Sarabun, sans-serif'}),
+                ])
+            ]),
+        
         dbc.Row([
+            # กราฟ Stacked Bar แสดงความสัมพันธ์
             dbc.Col([
-                html.H4("สถิติการจมน้ำ 30 จังหวัดแรก", className="text-center mb-3",
-                       style={'fontFamily': 'Sarabun, sans-serif'}),
-                dcc.Graph(id='bar-graph', style={'height': '500px'})
-            ])
-        ], className="mb-4"),
-    ]),
-    
-    # Content ข้อมูลมรณบัตร
-    html.Div(id='death-cert-content', style={'display': 'none'}, children=[
-        dbc.Row([
+                dcc.Graph(id='companion-age-chart', style={'height': '400px'})
+            ], width=6),
+            
+            # แผนที่ Heatmap แสดงกลุ่มเสี่ยง
             dbc.Col([
-                html.H4("แผนที่แสดงข้อมูลมรณบัตรจากการจมน้ำรายอำเภอ (2563-2567)", 
-                       className="text-center mb-3",
-                       style={'fontFamily': 'Sarabun, sans-serif'}),
-                html.Iframe(id='death-cert-map', style={'width': '100%', 'height': '600px', 'border': '1px solid #ddd'}),
+        #         html.Label("เลือกกลุ่มที่ต้องการดู:", 
+        #                 style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+        #         dcc.RadioItems(
+        #             id='companion-filter-radio',
+        #             options=[
+        #                 {'label': ' ทั้งหมด', 'value': 'all'},
+        #                 {'label': ' อยู่กับผู้ปกครอง', 'value': 'ผู้ปกครอง/ผู้ดูแลเด็ก'},
+        #                 {'label': ' อยู่กับเพื่อน', 'value': 'เพื่อน'},
+        #                 {'label': ' อยู่คนเดียว', 'value': 'อยู่คนเดียว'}
+        #             ],
+        #             value='all',
+        #             inline=True,
+        #             style={'fontFamily': 'Sarabun', 'marginBottom': '10px'}
+        #         ),
+        #         dcc.Graph(id='companion-risk-map', style={'height': '350px'})
+        #     ], width=6),
+        # ], className="mb-4"),
+        
+                html.Label("เลือกกลุ่มที่ต้องการดู:", 
+                        style={'fontFamily': 'Sarabun', 'fontWeight': 'bold'}),
+                dcc.RadioItems(
+                    id='companion-filter-radio',
+                    options=[
+                        {'label': ' ทั้งหมด', 'value': 'all'},
+                        {'label': ' ผู้ปกครอง', 'value': 'ผู้ปกครอง'},
+                        {'label': ' เพื่อน', 'value': 'เพื่อน'},
+                        {'label': ' อยู่เพียงลำพัง', 'value': 'อยู่เพียงลำพัง'}
+                    ],
+                    value='all',
+                    inline=True,
+                    style={'fontFamily': 'Sarabun', 'marginBottom': '10px'}
+                ),   
+                dcc.Graph(id='companion-risk-map', style={'height': '350px'}),
                 dbc.Button(
-                    "💾 Export แผนที่มรณบัตรเป็น PNG", 
-                    id="export-death-cert-btn", 
-                    color="warning", 
+                    "💾 Export แผนที่ความเสี่ยงเป็น PNG", 
+                    id="export-companion-map-btn", 
+                    color="secondary", 
                     size="sm",
                     className="mt-2",
-                    style={'fontFamily': 'Sarabun'}
+                    style={'fontFamily': 'Sarabun', 'width': '100%'}
                 )
-            ])
+            ], width=6),
         ], className="mb-4"),
-    ]),
-
-    # แหล่งที่มา
-    html.Div(id='drowning-source', children=[
-        dbc.Row([
-            dbc.Col([
-                html.P("แหล่งข้อมูล: ข้อมูลจากระบบรายงานผู้บาดเจ็บหรือเสียชีวิตจากการตกน้ำ จมน้ำ (Drowning Report) ของกองป้องกันการบาดเจ็บ กรมควบคุมโรค", 
-                    style={'fontFamily': 'Sarabun', 'fontSize': '11px', 'color': '#666', 'textAlign': 'left'})
-            ])
-        ], className="mt-4")
-    ]),
-
-    html.Div(id='death-cert-source', style={'display': 'none'}, children=[
+        
+        # ตารางสรุปข้อมูล
         dbc.Row([
             dbc.Col([
-                html.P("แหล่งข้อมูล: ข้อมูลมรณบัตร กองยุทธศาสตร์และแผนงาน สำนักงานปลัดกระทรวงสาธารณสุข", 
-                    style={'fontFamily': 'Sarabun', 'fontSize': '11px', 'color': '#666', 'textAlign': 'left'})
+                html.Div(id='companion-summary-table')
             ])
-        ], className="mt-4")
+        ], className="mb-4"),
     ]),
-    
-    # ================= Alert แจ้งเตือนการ Export =================
-    dbc.Alert(
-        id='export-alert',
-        is_open=False,
-        duration=4000,  # แสดง 4 วินาที
-        color="success",
-        style={
-            'position': 'fixed',
-            'top': '10px',
-            'right': '10px',
-            'zIndex': 9999
-        }
-    ),
-    
-    dcc.Download(id="download-heatmap"),
-    dcc.Download(id="download-choropleth"),
-    dcc.Download(id="download-death-cert"),
-    dcc.Download(id="download-companion-map"),
-    
-], fluid=True, style={'fontFamily': 'Sarabun, sans-serif'})
+        
+        # Content ข้อมูลการจมน้ำ
+        html.Div(id='drowning-content', children=[
+            dbc.Row([
+                dbc.Col([
+                    html.H4("ร้อยละความถี่การเกิดเหตุและเสียชีวิตจากการจมน้ำรายปี", 
+                           className="text-center mb-3",
+                           style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Graph(id='frequency-histogram', style={'height': '500px'})
+                ])
+            ], className="mb-4"),
+            
+            dbc.Row([
+                dbc.Col([
+                    html.H4("แผนที่แสดงจำนวนการเกิดเหตุจมน้ำเสียชีวิตรายตำบล (2563-2568)", 
+                           className="text-center mb-3",
+                           style={'fontFamily': 'Sarabun, sans-serif'}),
+                    html.Iframe(id='choropleth-map', style={'width': '100%', 'height': '600px', 'border': '1px solid #ddd'}),
+                    dbc.Button(
+                        "💾 Export แผนที่การจมน้ำเป็น PNG", 
+                        id="export-choropleth-btn", 
+                        color="success", 
+                        size="sm",
+                        className="mt-2",
+                        style={'fontFamily': 'Sarabun'}
+                    )
+                ])
+            ], className="mb-4"),
+            
+            dbc.Row([
+                dbc.Col([
+                    html.H4("สถิติการจมน้ำ 30 จังหวัดแรก", className="text-center mb-3",
+                           style={'fontFamily': 'Sarabun, sans-serif'}),
+                    dcc.Graph(id='bar-graph', style={'height': '500px'})
+                ])
+            ], className="mb-4"),
+        ]),
+        
+        # Content ข้อมูลมรณบัตร
+        html.Div(id='death-cert-content', style={'display': 'none'}, children=[
+            dbc.Row([
+                dbc.Col([
+                    html.H4("แผนที่แสดงข้อมูลมรณบัตรจากการจมน้ำรายอำเภอ (2563-2567)", 
+                           className="text-center mb-3",
+                           style={'fontFamily': 'Sarabun, sans-serif'}),
+                    html.Iframe(id='death-cert-map', style={'width': '100%', 'height': '600px', 'border': '1px solid #ddd'}),
+                    dbc.Button(
+                        "💾 Export แผนที่มรณบัตรเป็น PNG", 
+                        id="export-death-cert-btn", 
+                        color="warning", 
+                        size="sm",
+                        className="mt-2",
+                        style={'fontFamily': 'Sarabun'}
+                    )
+                ])
+            ], className="mb-4"),
+        ]),
+
+        # แหล่งที่มา
+        html.Div(id='drowning-source', children=[
+            dbc.Row([
+                dbc.Col([
+                    html.P("แหล่งข้อมูล: ข้อมูลจากระบบรายงานผู้บาดเจ็บหรือเสียชีวิตจากการตกน้ำ จมน้ำ (Drowning Report) ของกองป้องกันการบาดเจ็บ กรมควบคุมโรค", 
+                        style={'fontFamily': 'Sarabun', 'fontSize': '11px', 'color': '#666', 'textAlign': 'left'})
+                ])
+            ], className="mt-4")
+        ]),
+
+        html.Div(id='death-cert-source', style={'display': 'none'}, children=[
+            dbc.Row([
+                dbc.Col([
+                    html.P("แหล่งข้อมูล: ข้อมูลมรณบัตร กองยุทธศาสตร์และแผนงาน สำนักงานปลัดกระทรวงสาธารณสุข", 
+                        style={'fontFamily': 'Sarabun', 'fontSize': '11px', 'color': '#666', 'textAlign': 'left'})
+                ])
+            ], className="mt-4")
+        ]),
+        
+        # ================= Alert แจ้งเตือนการ Export =================
+        dbc.Alert(
+            id='export-alert',
+            is_open=False,
+            duration=4000,  # แสดง 4 วินาที
+            color="success",
+            style={
+                'position': 'fixed',
+                'top': '10px',
+                'right': '10px',
+                'zIndex': 9999
+            }
+        ),
+        
+        dcc.Store(id='filter-state'),
+        dcc.Store(id='export-jobs', data=[]),
+        dcc.Interval(id='export-poll', interval=1000, disabled=True),
+        dcc.Download(id="download-export"),
+        
+    ], fluid=True, style={'fontFamily': 'Sarabun, sans-serif'})
+
+def serve_layout():
+    """Layout ของแอพ: รอข้อมูลโหลดเสร็จในคำขอแรกแล้วใช้ Layout เดิมซ้ำ"""
+    if not request_needs_data():
+        # Dash เรียกตอนตั้ง app.layout และในคำขอแรกเพื่อตรวจ id ของ callback: ใช้โครง Layout ได้โดยไม่ต้องรอข้อมูล
+        return build_layout()
+    ensure_data_loaded()
+    version = current_data().DATA_VERSION
+    if version not in _layout_cache:
+        _layout_cache[version] = build_layout()
+    return _layout_cache[version]
+
+app.layout = serve_layout
 
 # =============== Callbacks ===============
 
@@ -1524,16 +3945,14 @@ def toggle_companion_wrapper(active_tab):
     Input('province-dropdown', 'value')
 )
 def update_district(province):
-    if len(df) == 0 or 'อำเภอ' not in df.columns:
+    data = current_data()
+    if len(data.df) == 0 or 'อำเภอ' not in data.df.columns:
         return [{'label': 'ทั้งหมด', 'value': 'ALL'}]
     
-    if province == 'ALL':
-        districts = df['อำเภอ'].dropna().unique()
-    else:
-        districts = df[df['จังหวัด'] == province]['อำเภอ'].dropna().unique()
+    districts = data.DROWNING_FILTER_INDEX.distinct('district', province=province)
     
     return [{'label': 'ทั้งหมด', 'value': 'ALL'}] + \
-           [{'label': str(i), 'value': str(i)} for i in sorted(districts)]
+           [{'label': str(i), 'value': str(i)} for i in districts]
 
 @app.callback(
     Output('subdistrict-dropdown', 'options'),
@@ -1541,45 +3960,33 @@ def update_district(province):
     State('province-dropdown', 'value')
 )
 def update_subdistrict(district, province):
-    if len(df) == 0 or 'ตำบล' not in df.columns:
+    data = current_data()
+    if len(data.df) == 0 or 'ตำบล' not in data.df.columns:
         return [{'label': 'ทั้งหมด', 'value': 'ALL'}]
     
-    filtered_df = df.copy()
-    if province != 'ALL':
-        filtered_df = filtered_df[filtered_df['จังหวัด'] == province]
-    if district != 'ALL':
-        filtered_df = filtered_df[filtered_df['อำเภอ'] == district]
-    
-    subdistricts = filtered_df['ตำบล'].dropna().unique()
+    subdistricts = data.DROWNING_FILTER_INDEX.distinct('subdistrict', province=province, district=district)
     return [{'label': 'ทั้งหมด', 'value': 'ALL'}] + \
-           [{'label': str(i), 'value': str(i)} for i in sorted(subdistricts)]
+           [{'label': str(i), 'value': str(i)} for i in subdistricts]
 
 @app.callback(
     Output('dc-district-dropdown', 'options'),
     Input('dc-province-dropdown', 'value')
 )
 def update_dc_district(province):
-    if len(df_death_cert) == 0 or 'อำเภอ' not in df_death_cert.columns:
+    data = current_data()
+    if len(data.df_death_cert) == 0 or 'อำเภอ' not in data.df_death_cert.columns:
         return [{'label': 'ทั้งหมด', 'value': 'ALL'}]
     
-    if province == 'ALL':
-        districts = df_death_cert['อำเภอ'].dropna().unique()
-    else:
-        districts = df_death_cert[df_death_cert['จังหวัด'] == province]['อำเภอ'].dropna().unique()
+    districts = data.DEATH_CERT_FILTER_INDEX.distinct('district', province=province)
     
     return [{'label': 'ทั้งหมด', 'value': 'ALL'}] + \
-           [{'label': str(i), 'value': str(i)} for i in sorted(districts)]
+           [{'label': str(i), 'value': str(i)} for i in districts]
 
-# =============== Main Dashboard Update Callback ===============
+# =============== สถานะตัวกรอง (คำนวณครั้งเดียวต่อชุดตัวกรอง) ===============
+# ตัวกรองทุกตัวรวมเป็น filter-state เดียว แล้วแต่ละส่วนของหน้าจอมี callback ของตัวเอง
+# ที่ขึ้นกับ filter-state และ input ที่ใช้จริงเท่านั้น เช่น เปลี่ยนประเภท Heatmap จะคำนวณเฉพาะ Heatmap
 @app.callback(
-    [Output('choropleth-map', 'srcDoc'),
-     Output('bar-graph', 'figure'),
-     Output('statistics-output', 'children'),
-     Output('status-pie-chart', 'figure'),
-     Output('status-details', 'children'),
-     Output('frequency-histogram', 'figure'),
-     Output('heatmap-map', 'figure'),
-     Output('death-cert-map', 'srcDoc')],
+    Output('filter-state', 'data'),
     [Input('search-button', 'n_clicks'),
      Input('province-dropdown', 'value'),
      Input('district-dropdown', 'value'),
@@ -1591,67 +3998,116 @@ def update_dc_district(province):
      Input('month-dropdown', 'value'),
      Input('year-dropdown', 'value'),
      Input('age-dropdown', 'value'),
+     Input('data-tabs', 'active_tab')],
+    State('filter-state', 'data')
+)
+def update_filter_state(n_clicks, province, district, subdistrict, zone,
+                        dc_province, dc_district, dc_zone,
+                        month, year, age, active_tab, current_state):
+    state = build_filter_state(active_tab, province, district, subdistrict, zone,
+                               dc_province, dc_district, dc_zone, month, year, age)
+    
+    # ตัวกรองที่ Tab นี้ใช้ไม่เปลี่ยน (เช่น เปลี่ยน dropdown ของอีก Tab) ไม่ต้องคำนวณอะไรใหม่
+    if state == current_state:
+        return no_update
+    return state
+
+# =============== Callback สรุปผล (กราฟวงกลม, รายละเอียด, สถิติ, Histogram, กราฟแท่ง) ===============
+@app.callback(
+    [Output('bar-graph', 'figure'),
+     Output('statistics-output', 'children'),
+     Output('status-pie-chart', 'figure'),
+     Output('status-details', 'children'),
+     Output('frequency-histogram', 'figure')],
+    Input('filter-state', 'data')
+)
+def update_summary(state):
+    if not state:
+        raise PreventUpdate
+    
+    key = ('summary',) + filter_state_key(state)
+    version = current_data().DATA_VERSION
+    result = RESULT_CACHE.get(key, version)
+    if result is None:
+        result = build_summary_outputs(state['tab'], state['criteria'])
+        RESULT_CACHE.set(key, result, version)
+    
+    # None = ส่วนที่ถูกซ่อนใน Tab นี้ ไม่ต้องอัพเดท
+    return tuple(no_update if output is None else output for output in result)
+
+# =============== Callback Heatmap ===============
+@app.callback(
+    Output('heatmap-map', 'figure'),
+    [Input('filter-state', 'data'),
      Input('map-type-radio', 'value'),
-     Input('data-tabs', 'active_tab')]
+     Input('heatmap-render-radio', 'value')]
 )
-def update_dashboard(n_clicks, province, district, subdistrict, zone, 
-                     dc_province, dc_district, dc_zone,
-                     month, year, age, map_type, active_tab):
-    
-    # กรองข้อมูลตาม Tab
-    if active_tab == "death-cert-tab":
-        base_df = df_death_cert.copy() if len(df_death_cert) > 0 else pd.DataFrame()
-        filtered_df = base_df.copy()
-        
-        if len(filtered_df) > 0:
-            if dc_province != 'ALL' and 'จังหวัด' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['จังหวัด'] == dc_province]
-            if dc_district != 'ALL' and 'อำเภอ' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['อำเภอ'] == dc_district]
-            if dc_zone != 'ALL' and 'เขต' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['เขต'] == str(dc_zone).strip()]
-        
+def update_heatmap(state, map_type, render):
+    if not state:
+        raise PreventUpdate
+    
+    if state['tab'] == "death-cert-tab":
+        # Tab มรณบัตรแสดงเฉพาะอัตราการเสียชีวิต ตัวเลือกประเภท Heatmap ถูกซ่อนอยู่
+        if callback_context.triggered_id == 'map-type-radio':
+            return no_update
         map_type = 'deceased_rate'
-    else:
-        base_df = df.copy() if len(df) > 0 else pd.DataFrame()
-        filtered_df = base_df.copy()
-        
-        if len(filtered_df) > 0:
-            if province != 'ALL' and 'จังหวัด' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['จังหวัด'] == province]
-            if district != 'ALL' and 'อำเภอ' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['อำเภอ'] == district]
-            if subdistrict != 'ALL' and 'ตำบล' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['ตำบล'] == subdistrict]
-            if zone != 'ALL' and 'เขต' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['เขต'] == str(zone).strip()]
-    
-    # กรองเพิ่มเติม
-    if len(filtered_df) > 0:
-        if month != 'ALL' and 'เดือน' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['เดือน'] == month]
-        if year != 'ALL' and 'ปี' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['ปี'] == year]
-        if age != 'ALL' and 'อายุ' in filtered_df.columns:
-            if age == '<15':
-                filtered_df = filtered_df[filtered_df['อายุ'] < 15]
-            elif age == '15+':
-                filtered_df = filtered_df[filtered_df['อายุ'] >= 15]
+    
+    if render not in HEATMAP_RENDER_MODES:
+        render = 'points'
+    
+    key = ('heatmap', map_type, render) + filter_state_key(state)
+    version = current_data().DATA_VERSION
+    heatmap_fig = RESULT_CACHE.get(key, version)
+    if heatmap_fig is None:
+        cells = get_selection(state['tab'], state['criteria']).cells
+        if len(cells) == 0:
+            heatmap_fig = go.Figure()
+            heatmap_fig.add_annotation(text="ไม่มีข้อมูล", showarrow=False)
+        elif state['tab'] == "death-cert-tab":
+            heatmap_fig = create_shapefile_heatmap(cells, map_type, data_type='death_cert', render=render)
+        else:
+            heatmap_fig = create_shapefile_heatmap(cells, map_type, data_type='drowning', render=render)
+        RESULT_CACHE.set(key, heatmap_fig, version)
+    return heatmap_fig
+
+# =============== Callback แผนที่ Choropleth (โหลดผ่าน URL แทนการส่ง HTML ใน callback) ===============
+@app.callback(
+    Output('choropleth-map', 'src'),
+    Input('filter-state', 'data')
+)
+def update_choropleth_src(state):
+    if not state or state['tab'] != "drowning-tab":
+        return no_update
+    return get_map_src('drowning' if state['has_data'] else 'empty')
+
+@app.callback(
+    Output('death-cert-map', 'src'),
+    Input('filter-state', 'data')
+)
+def update_death_cert_src(state):
+    if not state or state['tab'] != "death-cert-tab":
+        return no_update
+    return get_map_src('death_cert' if state['has_data'] else 'empty')
+
+# =============== สร้างกราฟและสถิติสรุปตามชุดตัวกรอง ===============
+def build_summary_outputs(active_tab, criteria):
+    """
+    คำนวณกราฟและสถิติสรุปจากเซลล์ของ cube ที่ตรงกับตัวกรอง
+    คืนค่า (bar, stats, pie, status_details, histogram) โดยส่วนที่ซ่อนอยู่ใน Tab นี้เป็น None
+    """
+    cells = get_selection(active_tab, criteria).cells
     
     # Handle Empty Data
-    if len(filtered_df) == 0:
-        empty_map = folium.Map(location=[13.7563, 100.5018], zoom_start=6)
-        map_html = empty_map._repr_html_()
-        
+    if len(cells) == 0:
         fig = go.Figure()
         fig.add_annotation(text="ไม่มีข้อมูล", showarrow=False)
         
-        return (map_html, fig, html.Div("ไม่มีข้อมูล", className="text-center text-danger"),
-                fig, html.Div("ไม่มีข้อมูล"), fig, fig, map_html)
+        return (fig, html.Div("ไม่มีข้อมูล", className="text-center text-danger"),
+                fig, html.Div("ไม่มีข้อมูล"), fig)
     
     # สร้าง Pie Chart ตาม Tab
     if active_tab == "death-cert-tab":
-        death_rates = calculate_death_summary_rates(filtered_df)
+        death_rates = calculate_death_summary_rates(cells)
         
         pie_labels = ['1 ครั้ง', '2 ครั้ง', '3 ครั้ง', '4 ครั้ง', '≥5 ครั้ง']
         pie_values = [
@@ -1728,7 +4184,7 @@ def update_dashboard(n_clicks, province, district, subdistrict, zone,
         ])
         
     else:
-        status_rates = calculate_status_rates(filtered_df)
+        status_rates = calculate_status_rates(cells)
         
         pie_labels = ['เสียชีวิต', 'บาดเจ็บ', 'ไม่บาดเจ็บ']
         pie_values = [
@@ -1785,14 +4241,73 @@ def update_dashboard(n_clicks, province, district, subdistrict, zone,
             ], style={'padding': '10px'})
         ])
     
-    # สร้าง Heatmap Map
+    
     if active_tab == "death-cert-tab":
-        heatmap_fig = create_shapefile_heatmap(filtered_df, map_type, data_type='death_cert')
+        # กราฟแท่งและ Histogram อยู่ในส่วนของ Tab การจมน้ำซึ่งถูกซ่อนอยู่ จึงไม่ต้องคำนวณ
+        bar_fig = None
+        hist_fig = None
+    else:
+        hist_fig = create_frequency_histogram(cells)
+        bar_fig = create_province_bar_chart(cells)
+    
+    # สร้างสถิติ
+    total_count = int(cells['จำนวน'].sum())
+    
+    if 'ช่วงอายุ' in cells.columns:
+        age_counts = cells.groupby('ช่วงอายุ', observed=True)['จำนวน'].sum()
+        age_under_15 = int(age_counts.get('<15', 0))
+        age_15_plus = int(age_counts.get('15+', 0))
+        aged_count = cells['จำนวนที่มีอายุ'].sum()
+        avg_age = cells['ผลรวมอายุ'].sum() / aged_count if aged_count > 0 else np.nan
+    else:
+        age_under_15 = 0
+        age_15_plus = 0
+        avg_age = 0
+    
+    if 'ระดับสรุป' in cells.columns:
+        range_low = int(cells.loc[cells['ระดับสรุป'] == 1, 'จำนวน'].sum())
+        range_high = int(cells['จำนวนสรุปมากกว่า1'].sum())
     else:
-        heatmap_fig = create_shapefile_heatmap(filtered_df, map_type, data_type='drowning')
+        if 'สถานะ' in cells.columns:
+            death_counts = cells[cells['สถานะ'] == 'เสียชีวิต'].groupby('จังหวัด', observed=True)['จำนวน'].sum()
+            range_low = (death_counts == 1).sum()
+            range_high = (death_counts > 1).sum()
+        else:
+            range_low = 0
+            range_high = 0
+    
+    stats = dbc.Row([
+        dbc.Col([dbc.Card([dbc.CardBody([
+            html.H6("จำนวนเหตุการณ์", className="text-center", style={'fontSize': '12px'}),
+            html.H3(f"{total_count:,}", className="text-center text-primary")
+        ])])], width=2),
+        dbc.Col([dbc.Card([dbc.CardBody([
+            html.H6("อายุต่ำกว่า 15 ปี", className="text-center", style={'fontSize': '12px'}),
+            html.H3(f"{age_under_15:,}", className="text-center text-info")
+        ])])], width=2),
+        dbc.Col([dbc.Card([dbc.CardBody([
+            html.H6("อายุ 15+ ปี", className="text-center", style={'fontSize': '12px'}),
+            html.H3(f"{age_15_plus:,}", className="text-center", style={'color': '#6f42c1'})
+        ])])], width=2),
+        dbc.Col([dbc.Card([dbc.CardBody([
+            html.H6("เสียชีวิต (=1)", className="text-center", style={'fontSize': '12px'}),
+            html.H3(f"{range_low:,}", className="text-center text-success")
+        ])])], width=2),
+        dbc.Col([dbc.Card([dbc.CardBody([
+            html.H6("เสียชีวิต (>1)", className="text-center", style={'fontSize': '12px'}),
+            html.H3(f"{range_high:,}", className="text-center text-danger")
+        ])])], width=2),
+        dbc.Col([dbc.Card([dbc.CardBody([
+            html.H6("อายุเฉลี่ย", className="text-center", style={'fontSize': '12px'}),
+            html.H3(f"{avg_age:.1f}" if avg_age > 0 else "N/A", className="text-center text-warning")
+        ])])], width=2),
+    ])
     
-    # สร้าง Histogram ความถี่
-    freq_data = calculate_frequency_by_year(filtered_df)
+    return bar_fig, stats, pie_fig, status_details, hist_fig
+
+# =============== Histogram ความถี่รายปี ===============
+def create_frequency_histogram(cells):
+    freq_data = calculate_frequency_by_year(cells)
     
     if freq_data and len(freq_data['years']) > 0:
         hist_fig = go.Figure()
@@ -1842,17 +4357,19 @@ def update_dashboard(n_clicks, province, district, subdistrict, zone,
         hist_fig = go.Figure()
         hist_fig.add_annotation(text="ไม่มีข้อมูลความถี่", showarrow=False)
     
-    # สร้างแผนที่ Choropleth จาก Shapefile โดยตรง
-    choropleth_html = create_choropleth_from_shapefile('drowning')
-    death_cert_html = create_choropleth_from_shapefile('death_cert')
+    return hist_fig
+
+# =============== กราฟแท่ง 30 จังหวัดแรก ===============
+def create_province_bar_chart(cells):
+    import plotly.express as px
     
-    # สร้างกราฟแท่ง
-    if 'จังหวัด' in filtered_df.columns and len(filtered_df) > 0:
-        if 'สรุป' in filtered_df.columns:
-            province_summary = filtered_df.groupby('จังหวัด')['สรุป'].sum().reset_index()
+    if 'จังหวัด' in cells.columns and len(cells) > 0:
+        if 'สรุป' in cells.columns:
+            province_summary = cells.groupby('จังหวัด', observed=True)['สรุป'].sum().reset_index()
             province_summary.columns = ['จังหวัด', 'จำนวนรวม']
         else:
-            province_summary = filtered_df.groupby('จังหวัด').size().reset_index(name='จำนวนรวม')
+            province_summary = cells.groupby('จังหวัด', observed=True)['จำนวน'].sum().reset_index(name='จำนวนรวม')
+        province_summary['จังหวัด'] = province_summary['จังหวัด'].astype(str)
         
         province_summary['กลุ่ม'] = province_summary['จำนวนรวม'].apply(
             lambda x: 'เสียชีวิต (=1)' if x == 1 else 'เสียชีวิต (>1)'
@@ -1878,107 +4395,41 @@ def update_dashboard(n_clicks, province, district, subdistrict, zone,
         bar_fig = go.Figure()
         bar_fig.add_annotation(text="ไม่มีข้อมูล", showarrow=False)
     
-    # สร้างสถิติ
-    age_under_15 = len(filtered_df[filtered_df['อายุ'] < 15]) if 'อายุ' in filtered_df.columns else 0
-    age_15_plus = len(filtered_df[filtered_df['อายุ'] >= 15]) if 'อายุ' in filtered_df.columns else 0
-    avg_age = filtered_df['อายุ'].mean() if 'อายุ' in filtered_df.columns and len(filtered_df) > 0 else 0
-    
-    if 'สรุป' in filtered_df.columns:
-        range_low = len(filtered_df[filtered_df['สรุป'] == 1])
-        range_high = len(filtered_df[filtered_df['สรุป'] > 1])
-    else:
-        if 'สถานะ' in filtered_df.columns:
-            death_counts = filtered_df[filtered_df['สถานะ'] == 'เสียชีวิต'].groupby('จังหวัด').size()
-            range_low = (death_counts == 1).sum()
-            range_high = (death_counts > 1).sum()
-        else:
-            range_low = 0
-            range_high = 0
-    
-    stats = dbc.Row([
-        dbc.Col([dbc.Card([dbc.CardBody([
-            html.H6("จำนวนเหตุการณ์", className="text-center", style={'fontSize': '12px'}),
-            html.H3(f"{len(filtered_df):,}", className="text-center text-primary")
-        ])])], width=2),
-        dbc.Col([dbc.Card([dbc.CardBody([
-            html.H6("อายุต่ำกว่า 15 ปี", className="text-center", style={'fontSize': '12px'}),
-            html.H3(f"{age_under_15:,}", className="text-center text-info")
-        ])])], width=2),
-        dbc.Col([dbc.Card([dbc.CardBody([
-            html.H6("อายุ 15+ ปี", className="text-center", style={'fontSize': '12px'}),
-            html.H3(f"{age_15_plus:,}", className="text-center", style={'color': '#6f42c1'})
-        ])])], width=2),
-        dbc.Col([dbc.Card([dbc.CardBody([
-            html.H6("เสียชีวิต (=1)", className="text-center", style={'fontSize': '12px'}),
-            html.H3(f"{range_low:,}", className="text-center text-success")
-        ])])], width=2),
-        dbc.Col([dbc.Card([dbc.CardBody([
-            html.H6("เสียชีวิต (>1)", className="text-center", style={'fontSize': '12px'}),
-            html.H3(f"{range_high:,}", className="text-center text-danger")
-        ])])], width=2),
-        dbc.Col([dbc.Card([dbc.CardBody([
-            html.H6("อายุเฉลี่ย", className="text-center", style={'fontSize': '12px'}),
-            html.H3(f"{avg_age:.1f}" if avg_age > 0 else "N/A", className="text-center text-warning")
-        ])])], width=2),
-    ])
-    
-    return choropleth_html, bar_fig, stats, pie_fig, status_details, hist_fig, heatmap_fig, death_cert_html
+    return bar_fig
 
 # =============== Callback วิเคราะห์การอยู่กับใคร ===============
 @app.callback(
     [Output('companion-age-chart', 'figure'),
      Output('companion-risk-map', 'figure'),
      Output('companion-summary-table', 'children')],
-    [Input('search-button', 'n_clicks'),
-     Input('companion-filter-radio', 'value'),
-     Input('province-dropdown', 'value'),
-     Input('district-dropdown', 'value'),
-     Input('subdistrict-dropdown', 'value'),
-     Input('zone-dropdown', 'value'),
-     Input('month-dropdown', 'value'),
-     Input('year-dropdown', 'value'),
-     Input('age-dropdown', 'value'),
-     Input('data-tabs', 'active_tab')]
+    [Input('filter-state', 'data'),
+     Input('companion-filter-radio', 'value')]
 )
-def update_companion_analysis(n_clicks, companion_filter, province, district, 
-                              subdistrict, zone, month, year, age, active_tab):
+def update_companion_analysis(state, companion_filter):
     
     print("="*50)
     print(f"DEBUG Companion Analysis Called")
-    print(f"Active Tab: {active_tab}")
+    print(f"Active Tab: {state['tab'] if state else None}")
     print(f"Companion Filter: {companion_filter}")
     print("="*50)
     
-    # แสดงเฉพาะใน tab การจมน้ำ
-    if active_tab != "drowning-tab":
-        print("DEBUG: ไม่ใช่ drowning tab, ส่ง empty figure")
-        empty_fig = go.Figure()
-        empty_fig.add_annotation(text="ข้อมูลนี้แสดงเฉพาะแท็บข้อมูลการจมน้ำ", showarrow=False)
-        return empty_fig, empty_fig, html.Div()
-    
-    # กรองข้อมูล (ใช้โค้ดเดียวกับ update_dashboard)
-    filtered_df = df.copy()
-    
-    print(f"DEBUG: จำนวนแถวใน df ทั้งหมด: {len(df)}")
-    print(f"DEBUG: คอลัมน์ที่มี: {df.columns.tolist()}")
-    
-    if province != 'ALL':
-        filtered_df = filtered_df[filtered_df['จังหวัด'] == province]
-    if district != 'ALL':
-        filtered_df = filtered_df[filtered_df['อำเภอ'] == district]
-    if subdistrict != 'ALL':
-        filtered_df = filtered_df[filtered_df['ตำบล'] == subdistrict]
-    if zone != 'ALL':
-        filtered_df = filtered_df[filtered_df['เขต'] == str(zone).strip()]
-    if month != 'ALL':
-        filtered_df = filtered_df[filtered_df['เดือน'] == month]
-    if year != 'ALL':
-        filtered_df = filtered_df[filtered_df['ปี'] == year]
-    if age != 'ALL':
-        if age == '<15':
-            filtered_df = filtered_df[filtered_df['อายุ'] < 15]
-        elif age == '15+':
-            filtered_df = filtered_df[filtered_df['อายุ'] >= 15]
+    # แสดงเฉพาะใน tab การจมน้ำ (Tab อื่นซ่อนส่วนนี้ไว้ จึงไม่ต้องอัพเดท)
+    if not state or state['tab'] != "drowning-tab":
+        print("DEBUG: ไม่ใช่ drowning tab, ไม่อัพเดท")
+        return no_update, no_update, no_update
+    
+    key = ('companion', companion_filter) + filter_state_key(state)
+    version = current_data().DATA_VERSION
+    result = RESULT_CACHE.get(key, version)
+    if result is None:
+        # ใช้แถวจาก Selection ชุดเดียวกับส่วนสรุปผล ไม่ต้องกรองข้อมูลดิบซ้ำ
+        filtered_df = get_selection(state['tab'], state['criteria']).frame
+        result = build_companion_outputs(filtered_df, companion_filter)
+        RESULT_CACHE.set(key, result, version)
+    return result
+
+def build_companion_outputs(filtered_df, companion_filter):
+    """สร้างกราฟ, แผนที่ความเสี่ยง และตารางสรุปของส่วนวิเคราะห์การอยู่กับใคร"""
     
     # วิเคราะห์ข้อมูล
     print(f"DEBUG: จำนวนแถวที่จะส่งไปวิเคราะห์: {len(filtered_df)}")
@@ -1999,28 +4450,11 @@ def update_companion_analysis(n_clicks, companion_filter, province, district,
         return empty_fig, empty_fig, html.Div("ไม่มีข้อมูลการเสียชีวิต")
     
     # 1. สร้างกราฟ Stacked Bar Chart
-    death_df = filtered_df[filtered_df['สถานะ'] == 'เสียชีวิต'].copy()
+    death_df = filtered_df[filtered_df['สถานะ'] == 'เสียชีวิต']
     if 'ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร' not in death_df.columns:
         empty_fig = go.Figure()
         empty_fig.add_annotation(text="ไม่พบข้อมูลผู้อยู่ด้วย", showarrow=False)
         return empty_fig, empty_fig, html.Div("ไม่พบข้อมูลผู้อยู่ด้วย")
-    def categorize_companion(value):
-        if pd.isna(value):
-            return 'ไม่ระบุ'
-        value_str = str(value).strip()
-        if 'ผู้ปกครอง/ผู้ดูแลเด็ก' in value_str:
-            return 'ผู้ปกครอง'
-        elif value_str == 'เพื่อน':
-            return 'เพื่อน'
-        elif value_str == 'อยู่คนเดียว':
-            return 'อยู่เพียงลำพัง'
-        else:
-            return 'อื่นๆ'
-        
-    death_df['กลุ่มผู้อยู่ด้วย'] = death_df['ขณะเกิดเหตุ (ณ จุดเกิดเหตุ) คนที่จมน้ำอยู่กับใคร'].apply(categorize_companion)
-    death_df['กลุ่มอายุ'] = death_df['อายุ'].apply(
-        lambda x: 'ต่ำกว่า 15 ปี' if pd.notna(x) and x < 15 else '15 ปีขึ้นไป'
-    )
     
     chart_data = death_df.groupby(['กลุ่มผู้อยู่ด้วย', 'กลุ่มอายุ']).size().reset_index(name='count')
     chart_data['percentage'] = (chart_data['count'] * 100 / total_death).round(2)
@@ -2074,13 +4508,13 @@ def update_companion_analysis(n_clicks, companion_filter, province, district,
         map_fig.add_annotation(text="ไม่มีข้อมูลสำหรับกลุ่มที่เลือก", showarrow=False)
     else:
         # นับจำนวนตามจังหวัด
-        province_counts = map_df.groupby('จังหวัด').size().reset_index(name='count')
+        province_counts = map_df.groupby('จังหวัด', observed=True).size().reset_index(name='count')
         province_counts['lat'] = province_counts['จังหวัด'].map(
             lambda x: PROVINCE_COORDS.get(x, [None, None])[1]
-        )
+        ).astype(float)
         province_counts['lon'] = province_counts['จังหวัด'].map(
             lambda x: PROVINCE_COORDS.get(x, [None, None])[0]
-        )
+        ).astype(float)
         province_counts = province_counts.dropna(subset=['lat', 'lon'])
         
         map_fig = go.Figure()
@@ -2169,256 +4603,447 @@ def update_companion_analysis(n_clicks, companion_filter, province, district,
     
     return bar_fig, map_fig, summary_table
 
-# =============== ฟังก์ชันสำหรับ Export Folium Map เป็น PNG ===============
-def export_folium_map(html_content, filename):
-    """แปลง Folium HTML เป็น PNG ด้วย Selenium และบันทึกที่ D:\Flooding"""
-    
-    # กำหนดโฟลเดอร์ที่จะบันทึก
-    export_folder = r"D:\Flooding"
-    
-    # สร้างโฟลเดอร์ถ้ายังไม่มี
-    if not os.path.exists(export_folder):
-        os.makedirs(export_folder)
-        print(f"สร้างโฟลเดอร์: {export_folder}")
-    
-    # ตั้งค่า Chrome Options
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')  # ไม่เปิดหน้าต่าง browser
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--window-size=1920,1080')  # ขนาดหน้าจอ
-    chrome_options.add_argument('--disable-gpu')
-    
-    # ตั้งค่าให้ดาวน์โหลดไปที่โฟลเดอร์ที่กำหนด
-    prefs = {
-        "download.default_directory": export_folder,
-        "download.prompt_for_download": False,
-    }
-    chrome_options.add_experimental_option("prefs", prefs)
+# =============== Pool ของ Chrome (headless) สำหรับ Export แผนที่ Folium ===============
+# เปิด Chrome ค้างไว้ใช้ซ้ำแทนการเปิด/ปิดทุกครั้งที่กด Export (เปิดครั้งแรกเมื่อมีงาน แล้วเก็บไว้)
+# จำนวนงาน export พร้อมกันถูกจำกัดด้วย semaphore งานที่เกินรอคิวจนกว่าจะมี browser ว่าง
+# แทน time.sleep(5) ด้วยการรอสัญญาณว่าแผนที่พร้อม (Leaflet โหลดเสร็จและ tile โหลดครบ)
+EXPORT_BROWSER_POOL_SIZE = int(os.environ.get('EXPORT_BROWSER_POOL_SIZE', '2'))
+EXPORT_QUEUE_TIMEOUT = float(os.environ.get('EXPORT_QUEUE_TIMEOUT', '120'))  # วินาทีที่รอคิวได้
+EXPORT_READY_TIMEOUT = float(os.environ.get('EXPORT_READY_TIMEOUT', '15'))  # วินาทีที่รอแผนที่พร้อม
+EXPORT_SETTLE_SECONDS = 0.3  # รอ animation fade-in ของ tile หลังโหลดครบ
+
+MAP_READY_SCRIPT = """
+if (document.readyState !== 'complete' || typeof L === 'undefined') { return false; }
+var tiles = document.querySelectorAll('img.leaflet-tile');
+for (var i = 0; i < tiles.length; i++) {
+    if (!tiles[i].complete) { return false; }
+}
+return true;
+"""
+
+class BrowserPool:
+    """Chrome แบบ headless ที่เปิดค้างไว้ใช้ซ้ำ จำกัดจำนวนที่ใช้งานพร้อมกัน"""
+    
+    def __init__(self, size):
+        self.size = max(1, size)
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+        self._lock = threading.Lock()
+    
+    def _create_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        
+        chrome_options = Options()
+        chrome_options.add_argument('--headless')  # ไม่เปิดหน้าต่าง browser
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--window-size=1920,1080')  # ขนาดหน้าจอ
+        chrome_options.add_argument('--disable-gpu')
+        return webdriver.Chrome(options=chrome_options)
+    
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"ปิด Chrome ไม่สำเร็จ: {e}")
+    
+    def _take_idle(self):
+        """browser ว่างที่ยังใช้งานได้ (None ถ้าไม่มี)"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                driver = self._idle.pop()
+            try:
+                driver.current_url  # ตรวจว่า Chrome ยังไม่ตาย
+                return driver
+            except Exception:
+                self._quit(driver)
+    
+    @contextmanager
+    def browser(self):
+        """ยืม browser จาก pool (รอคิวถ้าใช้งานครบแล้ว) browser ที่เกิด error จะถูกปิดทิ้ง"""
+        if not self._slots.acquire(timeout=EXPORT_QUEUE_TIMEOUT):
+            raise RuntimeError("คิว Export เต็ม กรุณาลองใหม่อีกครั้ง")
+        driver = None
+        healthy = False
+        try:
+            driver = self._take_idle() or self._create_driver()
+            yield driver
+            healthy = True
+        finally:
+            if driver is not None:
+                if healthy:
+                    with self._lock:
+                        self._idle.append(driver)
+                else:
+                    self._quit(driver)
+            self._slots.release()
+    
+    def close(self):
+        with self._lock:
+            drivers, self._idle = self._idle, []
+        for driver in drivers:
+            self._quit(driver)
+
+EXPORT_BROWSER_POOL = BrowserPool(EXPORT_BROWSER_POOL_SIZE)
+atexit.register(EXPORT_BROWSER_POOL.close)
+
+def render_html_to_png(html_content):
+    """เปิด HTML ใน browser จาก pool รอจนแผนที่พร้อมแล้ว screenshot"""
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
     
+    fd, temp_path = tempfile.mkstemp(prefix='export_map_', suffix='.html')
     try:
-        # สร้าง WebDriver
-        driver = webdriver.Chrome(options=chrome_options)
-        
-        # บันทึก HTML ชั่วคราวที่โฟลเดอร์ D:\Flooding
-        temp_html = f"temp_map_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-        temp_path = os.path.join(export_folder, temp_html)
-        
-        with open(temp_path, 'w', encoding='utf-8') as f:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             f.write(html_content)
         
-        print(f"บันทึก HTML ชั่วคราวที่: {temp_path}")
-        
-        # เปิด HTML
-        driver.get(f"file:///{temp_path}")
-        time.sleep(5)  # รอให้แผนที่โหลดเสร็จ
-        
-        # Screenshot
-        png_data = driver.get_screenshot_as_png()
-        
-        # บันทึก PNG ที่ D:\Flooding
-        png_path = os.path.join(export_folder, filename)
-        with open(png_path, 'wb') as f:
-            f.write(png_data)
-        
-        print(f"✅ บันทึก PNG สำเร็จที่: {png_path}")
-        
-        # ปิด browser และลบไฟล์ HTML ชั่วคราว
-        driver.quit()
-        
+        with EXPORT_BROWSER_POOL.browser() as driver:
+            start = time.perf_counter()
+            driver.get(Path(temp_path).as_uri())
+            try:
+                WebDriverWait(driver, EXPORT_READY_TIMEOUT, poll_frequency=0.1).until(
+                    lambda d: d.execute_script(MAP_READY_SCRIPT))
+            except TimeoutException:
+                print(f"แผนที่ยังโหลดไม่ครบใน {EXPORT_READY_TIMEOUT:.0f} วินาที - บันทึกภาพเท่าที่โหลดได้")
+            time.sleep(EXPORT_SETTLE_SECONDS)
+            png_data = driver.get_screenshot_as_png()
+            print(f"Render แผนที่ใช้เวลา {time.perf_counter() - start:.2f} วินาที")
+            return png_data
+    finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
-            print(f"ลบไฟล์ชั่วคราว: {temp_html}")
-        
-        return png_data
-        
+
+# =============== ฟังก์ชันสำหรับ Export Folium Map เป็น PNG ===============
+def export_folium_map(html_content):
+    """แปลง Folium HTML เป็น PNG ด้วย Chrome จาก pool"""
+    try:
+        return render_html_to_png(html_content)
     except Exception as e:
         print(f"❌ Error in export_folium_map: {e}")
         import traceback
         traceback.print_exc()
-        
-        if 'driver' in locals():
-            driver.quit()
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
         raise
 
-# =============== Callback สำหรับ Export Heatmap (Plotly) ===============
-@app.callback(
-    Output('download-heatmap', 'data'),
-    Input('export-heatmap-btn', 'n_clicks'),
-    State('heatmap-map', 'figure'),
-    prevent_initial_call=True
-)
-def export_heatmap(n_clicks, figure):
-    """Export Heatmap เป็น PNG และบันทึกที่ D:\Flooding"""
-    if n_clicks and figure:
+# =============== ที่เก็บไฟล์ Export ===============
+# ไฟล์ที่ Export ส่งให้ browser ผ่าน dcc.Download อยู่แล้ว การเก็บสำเนาฝั่ง server จึงเลือกได้ตาม EXPORT_SINK
+# - 'none' (ค่าเริ่มต้น): ไม่เก็บสำเนา
+# - 'local': เขียนไฟล์ตามชื่อไฟล์ลง EXPORT_DIR
+# - 'cas': เก็บตาม sha256 ของเนื้อไฟล์ (ไฟล์ซ้ำเก็บครั้งเดียว) พร้อม key ของงาน → ไฟล์
+#   การ Export ที่ได้ภาพเดิม (figure/แผนที่เดียวกัน) จึงดึงจากที่เก็บโดยไม่ต้อง render ใหม่
+EXPORT_SINK_MODES = ('none', 'local', 'cas')
+EXPORT_SINK_MODE = os.environ.get('EXPORT_SINK', 'none')
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(DATA_DIR, 'exports'))
+EXPORT_RENDER_VERSION = 1  # เพิ่มเลขนี้เมื่อแก้ไขวิธี render เพื่อไม่ให้ใช้ไฟล์เดิมใน cas
+
+class ExportSink:
+    """ที่เก็บสำเนาไฟล์ Export ตามโหมด none / local / cas"""
+    
+    def __init__(self, mode, directory):
+        if mode not in EXPORT_SINK_MODES:
+            print(f"ไม่รู้จัก EXPORT_SINK '{mode}' - ไม่เก็บสำเนาไฟล์ Export")
+            mode = 'none'
+        self.mode = mode
+        self.directory = directory
+    
+    def _ref_path(self, key):
+        return os.path.join(self.directory, 'refs', f"{key}.json")
+    
+    def _object_path(self, digest, ext):
+        return os.path.join(self.directory, 'objects', digest[:2], f"{digest}{ext}")
+    
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def lookup(self, key):
+        """ไฟล์ที่เคย Export ด้วย key นี้ (เฉพาะโหมด cas, None ถ้าไม่มี)"""
+        if self.mode != 'cas' or not key:
+            return None
         try:
-            # กำหนดโฟลเดอร์
-            export_folder = r"D:\Flooding"
-            if not os.path.exists(export_folder):
-                os.makedirs(export_folder)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"heatmap_export_{timestamp}.png"
-            filepath = os.path.join(export_folder, filename)
-            
-            # แปลง Figure เป็น PNG
-            fig = go.Figure(figure)
-            img_bytes = pio.to_image(
-                fig, 
-                format='png', 
-                width=1400, 
-                height=800, 
-                scale=2  # ความละเอียดสูง
-            )
-            
-            # บันทึกที่ D:\Flooding
-            with open(filepath, 'wb') as f:
-                f.write(img_bytes)
-            
-            print(f"✅ บันทึก Heatmap สำเร็จที่: {filepath}")
-            
-            # ส่งไฟล์ให้ดาวน์โหลดด้วย (optional)
-            return dcc.send_bytes(img_bytes, filename)
-            
-        except Exception as e:
-            print(f"❌ Error exporting heatmap: {e}")
-            import traceback
-            traceback.print_exc()
+            with open(self._ref_path(key), 'r', encoding='utf-8') as f:
+                ref = json.load(f)
+            with open(self._object_path(ref['sha256'], ref['ext']), 'rb') as f:
+                return f.read()
+        except (OSError, ValueError, KeyError):
             return None
-    return None
-
-# =============== Callback สำหรับ Export แผนที่การจมน้ำ (Folium) ===============
-@app.callback(
-    Output('download-choropleth', 'data'),
-    Input('export-choropleth-btn', 'n_clicks'),
-    State('choropleth-map', 'srcDoc'),
-    prevent_initial_call=True
-)
-def export_choropleth(n_clicks, html_content):
-    """Export แผนที่การจมน้ำเป็น PNG และบันทึกที่ D:\Flooding"""
-    if n_clicks and html_content:
+    
+    def store(self, key, data, filename):
+        if self.mode == 'none':
+            return
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"map_drowning_{timestamp}.png"
+            if self.mode == 'local':
+                path = os.path.join(self.directory, filename)
+                self._write_atomic(path, data)
+                print(f"✅ บันทึก {filename} ที่: {path}")
+                return
             
-            # แปลง HTML เป็น PNG และบันทึกที่ D:\Flooding
-            png_data = export_folium_map(html_content, filename)
-            
-            print(f"✅ Export แผนที่การจมน้ำสำเร็จ")
-            
-            # ส่งไฟล์ให้ดาวน์โหลดด้วย (optional)
-            return dcc.send_bytes(png_data, filename)
-            
-        except Exception as e:
-            print(f"❌ Error exporting choropleth: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
-    return None
+            digest = hashlib.sha256(data).hexdigest()
+            ext = os.path.splitext(filename)[1]
+            object_path = self._object_path(digest, ext)
+            if not os.path.exists(object_path):
+                self._write_atomic(object_path, data)
+            if key:
+                ref = {'sha256': digest, 'ext': ext, 'filename': filename}
+                self._write_atomic(self._ref_path(key), json.dumps(ref, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            print(f"ไม่สามารถเก็บไฟล์ Export {filename}: {e}")
 
-# =============== Callback สำหรับ Export แผนที่มรณบัตร (Folium) ===============
-@app.callback(
-    Output('download-death-cert', 'data'),
-    Input('export-death-cert-btn', 'n_clicks'),
-    State('death-cert-map', 'srcDoc'),
-    prevent_initial_call=True
-)
-def export_death_cert_map(n_clicks, html_content):
-    """Export แผนที่มรณบัตรเป็น PNG และบันทึกที่ D:\Flooding"""
-    if n_clicks and html_content:
+EXPORT_SINK = ExportSink(EXPORT_SINK_MODE, EXPORT_DIR)
+
+def export_key(kind, source, *options):
+    """key ของงาน Export จากชนิดงาน ข้อมูลต้นทาง (figure หรือ URL แผนที่) และขนาดภาพ"""
+    raw = json.dumps([EXPORT_RENDER_VERSION, kind, source, options], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+# =============== คิวงาน Export (รันเบื้องหลัง) ===============
+# ปุ่ม Export ส่งงานเข้าคิวแล้วได้ job id กลับทันที callback จึงไม่ block worker ระหว่าง render
+# สถานะและไฟล์ของงานเก็บใน EXPORT_JOB_DIR ทุก process (gunicorn worker) จึงตอบสถานะงานของกันและกันได้
+# browser ถามสถานะด้วย dcc.Interval แล้วรับไฟล์ผ่าน dcc.Download ตัวเดียวเมื่องานเสร็จ
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '2'))
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR', os.path.join(DATA_DIR, '.export_jobs'))
+EXPORT_JOB_TTL = 3600  # วินาทีที่เก็บสถานะ/ไฟล์ของงานไว้ให้ดาวน์โหลด
+
+class ExportJobQueue:
+    """คิวงาน export ที่รันใน ThreadPoolExecutor สถานะงานเก็บเป็นไฟล์ JSON"""
+    
+    def __init__(self, job_dir, workers):
+        self.job_dir = job_dir
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='export')
+    
+    def _path(self, job_id, ext):
+        return os.path.join(self.job_dir, f"{job_id}.{ext}")
+    
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def _write_status(self, job_id, **status):
+        self._write_atomic(self._path(job_id, 'json'), json.dumps(status, ensure_ascii=False).encode('utf-8'))
+    
+    def submit(self, label, filename, render, key=None):
+        """ส่งงานเข้าคิว render() ต้องคืนค่า bytes ของไฟล์ (key ใช้หาไฟล์เดิมใน EXPORT_SINK)"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        info = {'label': label, 'filename': filename, 'created': time.time()}
+        self._write_status(job_id, state='queued', **info)
+        self.executor.submit(self._run, job_id, info, render, key)
+        return job_id
+    
+    def _run(self, job_id, info, render, key):
+        self._write_status(job_id, state='running', **info)
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"map_death_cert_{timestamp}.png"
-            
-            # แปลง HTML เป็น PNG และบันทึกที่ D:\Flooding
-            png_data = export_folium_map(html_content, filename)
-            
-            print(f"✅ Export แผนที่มรณบัตรสำเร็จ")
-            
-            # ส่งไฟล์ให้ดาวน์โหลดด้วย (optional)
-            return dcc.send_bytes(png_data, filename)
-            
+            start = time.perf_counter()
+            data = EXPORT_SINK.lookup(key)
+            if data is None:
+                data = render()
+                EXPORT_SINK.store(key, data, info['filename'])
+            self._write_atomic(self._path(job_id, 'bin'), data)
+            self._write_status(job_id, state='done', **info)
+            print(f"✅ Export {info['label']} เสร็จ ({time.perf_counter() - start:.1f} วินาที)")
         except Exception as e:
-            print(f"❌ Error exporting death cert map: {e}")
+            print(f"❌ Error exporting {info['label']}: {e}")
             import traceback
             traceback.print_exc()
+            self._write_status(job_id, state='error', error=str(e), **info)
+    
+    def status(self, job_id):
+        """สถานะงาน (None ถ้าไม่พบหรือหมดอายุ)"""
+        if not (isinstance(job_id, str) and len(job_id) == 32 and job_id.isalnum()):
+            return None
+        try:
+            with open(self._path(job_id, 'json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
             return None
-    return None
+    
+    def result(self, job_id):
+        try:
+            with open(self._path(job_id, 'bin'), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def cleanup(self):
+        """ลบไฟล์ของงานที่เก่ากว่า EXPORT_JOB_TTL"""
+        cutoff = time.time() - EXPORT_JOB_TTL
+        try:
+            for entry in os.scandir(self.job_dir):
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError as e:
+            print(f"ล้างไฟล์งาน Export ไม่สำเร็จ: {e}")
+
+EXPORT_JOBS = ExportJobQueue(EXPORT_JOB_DIR, EXPORT_WORKERS)
+
+# =============== งาน Export Heatmap (Plotly) ===============
+def export_heatmap(figure):
+    """งาน Export Heatmap เป็น PNG: คืนค่า (ชื่องาน, ชื่อไฟล์, ฟังก์ชัน render, key)"""
+    if not figure:
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"heatmap_export_{timestamp}.png"
+    
+    def render():
+        import plotly.io as pio
+        # แปลง Figure เป็น PNG ความละเอียดสูง
+        return pio.to_image(go.Figure(figure), format='png', width=1400, height=800, scale=2)
+    
+    return 'Heatmap', filename, render, export_key('heatmap', figure, 1400, 800, 2)
+
+# =============== งาน Export แผนที่การจมน้ำ (Folium) ===============
+def export_choropleth(map_src):
+    """งาน Export แผนที่การจมน้ำเป็น PNG"""
+    map_name = get_map_name_from_src(map_src) if map_src else None
+    if not map_name:
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"map_drowning_{timestamp}.png"
+    # key จากเวอร์ชันของแผนที่ที่ render จริง (URL จาก browser อาจเป็นเวอร์ชันที่ worker นี้ยังไม่มี)
+    map_html = get_map_html(map_name)
+    return ('แผนที่การจมน้ำ', filename, lambda: export_folium_map(map_html),
+            export_key('folium', get_map_src(map_name)))
 
-# =============== Callback สำหรับ Export แผนที่ Companion Risk (Plotly) ===============
+# =============== งาน Export แผนที่มรณบัตร (Folium) ===============
+def export_death_cert_map(map_src):
+    """งาน Export แผนที่มรณบัตรเป็น PNG"""
+    map_name = get_map_name_from_src(map_src) if map_src else None
+    if not map_name:
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"map_death_cert_{timestamp}.png"
+    map_html = get_map_html(map_name)
+    return ('แผนที่มรณบัตร', filename, lambda: export_folium_map(map_html),
+            export_key('folium', get_map_src(map_name)))
+
+# =============== งาน Export แผนที่ Companion Risk (Plotly) ===============
+def export_companion_map(figure):
+    """งาน Export แผนที่ความเสี่ยงเป็น PNG"""
+    if not figure:
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"companion_risk_map_{timestamp}.png"
+    
+    def render():
+        import plotly.io as pio
+        return pio.to_image(go.Figure(figure), format='png', width=1400, height=700, scale=2)
+    
+    return 'แผนที่ความเสี่ยง', filename, render, export_key('companion', figure, 1400, 700, 2)
+
+# ปุ่ม Export → ฟังก์ชันสร้างงาน
+EXPORT_BUTTONS = {
+    'export-heatmap-btn': export_heatmap,
+    'export-choropleth-btn': export_choropleth,
+    'export-death-cert-btn': export_death_cert_map,
+    'export-companion-map-btn': export_companion_map,
+}
+
+# =============== Callback ส่งงาน Export เข้าคิว ===============
 @app.callback(
-    Output('download-companion-map', 'data'),
-    Input('export-companion-map-btn', 'n_clicks'),
-    State('companion-risk-map', 'figure'),
+    [Output('export-jobs', 'data'),
+     Output('export-poll', 'disabled'),
+     Output('export-alert', 'children'),
+     Output('export-alert', 'is_open'),
+     Output('export-alert', 'color')],
+    [Input(button_id, 'n_clicks') for button_id in EXPORT_BUTTONS],
+    [State('heatmap-map', 'figure'),
+     State('choropleth-map', 'src'),
+     State('death-cert-map', 'src'),
+     State('companion-risk-map', 'figure'),
+     State('export-jobs', 'data')],
     prevent_initial_call=True
 )
-def export_companion_map(n_clicks, figure):
-    """Export แผนที่ความเสี่ยงเป็น PNG และบันทึกที่ D:\Flooding"""
-    if n_clicks and figure:
-        try:
-            # กำหนดโฟลเดอร์
-            export_folder = r"D:\Flooding"
-            if not os.path.exists(export_folder):
-                os.makedirs(export_folder)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"companion_risk_map_{timestamp}.png"
-            filepath = os.path.join(export_folder, filename)
-            
-            # แปลง Figure เป็น PNG
-            fig = go.Figure(figure)
-            img_bytes = pio.to_image(
-                fig, 
-                format='png', 
-                width=1400, 
-                height=700, 
-                scale=2
-            )
-            
-            # บันทึกที่ D:\Flooding
-            with open(filepath, 'wb') as f:
-                f.write(img_bytes)
-            
-            print(f"✅ บันทึก Companion Risk Map สำเร็จที่: {filepath}")
-            
-            # ส่งไฟล์ให้ดาวน์โหลดด้วย (optional)
-            return dcc.send_bytes(img_bytes, filename)
-            
-        except Exception as e:
-            print(f"❌ Error exporting companion map: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
-    return None
+def submit_export(n1, n2, n3, n4, heatmap_figure, choropleth_src, death_cert_src, companion_figure, jobs):
+    button_id = callback_context.triggered_id
+    if button_id not in EXPORT_BUTTONS:
+        raise PreventUpdate
+    
+    sources = {
+        'export-heatmap-btn': heatmap_figure,
+        'export-choropleth-btn': choropleth_src,
+        'export-death-cert-btn': death_cert_src,
+        'export-companion-map-btn': companion_figure,
+    }
+    job = EXPORT_BUTTONS[button_id](sources[button_id])
+    if job is None:
+        return no_update, no_update, "❌ ยังไม่มีแผนที่ให้ Export", True, 'danger'
+    
+    label, filename, render, key = job
+    job_id = EXPORT_JOBS.submit(label, filename, render, key)
+    return (jobs or []) + [job_id], False, f"⏳ กำลังสร้างไฟล์ {label}...", True, 'info'
 
+# =============== Callback ตรวจสถานะงาน Export และส่งไฟล์ให้ดาวน์โหลด ===============
 @app.callback(
-    [Output('export-alert', 'children'),
-     Output('export-alert', 'is_open')],
-    [Input('export-heatmap-btn', 'n_clicks'),
-     Input('export-choropleth-btn', 'n_clicks'),
-     Input('export-death-cert-btn', 'n_clicks'),
-     Input('export-companion-map-btn', 'n_clicks')],
+    [Output('download-export', 'data'),
+     Output('export-jobs', 'data', allow_duplicate=True),
+     Output('export-poll', 'disabled', allow_duplicate=True),
+     Output('export-alert', 'children', allow_duplicate=True),
+     Output('export-alert', 'is_open', allow_duplicate=True),
+     Output('export-alert', 'color', allow_duplicate=True)],
+    Input('export-poll', 'n_intervals'),
+    State('export-jobs', 'data'),
     prevent_initial_call=True
 )
-def show_export_alert(n1, n2, n3, n4):
-    ctx = callback_context
-    if not ctx.triggered:
-        return "", False
-    
-    button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    
-    messages = {
-        'export-heatmap-btn': '✅ บันทึก Heatmap สำเร็จที่ D:\\Flooding',
-        'export-choropleth-btn': '✅ บันทึกแผนที่การจมน้ำสำเร็จที่ D:\\Flooding',
-        'export-death-cert-btn': '✅ บันทึกแผนที่มรณบัตรสำเร็จที่ D:\\Flooding',
-        'export-companion-map-btn': '✅ บันทึกแผนที่ความเสี่ยงสำเร็จที่ D:\\Flooding'
-    }
+def poll_export_jobs(n_intervals, jobs):
+    download = message = color = no_update
+    pending = []
+    
+    for job_id in jobs or []:
+        status = EXPORT_JOBS.status(job_id)
+        if status is None:
+            continue
+        
+        if status['state'] == 'done' and download is no_update:
+            # ส่งได้ครั้งละหนึ่งไฟล์ งานที่เสร็จพร้อมกันจะส่งในรอบถัดไป
+            data = EXPORT_JOBS.result(job_id)
+            if data is not None:
+                download = dcc.send_bytes(data, status['filename'])
+                message, color = f"✅ {status['label']} พร้อมดาวน์โหลด", 'success'
+                continue
+        elif status['state'] == 'error':
+            message, color = f"❌ Export {status['label']} ไม่สำเร็จ: {status.get('error', '')}", 'danger'
+            continue
+        
+        pending.append(job_id)
     
-    message = messages.get(button_id, '✅ บันทึกสำเร็จที่ D:\\Flooding')
-    return message, True
+    is_open = no_update if message is no_update else True
+    return download, pending, not pending, message, is_open, color
+
+# =============== เตรียมข้อมูลร่วมก่อน fork (gunicorn preload_app) ===============
+def warm_shared_caches():
+    """
+    โหลดข้อมูลแล้วสร้างแคชที่ปกติสร้างตอนมีคำขอแรก (แผนที่ Choropleth, geometry ตาม zoom, STRtree, Layout)
+    เรียกใน process หลักก่อน fork แล้ว worker ทุกตัวจะใช้ข้อมูลชุดเดียวกันแบบ copy-on-write (ดู app.py)
+    """
+    ensure_data_loaded()
+    with startup_step('แผนที่ Choropleth'):
+        for name in MAP_NAMES:
+            get_map_html(name)
+    with startup_step('Geometry/STRtree ตาม zoom'):
+        for data_type in ('drowning', 'death_cert'):
+            get_spatial_index(data_type)
+            for zoom in SIMPLIFY_TOLERANCE_BY_ZOOM:
+                get_spatial_index(data_type, zoom)
+    with startup_step('Layout'):
+        _layout_cache[DASHBOARD_DATA.DATA_VERSION] = build_layout()
+
+# =============== เริ่มระบบ ===============
+STARTUP_TIMINGS['import'] = time.perf_counter() - STARTUP_STARTED
+print(f"import โมดูลใช้เวลา {STARTUP_TIMINGS['import']:.2f} วินาที (STARTUP_MODE={STARTUP_MODE})")
 
+if STARTUP_MODE == 'lazy':
+    # โหลดข้อมูลเบื้องหลัง server รับคำขอได้ทันที คำขอที่ต้องใช้ข้อมูลจะรอใน wait_for_data
+    threading.Thread(target=ensure_data_loaded, name='data-warmup', daemon=True).start()
 
 # =============== รันแอพ ===============
 if __name__ == '__main__':
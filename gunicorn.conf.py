@@ -0,0 +1,20 @@
+"""
+การตั้งค่า gunicorn (gunicorn app:server อ่านไฟล์นี้อัตโนมัติเมื่อรันจากโฟลเดอร์โปรเจกต์)
+
+preload_app = True: process หลักโหลดข้อมูลครั้งเดียวใน app.py แล้ว fork เป็น worker
+worker ใช้หน่วยความจำของข้อมูลร่วมกัน จำนวน worker จึงเพิ่มได้โดยหน่วยความจำไม่โตตามเป็นเท่าตัว
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+threads = int(os.environ.get('GUNICORN_THREADS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+# worker ที่ถูกสร้างใหม่ fork จาก process หลักที่มีข้อมูลพร้อมแล้ว การรีไซเคิล worker จึงแทบไม่มีต้นทุน
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} พร้อม (ใช้ข้อมูลร่วมจาก process หลัก)")
@@ -0,0 +1,72 @@
+"""
+นำเข้าระเบียนใหม่/ระเบียนที่แก้ไขของข้อมูลการจมน้ำจากไฟล์ CSV หรือ Excel (delta) เข้าที่เก็บข้อมูล
+
+ตัวอย่าง:
+    python ingest.py new_cases.csv
+    python ingest.py corrections_2567.xlsx more_cases.csv
+    python ingest.py --compact
+
+- ระเบียนที่ key (ค่าเริ่มต้น: คอลัมน์ ลำดับ หรือ INGEST_KEY_COLUMN) ซ้ำกับข้อมูลเดิม จะแทนที่ระเบียนเดิม
+- แต่ละไฟล์ถูกเขียนเป็นไฟล์ delta แยก แดชบอร์ดที่รันอยู่จะอัปเดตเฉพาะส่วนที่เปลี่ยนภายใน DATA_WATCH_INTERVAL วินาที
+- --compact รวม delta ทั้งหมดเข้าไฟล์หลัก (แดชบอร์ดจะโหลดข้อมูลใหม่ทั้งชุดหนึ่งครั้ง)
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+# ไม่ต้องโหลดข้อมูล/สร้าง index ตอน import (ใช้แค่ฟังก์ชันของที่เก็บข้อมูล)
+os.environ.setdefault('STARTUP_MODE', 'on-demand')
+
+import drowning_case as dc
+
+def ensure_store(quiet=True):
+    """สร้างที่เก็บข้อมูลจากไฟล์ Excel ถ้ายังไม่เคยโหลด"""
+    if dc.read_current_pointer('drowning') is not None:
+        return
+    output = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(output):
+        dc.load_drowning_data()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="นำเข้าระเบียนใหม่/ระเบียนที่แก้ไขของข้อมูลการจมน้ำ")
+    parser.add_argument('files', nargs='*', help="ไฟล์ .csv, .xls หรือ .xlsx (ใช้หัวคอลัมน์เดียวกับไฟล์ Excel หลัก)")
+    parser.add_argument('--compact', action='store_true', help="รวม delta ทั้งหมดเข้าไฟล์หลักหลังนำเข้า")
+    parser.add_argument('--verbose', action='store_true', help="แสดง log ตอนโหลดข้อมูล")
+    args = parser.parse_args(argv)
+    if not args.files and not args.compact:
+        parser.error("ระบุไฟล์ที่ต้องการนำเข้า หรือ --compact")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    ensure_store(quiet=not args.verbose)
+    
+    failed = 0
+    for path in args.files:
+        try:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                result = dc.append_delta_records(dc.read_delta_file(path, path))
+            print(f"✅ {path}: {result['rows']:,} ระเบียน (ใหม่ {result['new']:,}, แก้ไข {result['corrected']:,}, "
+                  f"ข้าม {result['skipped']:,}) → {result['file']}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {path}: {e}")
+    
+    if args.compact:
+        try:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                path = dc.compact_store('drowning')
+            print(f"✅ รวม delta → {os.path.basename(path)}" if path else "ไม่มี delta ที่ต้องรวม")
+        except Exception as e:
+            failed += 1
+            print(f"❌ compact: {e}")
+    
+    print(f"เสร็จใน {time.perf_counter() - start:.1f} วินาที")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())